@@ -0,0 +1,90 @@
+"""Headless benchmarks of the curve math, run with plain pytest outside Kit.
+
+    python -m pytest exts/siborg.create.curvedistribute/benchmarks
+
+Every benchmark is compared with its entry in baselines.json and fails when it runs slower than
+the baseline times CURVEDISTRIBUTE_BENCH_FACTOR (default 3, to absorb noisy CI machines).
+Reductions against a legacy path (see the reduction fixture) are tracked in the same file and
+fail when they drop below the baseline divided by CURVEDISTRIBUTE_RATIO_FACTOR (default 1.25).
+Pass --update-baselines to record the current timings and reductions instead.
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Import siborg.create.curvedistribute from the extension folder, no Kit needed for curvemath
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+BASELINES = Path(__file__).with_name("baselines.json")
+
+
+def pytest_addoption(parser):
+    parser.addoption("--update-baselines", action="store_true", default=False,
+                     help="Write the measured timings to baselines.json instead of checking them")
+
+
+def pytest_configure(config):
+    config._bench_results = {}
+
+
+def pytest_sessionfinish(session, exitstatus):
+    results = session.config._bench_results
+    if not results or not session.config.getoption("--update-baselines"):
+        return
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    baselines.update(results)
+    BASELINES.write_text(json.dumps(dict(sorted(baselines.items())), indent=2) + "\n")
+
+
+@pytest.fixture
+def benchmark(request):
+    """Time fn(*args) as the best of a few runs and check it against the tracked baseline."""
+    config = request.config
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    factor = float(os.environ.get("CURVEDISTRIBUTE_BENCH_FACTOR", 3.0))
+
+    def run(fn, *args, repeat=3):
+        result = fn(*args)
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn(*args)
+            best = min(best, time.perf_counter() - start)
+
+        name = request.node.name
+        config._bench_results[name] = round(best, 6)
+        baseline = baselines.get(name)
+        if baseline is not None and not config.getoption("--update-baselines"):
+            assert best <= baseline * factor, f"{name}: {best:.4f}s, baseline {baseline:.4f}s"
+        return result
+
+    return run
+
+
+@pytest.fixture
+def reduction(request):
+    """Check how many times less the current path needs than the legacy one against the tracked baseline.
+
+    Both runs happen on the same machine, so their ratio holds steadier than a timing and gets a
+    tighter factor.
+    """
+    config = request.config
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    factor = float(os.environ.get("CURVEDISTRIBUTE_RATIO_FACTOR", 1.25))
+
+    def check(legacy, current):
+        name = request.node.name
+        if current <= 0:
+            pytest.fail(f"{name}: the current path measured {current}, no reduction to compare")
+        ratio = legacy / current
+        config._bench_results[name] = round(ratio, 3)
+        baseline = baselines.get(name)
+        if baseline is not None and not config.getoption("--update-baselines"):
+            assert ratio >= baseline / factor, f"{name}: {ratio:.2f}x below the legacy path, baseline {baseline:.2f}x"
+        return ratio
+
+    return check
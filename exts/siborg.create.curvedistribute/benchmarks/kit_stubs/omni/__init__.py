@@ -0,0 +1,5 @@
+"""Bare stand-ins of the Kit modules extension.py imports at the top (omni.ext, omni.ui, omni.kit.ui).
+
+test_startup puts this folder on the path of its subprocess so the package import goes through
+extension.py as it does in Kit, without Kit. Nothing here works beyond being importable.
+"""
@@ -0,0 +1,88 @@
+"""Authoring copies on a stage, the batched Sdf.ChangeBlock path against copy by copy, headless with USD.
+
+The legacy path is the prim-by-prim loop of copy_to_points(batched=False): instances are defined
+one prim at a time by copy_to_points itself, duplicates go through omni.usd.duplicate_prim, which
+only exists inside Kit. Headless they are made the way duplicate_prim makes them, one Sdf.CopySpec
+per layer holding the source, then the translate is set through the stage, so every copy still
+sends its own change notices. The reductions in wall time are tracked in baselines.json (see the
+reduction fixture in conftest).
+
+    python -m pytest exts/siborg.create.curvedistribute/benchmarks/test_authoring.py
+"""
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pxr")
+from pxr import Gf, Sdf, Tf, Usd, UsdGeom
+
+from siborg.create.curvedistribute.core import CurveManager
+
+COPIES = [1_000, 10_000]
+SOURCES = ["/World/Cube", "/World/Sphere"]
+
+
+def make_stage():
+    stage = Usd.Stage.CreateInMemory()
+    UsdGeom.Xform.Define(stage, "/World")
+    UsdGeom.Xformable(UsdGeom.Cube.Define(stage, "/World/Cube")).AddTranslateOp()
+    UsdGeom.Xformable(UsdGeom.Sphere.Define(stage, "/World/Sphere")).AddTranslateOp()
+    return stage
+
+
+def target_points(num_copies):
+    return np.random.default_rng(0).random((num_copies, 3)) * 100
+
+
+def duplicate_copies(stage, points):
+    """Copies made one at a time the way copy_to_points(batched=False) does through omni.usd.duplicate_prim."""
+    scope_path = UsdGeom.Scope.Define(stage, "/World/Copies").GetPath()
+    for i, point in enumerate(points.tolist()):
+        src_path = Sdf.Path(SOURCES[i % len(SOURCES)])
+        dst_path = scope_path.AppendChild(f"{src_path.name}_{i}")
+        for layer in stage.GetLayerStack():
+            if layer.GetPrimAtPath(src_path):
+                Sdf.CopySpec(layer, src_path, layer, dst_path)
+        stage.GetPrimAtPath(dst_path).GetAttribute("xformOp:translate").Set(Gf.Vec3d(*point))
+
+
+def author(points, make_instance, batched):
+    """(wall time, ObjectsChanged notices, copy names) of one distribution on a new stage."""
+    stage = make_stage()
+    notices = []
+    listener = Tf.Notice.Register(Usd.Notice.ObjectsChanged, lambda notice, sender: notices.append(notice), stage)
+    start = time.perf_counter()
+    if batched or make_instance:
+        CurveManager.copy_to_points(stage, points, np.tile([1.0, 0.0, 0.0], (len(points), 1)), SOURCES, [1, 0, 0],
+                                    make_instance=make_instance, batched=batched)
+    else:
+        duplicate_copies(stage, points)
+    elapsed = time.perf_counter() - start
+    listener.Revoke()
+    names = {p.GetName() for p in stage.GetPrimAtPath("/World/Copies").GetChildren()}
+    return elapsed, len(notices), names
+
+
+@pytest.mark.parametrize("num_copies", COPIES)
+@pytest.mark.parametrize("make_instance", [False, True], ids=["duplicate", "instance"])
+def test_batched_authoring(benchmark, make_instance, num_copies):
+    points = target_points(num_copies)
+    _, num_notices, names = benchmark(author, points, make_instance, True)
+
+    # One change block, a constant number of notices whatever the count
+    assert num_notices < 32
+    assert len([n for n in names if n.rsplit("_", 1)[-1].isdigit()]) == num_copies
+
+
+@pytest.mark.parametrize("num_copies", COPIES)
+@pytest.mark.parametrize("make_instance", [False, True], ids=["duplicate", "instance"])
+def test_authoring_reduction(reduction, make_instance, num_copies):
+    # The same copies prim by prim and batched on the same machine, the best of three runs each
+    points = target_points(num_copies)
+    legacy = [author(points, make_instance, False) for _ in range(3)]
+    current = [author(points, make_instance, True) for _ in range(3)]
+
+    assert current[0][2] == legacy[0][2]
+    assert current[0][1] < legacy[0][1]
+    assert reduction(min(run[0] for run in legacy), min(run[0] for run in current)) > 1
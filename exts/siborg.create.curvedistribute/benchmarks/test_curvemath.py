@@ -0,0 +1,177 @@
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from siborg.create.curvedistribute.curvemath import CURVE, BruteForceTree, CurveIndex, CurveMath
+
+CONTROL_POINTS = [4, 100, 10_000, 100_000]
+COPIES = [10, 1_000, 100_000, 1_000_000]
+
+
+def random_walk(num_points, seed=0):
+    """A wiggly but smooth enough path of control points, spaced about one unit apart."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(size=(num_points, 3)) + [1.0, 0.0, 0.0]
+    return np.cumsum(steps, axis=0)
+
+
+def bezier_count(num_points):
+    """Closest valid cubic Bezier point count (3 * segments + 1) to num_points."""
+    return 3 * max((num_points - 1) // 3, 1) + 1
+
+
+@pytest.fixture(scope="module")
+def sampled_curve():
+    return CurveMath.curve_samples(random_walk(100), curve_type=CURVE.Bspline)
+
+
+@pytest.mark.parametrize("num_points", CONTROL_POINTS)
+@pytest.mark.parametrize("curve_type", [CURVE.Bezier, CURVE.Bspline], ids=["bezier", "bspline"])
+def test_curve_samples(benchmark, curve_type, num_points):
+    if curve_type == CURVE.Bezier:
+        num_points = bezier_count(num_points)
+    control_points = random_walk(num_points)
+    samples = benchmark(CurveMath.curve_samples, control_points, None, curve_type)
+
+    assert samples['fine_u'][0] == 0 and samples['fine_u'][-1] == 1
+    assert np.all(np.diff(samples['fine_u']) > 0)
+    assert len(samples['lengths']) == len(samples['fine_points'])
+
+
+@pytest.mark.parametrize("num_points", CONTROL_POINTS)
+def test_nurbs_samples(benchmark, num_points):
+    # Cubic NURBS with uneven knots and weights, as NurbsCurves prims from CAD come in
+    rng = np.random.default_rng(0)
+    inner = np.sort(rng.uniform(0, 10, num_points - 4))
+    spec = {'type': 'nurbs', 'order': [4],
+            'knots': np.concatenate(([0] * 4, inner, [10] * 4)),
+            'weights': rng.uniform(0.5, 2, num_points)}
+    samples = benchmark(CurveMath.curve_samples, random_walk(num_points), None, CURVE.Prim, 0,
+                        0.01, spec)
+
+    assert samples['fine_u'][0] == 0 and samples['fine_u'][-1] == 1
+    assert np.all(np.diff(samples['fine_u']) > 0)
+    # Clamped knots, the curve runs from the first to the last control point
+    np.testing.assert_allclose(samples['fine_points'][[0, -1]], random_walk(num_points)[[0, -1]], atol=1e-9)
+
+
+@pytest.mark.parametrize("num_copies", COPIES)
+def test_distribute(benchmark, sampled_curve, num_copies):
+    points, dirs, u, curve_idx = benchmark(CurveMath.distribute, sampled_curve, num_copies)
+
+    assert points.shape == (num_copies, 3)
+    np.testing.assert_allclose(np.linalg.norm(dirs, axis=1), 1)
+    # Ordered along the curve from its start to its end
+    assert u[0] == 0 and u[-1] == 1
+    assert np.all(np.diff(u) >= 0)
+
+
+@pytest.mark.parametrize("num_copies", COPIES)
+@pytest.mark.parametrize("follow_curve", [False, True], ids=["direction", "follow"])
+def test_orientations(benchmark, sampled_curve, follow_curve, num_copies):
+    _, dirs, _, curve_idx = CurveMath.distribute(sampled_curve, num_copies)
+    forward = [1, 0, 0]
+    quats = benchmark(CurveMath.orientations, dirs, forward, follow_curve, None, 0.0, curve_idx)
+
+    assert quats.shape == (num_copies, 4)
+    rotated = CurveMath.quat_rotate(quats, np.broadcast_to(forward, dirs.shape))
+    np.testing.assert_allclose(rotated, dirs, atol=1e-6)
+
+
+@pytest.mark.parametrize("num_curves", [10, 1_000])
+def test_multi_curve_distribute(benchmark, num_curves):
+    counts = np.full(num_curves, 8)
+    control_points = random_walk(counts.sum())
+
+    def run():
+        samples = CurveMath.curve_samples(control_points, counts, CURVE.Bspline)
+        return CurveMath.distribute(samples, 100, per_curve=True)
+
+    points, _, _, curve_idx = benchmark(run)
+    assert points.shape == (100 * num_curves, 3)
+    assert np.array_equal(np.bincount(curve_idx), np.full(num_curves, 100))
+
+
+@pytest.mark.parametrize("num_copies", COPIES)
+def test_variations(benchmark, sampled_curve, num_copies):
+    _, dirs, _, _ = CurveMath.distribute(sampled_curve, num_copies)
+    variation = {'seed': 1, 'weights': [2, 1, 1], 'jitter_along': 0.1, 'jitter_across': 0.2,
+                 'scale_min': (0.5, 0.5, 0.5), 'scale_max': (1.5, 1.5, 1.5), 'roll': 45}
+    varied = benchmark(CurveMath.variations, variation, np.arange(num_copies), dirs, 3)
+
+    assert varied['prototypes'].shape == (num_copies,) and varied['offsets'].shape == (num_copies, 3)
+    # A later range of copies gets the values those copies got in the whole batch
+    tail = CurveMath.variations(variation, np.arange(num_copies // 2, num_copies), dirs[num_copies // 2:], 3)
+    np.testing.assert_array_equal(tail['scales'], varied['scales'][num_copies // 2:])
+
+
+@pytest.mark.parametrize("num_curves", [10, 1_000])
+def test_packed_lengths(benchmark, num_curves):
+    # Crossing wiggly curves, copies get culled where the curves meet
+    rng = np.random.default_rng(0)
+    control_points = random_walk(8 * num_curves).reshape(num_curves, 8, 3)
+    control_points += rng.uniform(0, 20, (num_curves, 1, 3)) - control_points[:, :1]
+    samples = CurveMath.curve_samples(control_points.reshape(-1, 3), np.full(num_curves, 8), CURVE.Bspline)
+    lengths, curve_idx = benchmark(CurveMath.packed_lengths, samples, 0.3)
+
+    points, _, _, _ = CurveMath.distribute(samples, 0, targets=(lengths, curve_idx))
+    i, _ = CurveMath.overlap_pairs(points, 0.15)
+    assert len(points) > 10 * num_curves and len(i) == 0
+
+
+@pytest.mark.parametrize("num_queries", [10, 1_000, 100_000])
+def test_closest_points(benchmark, sampled_curve, num_queries):
+    # Props scattered around the curve, as when snapping hand-placed copies back onto it
+    rng = np.random.default_rng(0)
+    on_curve, _, u, _ = CurveMath.distribute(sampled_curve, num_queries)
+    queries = on_curve + rng.normal(scale=0.2, size=on_curve.shape)
+    index = CurveIndex(sampled_curve)
+    closest_u, lengths, points, tangents, distances, _ = benchmark(index.query, queries)
+
+    np.testing.assert_allclose(np.linalg.norm(points - queries, axis=1), distances)
+    np.testing.assert_allclose(points, sampled_curve['curve'](closest_u), atol=1e-9)
+    np.testing.assert_allclose(np.linalg.norm(tangents, axis=1), 1)
+    # Never farther than the point the query was scattered from
+    assert np.all(distances <= np.linalg.norm(queries - on_curve, axis=1) + 1e-9)
+    assert np.all((lengths >= 0) & (lengths <= sampled_curve['lengths'][-1] + 1e-9))
+
+
+def test_closest_points_without_scipy(monkeypatch, sampled_curve):
+    # Without SciPy the pieces are searched by brute force, with the same answers
+    rng = np.random.default_rng(1)
+    queries = CurveMath.distribute(sampled_curve, 500)[0] + rng.normal(scale=2.0, size=(500, 3))
+    expected = CurveIndex(sampled_curve).query(queries)
+    monkeypatch.setitem(sys.modules, "scipy.spatial", None)
+    index = CurveIndex(sampled_curve)
+    assert isinstance(index.tree, BruteForceTree)
+    for value, reference in zip(index.query(queries), expected):
+        np.testing.assert_allclose(value, reference, atol=1e-9)
+
+
+def chunked_peak_memory(samples, num_copies):
+    """Peak bytes allocated while generating a follow-curve distribution chunk by chunk."""
+    tracemalloc.start()
+    try:
+        for _ in CurveMath.distribution_chunks(samples, num_copies, [1, 0, 0], use_orient=True, follow_curve=True):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_distribution_chunks_memory(sampled_curve):
+    # Memory is bounded by the chunk size, not by the number of copies
+    small = chunked_peak_memory(sampled_curve, 200_000)
+    large = chunked_peak_memory(sampled_curve, 1_000_000)
+    assert large < 1.25 * small
+    assert large < 128 * 1024 * 1024
+
+
+def test_distribution_chunks(benchmark, sampled_curve):
+    def run():
+        return sum(len(chunk[1]) for chunk in CurveMath.distribution_chunks(
+            sampled_curve, 1_000_000, [1, 0, 0], use_orient=True, follow_curve=True))
+
+    assert benchmark(run) == 1_000_000
@@ -0,0 +1,119 @@
+"""Peak memory and allocations of reading curves and authoring a million copies, headless with USD.
+
+Every measurement runs in a fresh interpreter, so its peak RSS is its own. Allocations are
+counted as minor page faults: glibc is made to map every block above 64 KB on its own (a fixed
+MALLOC_MMAP_THRESHOLD_, not one that moves with the allocations) and NumPy not to ask for huge
+pages, so every page of a large array faults once when it is first written and the faults times
+the page size are the bytes of large arrays the run goes through. NumPy allocations are also traced with tracemalloc (the Vt arrays
+USD allocates are not). The legacy case runs the Python list path the instancer arrays replaced,
+its reductions are tracked in baselines.json (see the reduction fixture in conftest).
+
+    python -m pytest exts/siborg.create.curvedistribute/benchmarks/test_memory.py -s
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pxr")
+
+EXT_ROOT = Path(__file__).resolve().parents[1]
+NUM_COPIES = 1_000_000
+PAGE_BYTES = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Builds a stage with a wiggly curve and a cube, then runs one case and prints its measurements
+SCRIPT = """
+import json, resource, sys, tracemalloc
+import numpy as np
+from pxr import Gf, Usd, UsdGeom, Vt
+from siborg.create.curvedistribute.core import CurveManager, GeomCreator
+
+case, size, trace = sys.argv[1], int(sys.argv[2]), sys.argv[3] == '1'
+stage = Usd.Stage.CreateInMemory()
+UsdGeom.Xform.Define(stage, '/World')
+UsdGeom.Cube.Define(stage, '/World/Cube')
+num_points = size if case == 'read' else 100
+steps = np.random.default_rng(0).normal(size=(num_points, 3)) + [1, 0, 0]
+curve = UsdGeom.BasisCurves.Define(stage, '/World/Curve')
+curve.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(np.cumsum(steps, axis=0).astype(np.float32)))
+
+if trace:
+    tracemalloc.start()
+before = resource.getrusage(resource.RUSAGE_SELF)
+if case == 'read':
+    CurveManager.read_curves(stage, ['/World/Curve'])
+elif case == 'legacy':
+    # The path the chunked instancer arrays replaced: the whole oriented placement as Python lists,
+    # then Vt arrays built from one Gf value per copy
+    points, dirs, _, curve_idx = CurveManager.distribute(CurveManager.curve_data(stage, '/World/Curve'), size)
+    positions = points.tolist()
+    rotations = CurveManager.orientations(dirs, [1, 0, 0], True, None, 0.0, curve_idx).tolist()
+    instancer = CurveManager.define_instancer(stage, ['/World/Cube'])
+    instancer.GetPositionsAttr().Set(Vt.Vec3fArray([Gf.Vec3f(*p) for p in positions]))
+    instancer.GetOrientationsAttr().Set(Vt.QuathArray([Gf.Quath(*q) for q in rotations]))
+    instancer.GetProtoIndicesAttr().Set(Vt.IntArray([0] * size))
+else:
+    GeomCreator.distribute(stage, '/World/Curve', ['/World/Cube'], size, point_instancer=True,
+                           use_orient=case != 'positions', follow_curve=True,
+                           variation={'seed': 1, 'scale_min': (0.5, 0.5, 0.5)} if case == 'varied' else None)
+after = resource.getrusage(resource.RUSAGE_SELF)
+print(json.dumps({'rss_bytes': (after.ru_maxrss - before.ru_maxrss) * 1024,
+                  'page_faults': after.ru_minflt - before.ru_minflt,
+                  'traced_peak_bytes': tracemalloc.get_traced_memory()[1] if trace else 0}))
+"""
+
+
+def measure(case, size):
+    """Peak RSS growth, minor page faults and traced NumPy peak of one case in new processes."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(EXT_ROOT), os.environ.get("PYTHONPATH", "")]),
+               MALLOC_MMAP_THRESHOLD_=str(64 * 1024), NUMPY_MADVISE_HUGEPAGE="0")
+
+    def run(trace):
+        result = subprocess.run([sys.executable, "-c", SCRIPT, case, str(size), "1" if trace else "0"],
+                                capture_output=True, text=True, env=env, check=True)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    # Tracing slows allocations down and adds its own, the other numbers come from an untraced run
+    result = run(False)
+    result['traced_peak_bytes'] = run(True)['traced_peak_bytes']
+    print(f"{case} {size}: {result['rss_bytes'] / 2**20:.1f} MB peak RSS, "
+          f"{result['page_faults'] * PAGE_BYTES / size:.0f} bytes allocated per item, "
+          f"{result['traced_peak_bytes'] / 2**20:.1f} MB traced peak")
+    return result
+
+
+@pytest.mark.parametrize("case, item_bytes, allocated_bytes", [("positions", 12 + 4, 1280),
+                                                                ("oriented", 12 + 4 + 8, 2560),
+                                                                ("varied", 12 + 4 + 8 + 12, 2816)])
+def test_instancer_memory(case, item_bytes, allocated_bytes):
+    # Whatever the count, the working set is the instancer arrays plus a chunk of float64 math
+    result = measure(case, NUM_COPIES)
+    final_bytes = NUM_COPIES * item_bytes
+    assert result['rss_bytes'] < 3 * final_bytes + 64 * 2**20
+    assert result['traced_peak_bytes'] < 64 * 2**20
+    # Every array a copy goes through on its way from the curve to the Vt arrays, chunk after chunk
+    assert result['page_faults'] * PAGE_BYTES < NUM_COPIES * allocated_bytes
+
+
+def test_read_memory():
+    # A million float3 points are read straight into the float64 control points, no other copy
+    result = measure('read', NUM_COPIES)
+    assert result['traced_peak_bytes'] < 1.5 * NUM_COPIES * 3 * 8
+    # The control points and the unit weights of the curve
+    assert result['page_faults'] * PAGE_BYTES < NUM_COPIES * 40
+
+
+@pytest.fixture(scope="module")
+def legacy_runs():
+    return measure('legacy', NUM_COPIES), measure('oriented', NUM_COPIES)
+
+
+@pytest.mark.parametrize("metric", ["traced_peak_bytes", "page_faults"])
+def test_legacy_reduction(reduction, legacy_runs, metric):
+    # The same oriented million copies, as Python lists and Gf values against chunked Vt arrays.
+    # Not the RSS growth, the peak of the interpreter start can already cover a small run and leave it at 0
+    legacy, current = legacy_runs
+    assert reduction(legacy[metric], current[metric]) > 1
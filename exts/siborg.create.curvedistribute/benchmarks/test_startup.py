@@ -0,0 +1,45 @@
+"""Cold import cost of the extension package, measured in a fresh interpreter with -X importtime.
+
+The interpreter gets the Kit stand-ins of kit_stubs, so importing the package loads extension.py
+as it does when Kit enables the extension.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+EXT_ROOT = Path(__file__).resolve().parents[1]
+KIT_STUBS = Path(__file__).resolve().with_name("kit_stubs")
+EXTENSION_MODULE = "siborg.create.curvedistribute.extension"
+# Seconds a cold import may take, NumPy included for curvemath
+IMPORT_BUDGET = float(os.environ.get("CURVEDISTRIBUTE_IMPORT_BUDGET", 0.5))
+
+
+def cold_import(module):
+    """Returns (cumulative import seconds, modules imported with it) of a module in a new process."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(EXT_ROOT), str(KIT_STUBS),
+                                                       os.environ.get("PYTHONPATH", "")]))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import sys, {module}; print(' '.join(sys.modules))"],
+                            capture_output=True, text=True, env=env, check=True)
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+    return cumulative / 1e6, set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", ["siborg.create.curvedistribute", "siborg.create.curvedistribute.curvemath"])
+def test_import_budget(module):
+    seconds, modules = cold_import(module)
+    print(f"{module}: {seconds * 1000:.1f} ms")
+    assert "scipy" not in modules
+    assert seconds < IMPORT_BUDGET
+    if module == "siborg.create.curvedistribute":
+        # The budget covers the extension module itself, the window and USD stay unloaded
+        assert EXTENSION_MODULE in modules
+        assert "pxr" not in modules
@@ -1 +1,6 @@
-from .extension import *
+import importlib.util
+
+# The curve math (curvemath) only needs NumPy and SciPy, outside Kit (no omni.ext) the extension
+# itself is skipped. Inside Kit any import error of the extension is raised, not hidden.
+if importlib.util.find_spec("omni") is not None and importlib.util.find_spec("omni.ext") is not None:
+    from .extension import *
@@ -0,0 +1,180 @@
+"""Headless batch distributions from a manifest, run across a process pool.
+
+    python -m siborg.create.curvedistribute.batch manifest.json --workers 8 --report report.json
+
+Only USD (pxr), NumPy and SciPy are needed, no Kit. The manifest is a JSON file:
+
+    {"defaults": {"count": 50, "use_orient": true, "curve_type": "Prim"},
+     "jobs": [{"file": "street.usda", "curves": "/World/Path", "sources": ["/World/Lamp"],
+               "scope_path": "/World/Lamps", "layer_file": "street_lamps.usdc"}]}
+
+Every job distributes its sources along its curves in its USD file. The other keys of a job
+(defaults included) are GeomCreator.distribute settings, curve_type and copy_mode by name. The
+copies are authored into layer_file, by default <file name>_<scope name>.usdc next to the file,
+and attached to the file as a sublayer (see core.DistributionLayer). Relative paths are relative
+to the manifest.
+
+Jobs on different files run in parallel, the jobs of one file run in manifest order in the same
+worker, so the edits to its root layer never race and the output does not depend on scheduling.
+A file is only saved when none of its jobs failed.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from . import utils
+
+# Settings given by name in the manifest
+ENUM_SETTINGS = {'curve_type': utils.CURVE, 'copy_mode': utils.COPY}
+
+# Keys of a job that are not GeomCreator.distribute settings
+JOB_KEYS = ('file', 'curves', 'sources')
+
+
+def load_manifest(manifest_path):
+    '''Jobs of a manifest in order, with the defaults applied and the paths resolved.
+
+    Returns a list of dicts with index, file, curves, sources and settings (GeomCreator.distribute keywords).
+    '''
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    folder = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    for index, entry in enumerate(manifest.get('jobs', [])):
+        entry = {**manifest.get('defaults', {}), **entry}
+        missing = [key for key in JOB_KEYS if key not in entry]
+        if missing:
+            raise ValueError(f"Job {index} of {manifest_path} has no {', '.join(missing)}")
+        settings = {key: value for key, value in entry.items() if key not in JOB_KEYS}
+        for key, enum in ENUM_SETTINGS.items():
+            if isinstance(settings.get(key), str):
+                settings[key] = enum[settings[key]]
+        file_path = os.path.join(folder, entry['file'])
+        scope_path = settings.setdefault('scope_path', "/World/Copies")
+        if not settings.get('layer_file'):
+            stem = os.path.splitext(os.path.basename(file_path))[0]
+            settings['layer_file'] = f"{stem}_{scope_path.rstrip('/').split('/')[-1]}.usdc"
+        settings['layer_file'] = os.path.join(os.path.dirname(file_path), settings['layer_file'])
+        sources = entry['sources']
+        if isinstance(sources, str):
+            sources = sources.replace(' ', '').split(',')
+        jobs.append({'index': index, 'file': os.path.normpath(file_path), 'curves': entry['curves'],
+                     'sources': sources, 'settings': settings})
+    return jobs
+
+
+def group_by_file(jobs):
+    '''Jobs grouped by their USD file, files in the order they first appear and jobs in manifest order.'''
+    groups = {}
+    for job in jobs:
+        groups.setdefault(os.path.normcase(os.path.abspath(job['file'])), []).append(job)
+    return list(groups.values())
+
+
+def run_file(jobs):
+    '''Run the jobs of one USD file in order and save it, returns a report entry per job.'''
+    from pxr import Usd
+    from .core import CurveManager, GeomCreator
+
+    report, failed = [], False
+    try:
+        stage = Usd.Stage.Open(jobs[0]['file'])
+    except Exception as e:
+        stage, failed = None, True
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+    for job in jobs:
+        entry = {'index': job['index'], 'file': job['file'], 'curves': job['curves'],
+                 'scope_path': job['settings']['scope_path'], 'layer_file': job['settings']['layer_file']}
+        start = time.perf_counter()
+        if stage is None:
+            entry.update(status='failed', error=error, seconds=0.0)
+            report.append(entry)
+            continue
+        try:
+            stats = GeomCreator.distribute(stage, job['curves'], job['sources'], **job['settings'])
+            entry['status'] = 'ok' if stats is not None else 'skipped'
+            if stats is not None:
+                entry['stats'] = stats.as_dict()
+        except Exception as e:
+            failed = True
+            entry['status'] = 'failed'
+            entry['error'] = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        entry['seconds'] = time.perf_counter() - start
+        report.append(entry)
+    if not failed:
+        stage.GetRootLayer().Save()
+    CurveManager.clear_caches()
+    return report
+
+
+def _init_worker():
+    # Every worker runs one file at a time, USD threads would only compete with the other workers
+    from pxr import Work
+    Work.SetConcurrencyLimit(1)
+
+
+def run_manifest(manifest_path, workers=None, report_path=None):
+    '''Run every job of a manifest, the files spread over a pool of worker processes.
+
+    workers: int, worker processes, by default one per CPU, 1 runs everything in this process
+    report_path: optional JSON file the timing report is written to
+    Returns the report entries of the jobs in manifest order.
+    '''
+    start = time.perf_counter()
+    groups = group_by_file(load_manifest(manifest_path))
+    workers = min(workers or os.cpu_count() or 1, max(len(groups), 1))
+    if workers == 1:
+        results = [run_file(group) for group in groups]
+    else:
+        # Spawned, not forked, a fork would copy the locks of USD threads in whatever state they are
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker) as pool:
+            # Files with the most jobs start first, so they do not end up running alone at the end
+            futures = [pool.submit(run_file, group) for group in sorted(groups, key=len, reverse=True)]
+            results = [future.result() for future in futures]
+    report = sorted((entry for result in results for entry in result), key=lambda entry: entry['index'])
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump({'manifest': os.path.abspath(manifest_path), 'workers': workers,
+                       'seconds': time.perf_counter() - start, 'jobs': report}, f, indent=2)
+    return report
+
+
+def summary(entry):
+    '''One line of the timing report of a job.'''
+    line = f"[{entry['index']}] {entry['file']} {entry['scope_path']}: {entry['status']}, " \
+           f"{entry['seconds'] * 1000:.1f} ms"
+    if 'stats' in entry:
+        stages = ', '.join(f"{name} {seconds * 1000:.1f}" for name, seconds in entry['stats']['seconds'].items()
+                           if seconds)
+        line += f", {entry['stats']['copies']} copies ({stages})"
+    if 'error' in entry:
+        line += f"\n    {entry['error']}"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m siborg.create.curvedistribute.batch",
+                                     description="Distribute copies along curves in USD files listed in a manifest")
+    parser.add_argument('manifest', help="JSON manifest of the jobs, see the batch module")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes, one per CPU by default, 1 runs in this process")
+    parser.add_argument('--report', default=None, help="JSON file to write the timing report of every job to")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    report = run_manifest(args.manifest, args.workers, args.report)
+    for entry in report:
+        print(summary(entry))
+    failed = sum(entry['status'] == 'failed' for entry in report)
+    print(f"{len(report)} jobs, {failed} failed, {time.perf_counter() - start:.1f} s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
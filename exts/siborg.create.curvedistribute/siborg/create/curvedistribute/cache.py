@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+from pxr import Usd, UsdGeom, Sdf, Tf
+
+# Memory cap of the arrays held by one stage cache
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class CurveCache():
+    '''LRU cache of curve evaluation data for one stage.
+
+    Entries are dicts of arrays (fitted curve, arc-length table, tangent samples) keyed by the curve
+    prim paths, a hash of the curve points and the sampling settings. The least recently used
+    entries are evicted once the arrays exceed max_bytes, and entries of a curve prim are dropped
+    as soon as the stage reports a change on it. It also holds the UsdGeom.BBoxCache measuring the
+    source prims, cleared when one of them changes.
+    '''
+    def __init__(self, stage, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._entry_bytes = {}
+        self._bbox_cache = None
+        # Prims measured by the bbox cache
+        self._bounded = set()
+        self._listener = Tf.Notice.Register(Usd.Notice.ObjectsChanged, self._on_objects_changed, stage)
+
+    @classmethod
+    def make_key(cls, curve_paths, control_points, curve_type, *settings):
+        '''Cache key of one or several curves, changes whenever their points, type or sampling settings change.
+
+        control_points: array or list of arrays, hashed in turn as float64 like their concatenation
+        '''
+        if isinstance(curve_paths, (str, Sdf.Path)):
+            curve_paths = [curve_paths]
+        if isinstance(control_points, np.ndarray):
+            control_points = [control_points]
+        hasher = hashlib.blake2b(digest_size=16)
+        for values in control_points:
+            # Hashed through the buffer, float64 arrays are not copied
+            hasher.update(np.ascontiguousarray(values, dtype=np.float64).ravel())
+        digest = hasher.hexdigest()
+        return (tuple(str(p) for p in curve_paths), digest, int(curve_type)) + tuple(settings)
+
+    @classmethod
+    def entry_nbytes(cls, entry):
+        '''Bytes held by the arrays of an entry.'''
+        return sum(v.nbytes for v in entry.values() if isinstance(v, np.ndarray))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        '''Cached entry for the key, marked as most recently used, or None.'''
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        '''Store an entry and evict the least recently used ones beyond the memory cap.'''
+        self.pop(key)
+        self._entries[key] = entry
+        self._entry_bytes[key] = self.entry_nbytes(entry)
+        self.nbytes += self._entry_bytes[key]
+        # The newest entry always stays, even when it is larger than the cap on its own
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            self.pop(next(iter(self._entries)))
+
+    def pop(self, key):
+        '''Remove an entry if it is cached.'''
+        if self._entries.pop(key, None) is not None:
+            self.nbytes -= self._entry_bytes.pop(key)
+
+    def bounds_sizes(self, prims):
+        '''Size of the local bounding box of every prim, (N, 3), zero for prims without extent.'''
+        if self._bbox_cache is None:
+            self._bbox_cache = UsdGeom.BBoxCache(Usd.TimeCode.Default(), [UsdGeom.Tokens.default_,
+                                                                          UsdGeom.Tokens.render],
+                                                 useExtentsHint=True)
+        sizes = []
+        for prim in prims:
+            self._bounded.add(prim.GetPath())
+            box = self._bbox_cache.ComputeLocalBound(prim).ComputeAlignedRange()
+            sizes.append((0, 0, 0) if box.IsEmpty() else box.GetSize())
+        return np.array(sizes, dtype=np.float64).reshape(-1, 3)
+
+    def invalidate(self, prim_path=None):
+        '''Drop the entries of a curve prim and of every prim below it, or everything without a path.'''
+        if prim_path is None:
+            keys = list(self._entries)
+        else:
+            prim_path = Sdf.Path(str(prim_path))
+            keys = [k for k in self._entries if any(Sdf.Path(p).HasPrefix(prim_path) for p in k[0])]
+        for key in keys:
+            self.pop(key)
+
+    def revoke(self):
+        '''Stop listening to the stage and drop every entry.'''
+        if self._listener is not None:
+            self._listener.Revoke()
+            self._listener = None
+        self.invalidate()
+        self._clear_bounds()
+
+    def _clear_bounds(self):
+        if self._bbox_cache is not None:
+            self._bbox_cache.Clear()
+        self._bounded.clear()
+
+    def _on_objects_changed(self, notice, sender):
+        if not self._entries and not self._bounded:
+            return
+        changed = set(p.GetPrimPath() for p in notice.GetResyncedPaths())
+        changed.update(p.GetPrimPath() for p in notice.GetChangedInfoOnlyPaths())
+        # A measured prim changes with its ancestors and the prims below it
+        if any(b.HasPrefix(p) or p.HasPrefix(b) for p in changed for b in self._bounded):
+            self._clear_bounds()
+        if not self._entries:
+            return
+        # Every ancestor of a cached curve, a change on any of them affects the curve
+        watched = {}
+        for key in self._entries:
+            prefixes = {Sdf.Path.absoluteRootPath}
+            for curve_path in key[0]:
+                prefixes.update(Sdf.Path(curve_path).GetPrefixes())
+            for prefix in prefixes:
+                watched.setdefault(prefix, []).append(key)
+
+        for prim_path in changed:
+            for key in watched.get(prim_path, ()):
+                self.pop(key)
@@ -1,121 +1,836 @@
+import os
+
 from pxr import Usd, UsdGeom, Gf, Sdf, Vt
 
 import numpy as np
-from scipy.interpolate import BSpline, CubicSpline
-import omni.usd
-from scipy.interpolate import splprep, splev
+try:
+    import omni.usd
+except ImportError:
+    # Headless, only GeomCreator.duplicate needs the Kit stage
+    omni = None
 
 
 from . import utils
+from .cache import CurveCache
+from .curvemath import CurveMath, BASIS_DEFAULTS
+from .profiling import DistributeStats, timed, zone
+
+class CurveManager(CurveMath):
+    '''Curve math of CurveMath plus reading curves from and authoring copies on a USD stage.'''
+    # Root layer identifier -> CurveCache
+    _caches = {}
 
-class CurveManager():
     def __init__(self):
         pass
 
     @classmethod
-    def cubic_bezier(cls, p0, p1, p2, p3, t):
-        '''Calculate position on a cubic Bezier curve given four control points.'''
-        return ((1 - t)**3) * p0 + 3 * ((1 - t)**2) * t * p1 + 3 * (1 - t) * t**2 * p2 + t**3 * p3
+    def get_cache(cls, stage):
+        '''The curve cache of a stage, created with its change listener on first use.'''
+        key = stage.GetRootLayer().identifier
+        curve_cache = CurveManager._caches.get(key)
+        if curve_cache is None:
+            curve_cache = CurveManager._caches[key] = CurveCache(stage)
+        return curve_cache
 
     @classmethod
-    def create_bezier(cls, control_points, sampling_resolution):
-        '''Create a continuous cubic Bezier curve from a list of control points.'''
-        curve_points = []
-        t = np.linspace(0, 1, sampling_resolution) # defaulted to 100
-        for i in range(0, len(control_points) - 3, 3):  # Step strides 3, bezier continous shared handles with neighbors
-            p0, p1, p2, p3 = control_points[i], control_points[i + 1], control_points[i + 2], control_points[i + 3]
-            bezier_segment = np.array([CurveManager.cubic_bezier(p0, p1, p2, p3, t_) for t_ in t])
-            curve_points.extend(bezier_segment)
-        return curve_points
+    def clear_caches(cls):
+        '''Drop every cached curve and revoke the stage listeners.'''
+        for curve_cache in CurveManager._caches.values():
+            curve_cache.revoke()
+        CurveManager._caches.clear()
 
     @classmethod
-    def create_bspline(cls, control_points, sampling_resolution):
-        '''Create a continuous cubic Bezier curve from a list of control points.'''
-        # Create a BSpline object
-        k = 3 # degree of the spline
-        t = np.linspace(0, 1, len(control_points) - k + 1, endpoint=True)
-        t = np.append(np.zeros(k), t)
-        t = np.append(t, np.ones(k))
-        spl = BSpline(t, control_points, k)
-
-        #### If not using evenly distributed points, can just return this
-        # tnew = np.linspace(0, 1, num_points)
-        # interpolated_points = spl(tnew)
-        # return interpolated_points
-        
-        # Calculate the total arc length of the spline
-        fine_t = np.linspace(0, 1, sampling_resolution)
-        curve_points = spl(fine_t)
-        
-        return curve_points
+    def curve_paths(cls, curve_path):
+        '''List of curve prim paths from a path, a comma separated string of paths or a list of paths.'''
+        if isinstance(curve_path, str):
+            curve_path = curve_path.split(',')
+        elif isinstance(curve_path, Sdf.Path):
+            curve_path = [curve_path]
+        return [str(p).strip() for p in curve_path if str(p).strip()]
 
     @classmethod
-    def interpcurve(cls, stage, curve_path, num_points, sampling_resolution, curve_type=utils.CURVE.Bspline):
-        '''Interpolates a bezier curve based on the input points on the usd'''
+    def read_curves(cls, stage, curve_paths, curve_type=utils.CURVE.Bspline, time=Usd.TimeCode.Default()):
+        '''Control points of every curve held by the prims, concatenated, the point count and the basis of every curve.
 
-        # Get the curve prim and points that define it
-        curveprim = stage.GetPrimAtPath(curve_path)
-        points = curveprim.GetAttribute('points').Get()
-        control_points = np.array(points)
-        
-        if sampling_resolution == 0: sampling_resolution = num_points
-            
-        if curve_type == utils.CURVE.Bezier:
-            fine_points = CurveManager.create_bezier(control_points, sampling_resolution)
-        elif curve_type == utils.CURVE.Bspline:
-            fine_points = CurveManager.create_bspline(control_points, sampling_resolution)
+        A prim holds one curve per entry of its curveVertexCounts, all of its points without it.
+        The basis is the type, basis and wrap of the prim for CURVE.Prim (see CurveMath.basis_spec),
+        NurbsCurves prims add their orders, knots, point weights and ranges, and it is None for
+        BSpline. Curves without a full segment or with an unsupported basis are skipped.
+        time: Usd.TimeCode, the points are read at this time for animated curves, at their first
+              time sample when they have no default value
+        Returns (points, counts, spec).
+        '''
+        views, counts = [], []
+        spec = {name: [] for name in BASIS_DEFAULTS}
+        nurbs = {'order': [], 'knots': [], 'weights': [], 'ranges': []}
+        for curve_path in curve_paths:
+            curveprim = stage.GetPrimAtPath(curve_path)
+            prim_points = curveprim.GetAttribute('points').Get(time)
+            if prim_points is None:
+                # Points with time samples and no default value
+                prim_points = curveprim.GetAttribute('points').Get(Usd.TimeCode.EarliestTime())
+            # A read-only view of the Vt buffer, the points are copied once below into float64
+            prim_points = np.asarray(prim_points if prim_points else np.zeros((0, 3))).reshape(-1, 3)
+            vertex_counts = curveprim.GetAttribute('curveVertexCounts').Get() if curveprim.HasAttribute('curveVertexCounts') else None
+            if not vertex_counts or sum(vertex_counts) != len(prim_points):
+                vertex_counts = [len(prim_points)]
+            views.append(prim_points)
+            counts.extend(vertex_counts)
+            for name, fallback in BASIS_DEFAULTS.items():
+                value = curveprim.GetAttribute(name).Get() if curveprim.HasAttribute(name) else None
+                spec[name].extend([str(value or fallback)] * len(vertex_counts))
+            if curveprim.IsA(UsdGeom.NurbsCurves):
+                spec['type'][-len(vertex_counts):] = ['nurbs'] * len(vertex_counts)
+                for name, values in zip(nurbs, CurveManager.read_nurbs(curveprim, vertex_counts)):
+                    nurbs[name].append(values)
+            else:
+                nurbs['order'].append(np.zeros(len(vertex_counts), dtype=int))
+                nurbs['weights'].append(np.ones(len(prim_points)))
+                nurbs['ranges'].append(np.full((len(vertex_counts), 2), np.nan))
+        points = np.empty((sum(len(view) for view in views), 3))
+        if views:
+            np.concatenate(views, out=points)
+        counts = np.asarray(counts, dtype=int)
+        if 'nurbs' in spec['type']:
+            spec.update((name, np.concatenate(values)) for name, values in nurbs.items())
+
+        if curve_type == utils.CURVE.Bspline:
+            spec = None
+            usable = counts >= 4
         else:
+            spec = CurveManager.basis_spec(curve_type, len(counts), spec)
+            usable = CurveManager.usable_curves(counts, spec)
+        if not usable.all():
+            print(f"Skipping {np.count_nonzero(~usable)} curve(s) without a full segment or with an unsupported basis")
+            if spec is not None:
+                points, counts, spec = CurveManager.select_curves(points, counts, spec, usable)
+            else:
+                point_curve = np.repeat(np.arange(len(counts)), counts)
+                points, counts = points[usable[point_curve]], counts[usable]
+        return points, counts, spec
+
+    @classmethod
+    def read_nurbs(cls, curveprim, vertex_counts):
+        '''Order of every curve, knots, point weights and ranges of a NurbsCurves prim.
+
+        Curves with fewer points than their order or with knots that do not match or decrease get
+        order 0 (and zero knots) so they are skipped. Weights default to 1 and missing ranges to
+        NaN, the knot domain.
+        '''
+        nurbs_curves = UsdGeom.NurbsCurves(curveprim)
+        vertex_counts = np.asarray(vertex_counts, dtype=int)
+        orders = np.array(nurbs_curves.GetOrderAttr().Get() or [], dtype=int)
+        knots = np.array(nurbs_curves.GetKnotsAttr().Get() or [], dtype=np.float64)
+        if len(orders) != len(vertex_counts) or len(knots) != (vertex_counts + orders).sum():
+            orders = np.zeros(len(vertex_counts), dtype=int)
+            knots = np.zeros(vertex_counts.sum())
+        knot_offsets = CurveManager.curve_offsets(vertex_counts + orders)
+        knot_curve = np.repeat(np.arange(len(vertex_counts)), vertex_counts + orders)
+        decreasing = np.zeros(len(vertex_counts), dtype=bool)
+        decreasing[knot_curve[1:][(np.diff(knots) < 0) & (knot_curve[1:] == knot_curve[:-1])]] = True
+        valid = (orders >= 2) & (vertex_counts >= orders) & ~decreasing
+        # A non empty knot domain
+        first = knot_offsets[:-1][valid]
+        valid[valid] = knots[first + vertex_counts[valid]] > knots[first + orders[valid] - 1]
+        if not valid.all():
+            fixed_counts = np.where(valid, vertex_counts + orders, vertex_counts)
+            fixed = np.zeros(fixed_counts.sum())
+            fixed[valid[np.repeat(np.arange(len(vertex_counts)), fixed_counts)]] = knots[valid[knot_curve]]
+            knots, orders = fixed, np.where(valid, orders, 0)
+
+        weights = np.array(nurbs_curves.GetPointWeightsAttr().Get() or [], dtype=np.float64)
+        if len(weights) != vertex_counts.sum():
+            weights = np.ones(vertex_counts.sum())
+        ranges = np.array(nurbs_curves.GetRangesAttr().Get() or [], dtype=np.float64).reshape(-1, 2)
+        if len(ranges) != len(vertex_counts):
+            ranges = np.full((len(vertex_counts), 2), np.nan)
+        return orders, knots, weights, ranges
+
+    @classmethod
+    def curve_request(cls, stage, curve_path, curve_type=utils.CURVE.Bspline, sampling_resolution=0,
+                      tolerance=utils.DEFAULT_TOLERANCE, stats=None):
+        '''Read the curve prims and return (cache key, curve_samples arguments), or None without a usable curve.
+
+        Reading the stage is cheap and must happen on the main thread, the sampling itself can run anywhere.
+        stats: optional profiling.DistributeStats, times the read stage
+        '''
+        curve_paths = CurveManager.curve_paths(curve_path)
+        with zone('read', stats):
+            control_points, counts, spec = CurveManager.read_curves(stage, curve_paths, curve_type)
+        if len(counts) == 0:
+            return None
+        args = (control_points, counts, curve_type, sampling_resolution, tolerance, spec)
+        return CurveManager.request_key(curve_paths, *args), args
+
+    @classmethod
+    def request_key(cls, curve_paths, control_points, counts, curve_type, sampling_resolution, tolerance, spec=None):
+        '''Cache key of curve_samples arguments, the points, counts and NURBS data are hashed.'''
+        basis, data = None, [control_points.ravel(), counts]
+        if spec is not None:
+            basis = tuple(zip(*(spec[name] for name in BASIS_DEFAULTS)))
+            data += [np.ravel(values) for name, values in spec.items() if name not in BASIS_DEFAULTS]
+        return CurveCache.make_key(curve_paths, data, curve_type, sampling_resolution, tolerance, basis)
+
+    @classmethod
+    def frame_request(cls, stage, curve_path, frames, curve_type=utils.CURVE.Bspline, sampling_resolution=0,
+                      tolerance=utils.DEFAULT_TOLERANCE, stats=None):
+        '''Read animated curve prims at every frame, returns (cache key, curve_samples arguments, frame index) or None.
+
+        Frames where the points did not move share their samples, so only the distinct frames are
+        sampled, all in one batch with their curves laid one frame after another (see
+        CurveMath.distribute_lengths group_size). frame_index maps every frame to its distinct frame.
+        Curves whose point counts change over the frames cannot be batched and give None.
+        stats: optional profiling.DistributeStats, times the read stage
+        '''
+        curve_paths = CurveManager.curve_paths(curve_path)
+        distinct, frame_index = {}, []
+        counts = spec = None
+        with zone('read', stats):
+            for time in frames:
+                frame_points, frame_counts, frame_spec = CurveManager.read_curves(stage, curve_paths, curve_type,
+                                                                                 Usd.TimeCode(time))
+                if counts is None:
+                    counts, spec = frame_counts, frame_spec
+                elif not np.array_equal(counts, frame_counts):
+                    print("The curve point counts change over the frames")
+                    return None
+                frame_index.append(distinct.setdefault(frame_points.tobytes(), len(distinct)))
+        if counts is None or len(counts) == 0:
+            return None
+
+        control_points = np.frombuffer(b''.join(distinct), dtype=np.float64).reshape(-1, 3)
+        args = (control_points, np.tile(counts, len(distinct)), curve_type, sampling_resolution, tolerance,
+                CurveManager.repeat_spec(spec, len(distinct)))
+        return CurveManager.request_key(curve_paths, *args), args, np.asarray(frame_index)
+
+    @classmethod
+    def curve_data(cls, stage, curve_path, curve_type=utils.CURVE.Bspline, sampling_resolution=0,
+                   tolerance=utils.DEFAULT_TOLERANCE, stats=None):
+        '''Fitted curves, fine samples, arc-length table and sample tangents of one or several curve prims.
+
+        Every curve of every prim (curveVertexCounts) is sampled in one batch, see CurveMath.curve_samples.
+        Results are cached per stage under the prim paths, a hash of their points and the sampling
+        settings, so repeated distributes on unchanged curves skip straight to placement.
+        stats: optional profiling.DistributeStats, times reading and sampling and holds the samples
+        Returns the curve_samples dict, or None when there is no usable curve.
+        '''
+        request = CurveManager.curve_request(stage, curve_path, curve_type, sampling_resolution, tolerance, stats)
+        if request is None:
+            return None
+        return CurveManager.cached_samples(stage, *request, stats=stats)
+
+    @classmethod
+    def cached_samples(cls, stage, key, args, stats=None):
+        '''curve_samples of a curve request from the stage cache, sampled and cached on a miss.'''
+        curve_cache = CurveManager.get_cache(stage)
+        entry = curve_cache.get(key)
+        if entry is None:
+            entry = CurveManager.curve_samples(*args, stats=stats)
+            curve_cache.put(key, entry)
+        if stats is not None:
+            stats.hold('samples', entry)
+        return entry
+
+    @classmethod
+    def animated_data(cls, stage, curve_path, frames, curve_type=utils.CURVE.Bspline, sampling_resolution=0,
+                      tolerance=utils.DEFAULT_TOLERANCE, stats=None):
+        '''curve_data of animated curve prims over a list of frames, cached the same way.
+
+        Returns (samples of the distinct frames, frame index of every frame), see frame_request,
+        or None when there is no usable curve.
+        '''
+        request = CurveManager.frame_request(stage, curve_path, frames, curve_type, sampling_resolution, tolerance,
+                                             stats)
+        if request is None:
+            return None
+        key, args, frame_index = request
+        return CurveManager.cached_samples(stage, key, args, stats), frame_index
+
+    @classmethod
+    def footprint(cls, stage, ref_prims, _forward_axis):
+        '''Largest size of the source prims along the forward axis, the length a copy takes on the curve.
+
+        Bounds come from the UsdGeom.BBoxCache of the stage cache, measured once until a source changes.
+        '''
+        prims = [stage.GetPrimAtPath(str(p)) for p in ref_prims if p]
+        sizes = CurveManager.get_cache(stage).bounds_sizes([p for p in prims if p.IsValid()])
+        forward_vector = np.abs(CurveManager.normalize(np.asarray(_forward_axis, dtype=np.float64)))
+        # Length of the boxes projected on the forward axis
+        return float((sizes @ forward_vector).max(initial=0))
+
+    @classmethod
+    def interpcurve(cls, stage, curve_path, num_points, sampling_resolution=0, curve_type=utils.CURVE.Bspline,
+                    return_u=False, tolerance=utils.DEFAULT_TOLERANCE, per_curve=False):
+        '''Interpolates a curve based on the input points on the usd, evenly spaced by arc length.
+
+        curve_path: str or list, one or several curve prims, comma separated in a string
+        sampling_resolution: int, uniform samples per segment (per curve for BSpline), 0 samples adaptively
+        tolerance: float, max distance in scene units between the curve and its samples when adaptive
+        return_u: bool, also return the curve parameter u and the curve index of every point
+        per_curve: bool, num_points on every curve instead of num_points spread over all curves
+        '''
+        if curve_type not in tuple(utils.CURVE):
             print("CURVE TYPE NOT IMPLEMENTED")
             return
+        data = CurveManager.curve_data(stage, curve_path, curve_type, sampling_resolution, tolerance)
+        if data is None:
+            print("NO USABLE CURVE")
+            return
 
-        distances = np.sqrt(np.sum(np.diff(fine_points, axis=0)**2, axis=1))
-        total_length = np.sum(distances)
-
-        # Calculate the length of each segment
-        segment_length = total_length / (num_points - 1)
-
-        # Create an array of target lengths
-        target_lengths = np.array([i * segment_length for i in range(num_points)])
-
-        # Find the points at the target lengths
-        spaced_points = [control_points[0]]  # Start with the first control point
-        point_dirs = [fine_points[1]- fine_points[0]] # Store the direction for each point 
-        current_length = 0
-        j = 1  # Start from the second target length
-
-        for i in range(1, len(fine_points)):
-            segment_length = distances[i-1]
-            # Create strides to find when the next point should be accepted
-            while j < num_points - 1 and current_length + segment_length >= target_lengths[j]:
-                # Assign points
-                point = fine_points[i]                
-                spaced_points.append(point)
-                # Get directions
-                direction = fine_points[i + 1] - point
-                # Normalize the direction vector
-                direction /= np.linalg.norm(direction)
-                point_dirs.append(direction)
-                
-                j += 1
-            current_length += segment_length
-
-        # End with the last control point
-        spaced_points.append(control_points[-1])  
-        last_dir = control_points[-1] - control_points[-2]
-        last_dir /= np.linalg.norm(last_dir)
-        point_dirs.append(last_dir)
-        
-        return np.array(spaced_points), np.array(point_dirs)
+        spaced_points, point_dirs, u, curve_idx = CurveManager.distribute(data, num_points, per_curve)
+
+        if return_u:
+            return spaced_points, point_dirs, u, curve_idx
+        return spaced_points, point_dirs
+
+    @classmethod
+    def project_points(cls, stage, curve_path, query_points, sampling_resolution=0, curve_type=utils.CURVE.Bspline,
+                       tolerance=utils.DEFAULT_TOLERANCE, refine=2):
+        '''Closest point on the curves of one or several curve prims to every query point.
+
+        The curves come from the stage cache (see curve_data) and so does their CurveIndex, built on
+        the first query, so snapping or measuring against unchanged curves only pays for the search.
+        query_points: (N, 3) points in the space of the curve points
+        refine: int, Newton steps on the curve, see CurveIndex.query
+        Returns (u, arc length, position, unit tangent, distance, curve index) arrays, raises ValueError
+        when curve_path has no usable curve.
+        '''
+        data = CurveManager.curve_data(stage, curve_path, curve_type, sampling_resolution, tolerance)
+        if data is None:
+            raise ValueError(f"{curve_path} has no usable curve to project on")
+        return CurveManager.closest_points(data, query_points, refine)
        
 
     @classmethod
-    def copy_to_points(cls, stage, target_points, target_dirs, ref_prims, path_to, _forward_axis, make_instance=False,
-                        rand_order=False, use_orient=False, follow_curve=False):
+    def define_instancer(cls, stage, ref_prims, scope_path="/World/Copies"):
+        '''Define the UsdGeom.PointInstancer under the scope with one prototype per source prim.
+
+        Every source prim becomes a prototype referenced under the instancer with its own transform cleared.
+        '''
+        UsdGeom.Scope.Define(stage, scope_path)
+        instancer = UsdGeom.PointInstancer.Define(stage, f"{scope_path}/Instancer")
+
+        prototypes_scope = UsdGeom.Scope.Define(stage, f"{instancer.GetPath()}/Prototypes")
+
+        prim_set = [p for p in ref_prims if p]
+        proto_paths = []
+        for prim_path in prim_set:
+            ref_prim_suffix = str(prim_path).split('/')[-1]
+            proto_prim = stage.DefinePrim(f"{prototypes_scope.GetPath()}/{ref_prim_suffix}")
+            proto_prim.GetReferences().AddInternalReference(prim_path)
+            # Positions come from the instancer, not the source placement
+            UsdGeom.Xformable(proto_prim).ClearXformOpOrder()
+            proto_paths.append(proto_prim.GetPath())
+        instancer.CreatePrototypesRel().SetTargets(proto_paths)
+        return instancer
+
+    @classmethod
+    def copy_to_instancer(cls, stage, target_points, ref_prims, quats=None, proto_indices=None):
+        '''Author all copies as a single UsdGeom.PointInstancer under /World/Copies.
+
+        Copies cycle through the prototypes, or use proto_indices, and all per-copy data is written as whole arrays.
+        '''
+        if proto_indices is None:
+            num_prototypes = max(len([p for p in ref_prims if p]), 1)
+            proto_indices = np.arange(len(target_points), dtype=np.int32) % num_prototypes
+        chunks = [(0, target_points, quats, proto_indices, None)]
+        return CurveManager.copy_chunks_to_instancer(stage, chunks, len(target_points), ref_prims, quats is not None)
+
+    @classmethod
+    def copy_chunks_to_instancer(cls, stage, chunks, num_copies, ref_prims, use_orient=False):
+        '''Author a PointInstancer from (start, positions, quats, proto indices, scales) chunks (see distribution_chunks).
+
+        The Vt arrays are allocated once at their final size and every chunk is written into its
+        slice, so only one chunk of intermediate data is alive at a time.
+        '''
+        writer = CopyWriter(stage, num_copies, ref_prims, use_orient=use_orient, point_instancer=True)
+        for chunk in chunks:
+            writer.write(chunk)
+        return writer.close()
+
+    @classmethod
+    def xform_op_plan(cls, stage, src_path, use_orient=False, use_scale=False):
+        '''Resolve once per source prim which xformOp attributes its copies author and with which value types.
+
+        Returns (translate_type, orient_type, scale_type, op_order), orient_type is None without
+        use_orient, scale_type is None without use_scale and op_order is None when the source already
+        lists every needed op in its xformOpOrder.
+        '''
+        prim = stage.GetPrimAtPath(src_path)
+        op_order = list(prim.GetAttribute('xformOpOrder').Get() or [])
+        ops = [('xformOp:translate', Sdf.ValueTypeNames.Double3)]
+        if use_orient:
+            ops.append(('xformOp:orient', Sdf.ValueTypeNames.Quatf))
+        if use_scale:
+            ops.append(('xformOp:scale', Sdf.ValueTypeNames.Float3))
+
+        type_names = {}
+        order_changed = False
+        for op_idx, (name, default_type) in enumerate(ops):
+            attr = prim.GetAttribute(name)
+            type_names[name] = attr.GetTypeName() if attr.IsDefined() else default_type
+            if name not in op_order:
+                # Translate outermost, orient right after it, scale innermost
+                op_order.insert(len(op_order) if name == 'xformOp:scale' else op_idx, name)
+                order_changed = True
+
+        return (type_names['xformOp:translate'], type_names.get('xformOp:orient'), type_names.get('xformOp:scale'),
+                op_order if order_changed else None)
+
+    @classmethod
+    def set_attr_spec(cls, prim_spec, name, type_name, value, variability=Sdf.VariabilityVarying):
+        '''Author a default value directly on a prim spec, reusing the attribute spec if it exists.
+
+        Time samples of an earlier animated distribution are dropped so the default shows.
+        Returns False without authoring anything when the spec already holds the value.
+        '''
+        attr_spec = prim_spec.attributes.get(name)
+        if attr_spec is None:
+            attr_spec = Sdf.AttributeSpec(prim_spec, name, type_name, variability)
+        elif attr_spec.HasInfo('timeSamples'):
+            attr_spec.ClearInfo('timeSamples')
+        elif attr_spec.default == value:
+            return False
+        attr_spec.default = value
+        return True
+
+    @classmethod
+    def copy_names(cls, src_paths, num_copies, start=0, proto_indices=None):
+        '''Prim names of the copies [start, start + num_copies) as {source name}_{copy index}.
+
+        proto_indices: optional source of every copy, the copies cycle through the sources without it
+        '''
+        names = [Sdf.Path(str(p)).name for p in src_paths]
+        if proto_indices is None:
+            return [f"{names[i % len(names)]}_{i}" for i in range(start, start + num_copies)]
+        return [f"{names[k]}_{i}" for i, k in zip(range(start, start + num_copies), np.asarray(proto_indices).tolist())]
+
+    @classmethod
+    def overlay_spec(cls, src_layer, src_path, dst_layer, dst_path):
+        '''Merge the specs under src_path onto the ones under dst_path field by field, the source opinions win.
+
+        Used to flatten the opinions of several layers on a prim into one spec tree, weakest layer first.
+        List ops (apiSchemas, references, relationship targets) are applied over the ones already
+        there, paths inside src_path move under dst_path. Variants are not merged.
+        '''
+        src_path, dst_path = Sdf.Path(str(src_path)), Sdf.Path(str(dst_path))
+        paths = []
+        src_layer.Traverse(src_path, paths.append)
+        # Parents before their children and properties
+        for path in sorted(paths, key=lambda p: p.pathElementCount):
+            if path.IsTargetPath() or path.ContainsPrimVariantSelection():
+                continue
+            src_spec = src_layer.GetObjectAtPath(path)
+            to_path = path.ReplacePrefix(src_path, dst_path)
+            dst_spec = dst_layer.GetObjectAtPath(to_path)
+            if not dst_spec:
+                if path.IsPrimPath():
+                    dst_spec = Sdf.CreatePrimInLayer(dst_layer, to_path)
+                elif isinstance(src_spec, Sdf.AttributeSpec):
+                    dst_spec = Sdf.AttributeSpec(dst_layer.GetPrimAtPath(to_path.GetPrimPath()), src_spec.name,
+                                                 src_spec.typeName, src_spec.variability, src_spec.custom)
+                else:
+                    dst_spec = Sdf.RelationshipSpec(dst_layer.GetPrimAtPath(to_path.GetPrimPath()), src_spec.name,
+                                                    src_spec.custom)
+            for key in src_spec.ListInfoKeys():
+                value = src_spec.GetInfo(key)
+                if key == 'specifier' and value == Sdf.SpecifierOver:
+                    continue
+                if key == 'timeSamples':
+                    # The samples of the strongest layer holding any win as a whole
+                    dst_spec.ClearInfo(key)
+                    for time, sample in value.items():
+                        dst_layer.SetTimeSample(to_path, time, sample)
+                    continue
+                if isinstance(value, Sdf.PathListOp):
+                    remapped = Sdf.PathListOp()
+                    # Setting any other items of an explicit list op would clear its explicit ones
+                    for items in (('explicitItems',) if value.isExplicit else
+                                  ('prependedItems', 'appendedItems', 'deletedItems', 'orderedItems')):
+                        setattr(remapped, items, [p.ReplacePrefix(src_path, dst_path) for p in getattr(value, items)])
+                    value = remapped
+                if hasattr(value, 'ApplyOperations'):
+                    weaker = dst_spec.GetInfo(key).ApplyOperations([]) if dst_spec.HasInfo(key) else []
+                    value = type(value).CreateExplicit(value.ApplyOperations(weaker))
+                if key in ('targetPaths', 'connectionPaths'):
+                    # Read-only as info, edited through their list proxy
+                    path_list = dst_spec.targetPathList if key == 'targetPaths' else dst_spec.connectionPathList
+                    path_list.explicitItems = value.ApplyOperations([])
+                else:
+                    dst_spec.SetInfo(key, value)
+
+    @classmethod
+    def flatten_spec(cls, stage, src_path, layer, dst_path):
+        '''Author the opinions on src_path from every layer of the layer stack as one spec tree at dst_path of the layer.
+
+        The weakest spec is copied and the stronger ones are merged over it (see overlay_spec).
+        Returns the prim spec, None when src_path has no spec in the layer stack.
+        '''
+        src_path, dst_path = Sdf.Path(str(src_path)), Sdf.Path(str(dst_path))
+        source_layers = [l for l in reversed(stage.GetLayerStack()) if l.GetPrimAtPath(src_path)]
+        if not source_layers:
+            return None
+        Sdf.CreatePrimInLayer(layer, dst_path.GetParentPath())
+        Sdf.CopySpec(source_layers[0], src_path, layer, dst_path)
+        for source_layer in source_layers[1:]:
+            CurveManager.overlay_spec(source_layer, src_path, layer, dst_path)
+        return layer.GetPrimAtPath(dst_path)
+
+    @classmethod
+    def author_copy_specs(cls, stage, scope_path, target_points, src_paths, quats=None, make_instance=False,
+                          incremental=False, start=0, proto_indices=None, scales=None, templates=None,
+                          copy_mode=utils.COPY.Duplicate, layer=None):
+        '''Author every copy as specs on the edit target layer inside a single Sdf.ChangeBlock.
+
+        Referencing copies get a new prim spec with an internal reference, the other copies are
+        stamped from the CopyTemplate of their source with one Sdf.CopySpec each.
+        The stage recomposes and sends its change notices once for the whole distribution.
+        incremental: bool, keep copies that already exist, made with the same copy mode, and only
+                     rewrite the transforms that moved
+        start: int, index of the first copy, to author a distribution chunk by chunk
+        proto_indices: optional source of every copy, the copies cycle through the sources without it
+        scales: optional (N, 3) scale of every copy, on top of the scale of its source
+        templates: optional CopyTemplate of every source prepared for these quats and scales, to
+                   reuse them over chunks, they are prepared here with copy_mode otherwise
+        copy_mode: utils.COPY, how copies that are not instances hold the data of their source
+        layer: optional Sdf.Layer the copies live in alone, instead of the edit target layer (see CopyWriter)
+        Returns (copies added, copies whose transform changed).
+        '''
+        scope_path = Sdf.Path(str(scope_path))
+        use_orient = quats is not None
+        use_scale = scales is not None
+        src_paths = [Sdf.Path(str(p)) for p in src_paths]
+        own_layer = layer is not None
+        if not own_layer:
+            layer = stage.GetEditTarget().GetLayer()
+        num_prims = len(src_paths)
+
+        # Everything that only depends on the source prim is resolved once
+        if make_instance:
+            mode_name = 'Instance'
+            plans = [CurveManager.xform_op_plan(stage, p, use_orient, use_scale) for p in src_paths]
+            type_names = [stage.GetPrimAtPath(p).GetTypeName() for p in src_paths]
+        else:
+            if templates is None:
+                templates = [CopyTemplate(stage, p, copy_mode, use_orient, use_scale, scope_path, layer)
+                             for p in src_paths]
+            mode_name = templates[0].mode_name if templates else None
+            plans = [t.plan for t in templates]
+        base_scales = [np.array(stage.GetPrimAtPath(p).GetAttribute('xformOp:scale').Get() or (1, 1, 1),
+                                dtype=np.float64) for p in src_paths]
+        copy_names = CurveManager.copy_names(src_paths, len(target_points), start, proto_indices)
+        if proto_indices is None:
+            sources = [(start + i) % num_prims for i in range(len(target_points))]
+        else:
+            sources = np.asarray(proto_indices).tolist()
+
+        positions = np.asarray(target_points, dtype=np.float64).tolist()
+        if use_orient:
+            quats = np.asarray(quats, dtype=np.float64).tolist()
+        if use_scale:
+            scales = np.asarray(scales, dtype=np.float64)
+
+        num_added = 0
+        num_moved = 0
+        with Sdf.ChangeBlock():
+            Sdf.CreatePrimInLayer(layer, scope_path)
+            for i, (position, k) in enumerate(zip(positions, sources)):
+                dst_path = scope_path.AppendChild(copy_names[i])
+
+                prim_spec = layer.GetPrimAtPath(dst_path) if incremental else None
+                created = not (prim_spec and prim_spec.specifier == Sdf.SpecifierDef
+                               and prim_spec.customData.get(utils.COPY_MODE_KEY) == mode_name)
+                if created and prim_spec:
+                    # Made another way, the copy is made again from scratch in every layer
+                    CurveManager.remove_copy(stage, dst_path, [layer] if own_layer else None)
+                if not created:
+                    pass
+                elif make_instance:
+                    prim_spec = Sdf.CreatePrimInLayer(layer, dst_path)
+                    prim_spec.specifier = Sdf.SpecifierDef
+                    prim_spec.typeName = type_names[k]
+                    prim_spec.referenceList.Prepend(Sdf.Reference(primPath=src_paths[k]))
+                    prim_spec.SetInfo('customData', {utils.COPY_MODE_KEY: mode_name,
+                                                     utils.COPY_SOURCE_KEY: str(src_paths[k])})
+                else:
+                    prim_spec = templates[k].stamp(layer, dst_path)
+
+                translate_type, orient_type, scale_type, op_order = plans[k]
+                moved = CurveManager.set_attr_spec(prim_spec, 'xformOp:translate', translate_type,
+                                                   translate_type.type.pythonClass(*position))
+                if use_orient:
+                    moved |= CurveManager.set_attr_spec(prim_spec, 'xformOp:orient', orient_type,
+                                                        orient_type.type.pythonClass(*quats[i]))
+                if use_scale:
+                    moved |= CurveManager.set_attr_spec(prim_spec, 'xformOp:scale', scale_type,
+                                                        scale_type.type.pythonClass(*(base_scales[k] * scales[i])))
+                elif not created and 'xformOp:scale' in prim_spec.attributes:
+                    # Back to the scale of the source after an earlier scale variation
+                    scale_type = prim_spec.attributes['xformOp:scale'].typeName
+                    moved |= CurveManager.set_attr_spec(prim_spec, 'xformOp:scale', scale_type,
+                                                        scale_type.type.pythonClass(*base_scales[k]))
+                if op_order is not None:
+                    CurveManager.set_attr_spec(prim_spec, 'xformOpOrder', Sdf.ValueTypeNames.TokenArray, op_order,
+                                               Sdf.VariabilityUniform)
+                if created:
+                    num_added += 1
+                else:
+                    num_moved += moved
+
+        return num_added, num_moved
+
+    @classmethod
+    def remove_copy(cls, stage, copy_path, layers=None):
+        '''Remove the specs of a copy, or of the whole copies scope, from every layer of the layer stack or of layers.'''
+        copy_path = Sdf.Path(str(copy_path))
+        for layer in stage.GetLayerStack() if layers is None else layers:
+            parent_spec = layer.GetPrimAtPath(copy_path.GetParentPath())
+            if parent_spec and copy_path.name in parent_spec.nameChildren:
+                del parent_spec.nameChildren[copy_path.name]
+
+    @classmethod
+    def remove_stale_copies(cls, stage, scope_path, src_paths, num_copies, proto_indices=None, templates=(),
+                            layers=None):
+        '''Remove the copies under the scope that are not part of a distribution of num_copies, from every layer.
+
+        Copies are the children named {source name}_{index}, source wrappers and the instancer are left alone.
+        Only copies of src_paths are considered, going by the source recorded in their customData (or
+        by their name for copies without one), so distributions of other sources can share the scope.
+        A copy is kept when its index is below num_copies and its source is the one cycled to at that index,
+        or the one of proto_indices, which is checked from the name alone so no list of every copy name is built.
+        Template class prims (see CopyTemplate) of src_paths are removed too unless their name is in templates.
+        layers: optional list of the layers to remove from, every layer of the layer stack by default
+        Returns the number of copies removed.
+        '''
+        scope_path = Sdf.Path(str(scope_path))
+        names = [Sdf.Path(str(p)).name for p in src_paths]
+        sources = {str(Sdf.Path(str(p))) for p in src_paths}
+
+        def is_own(spec, src_name):
+            source = spec.customData.get(utils.COPY_SOURCE_KEY)
+            return source in sources if source is not None else src_name in names
+
+        def is_current(name):
+            src_name, index = name.rsplit('_', 1)
+            index = int(index)
+            if index >= num_copies:
+                return False
+            source = index % len(names) if proto_indices is None else proto_indices[index]
+            return src_name == names[source]
+
+        removed = set()
+        with Sdf.ChangeBlock():
+            for layer in stage.GetLayerStack() if layers is None else layers:
+                scope_spec = layer.GetPrimAtPath(scope_path)
+                if not scope_spec:
+                    continue
+                stale = [c.name for c in scope_spec.nameChildren
+                         if utils.COPY_NAME.match(c.name) and is_own(c, c.name.rsplit('_', 1)[0])
+                         and not is_current(c.name)]
+                for name in stale:
+                    del scope_spec.nameChildren[name]
+                removed.update(stale)
+                for child in list(scope_spec.nameChildren):
+                    if (child.specifier == Sdf.SpecifierClass and child.name.endswith('_Template')
+                            and child.name not in templates and is_own(child, child.name[:-len('_Template')])):
+                        del scope_spec.nameChildren[child.name]
+        return len(removed)
+
+    @classmethod
+    def sync_copies(cls, stage, scope_path, target_points, src_paths, quats=None, make_instance=False,
+                    proto_indices=None, copy_mode=utils.COPY.Duplicate):
+        '''Bring the copies under the scope in line with a new placement, touching only what changed.
+
+        Copies that no longer exist in the placement are removed, missing ones are added and the
+        transforms of the others are only rewritten when they moved.
+        proto_indices: optional source of every copy, the copies cycle through the sources without it
+        copy_mode: utils.COPY, how copies that are not instances hold the data of their source
+        Returns (copies added, copies moved, copies removed).
+        '''
+        chunks = [(0, target_points, quats, proto_indices, None)]
+        return CurveManager.sync_copy_chunks(stage, scope_path, chunks, len(target_points), src_paths,
+                                             quats is not None, make_instance, copy_mode)
+
+    @classmethod
+    def sync_copy_chunks(cls, stage, scope_path, chunks, num_copies, src_paths, use_orient=False,
+                         make_instance=False, copy_mode=utils.COPY.Duplicate):
+        '''sync_copies from (start, positions, quats, proto indices, scales) chunks (see distribution_chunks).
+
+        Every chunk is authored as soon as it is generated, all inside one Sdf.ChangeBlock.
+        Returns (copies added, copies moved, copies removed).
+        '''
+        writer = CopyWriter(stage, num_copies, src_paths, make_instance, use_orient, scope_path=scope_path,
+                            src_paths_ready=True, copy_mode=copy_mode)
+        with Sdf.ChangeBlock():
+            for chunk in chunks:
+                writer.write(chunk)
+        return writer.close()
+
+    @classmethod
+    def copy_frames_to_points(cls, stage, frames, frame_index, positions, quats, ref_prims, make_instance=False,
+                              use_orient=False, point_instancer=False, proto_indices=None, scales=None, stats=None,
+                              copy_mode=utils.COPY.Duplicate, scope_path="/World/Copies", layer=None):
+        '''Author an animated distribution, the placement of every frame becomes time samples of the copies.
+
+        frames: list of time codes, frame_index: distinct frame of every time code
+        positions / quats: (distinct frames, copies, 3 / 4) placements, see CurveMath.frame_distribution
+        proto_indices / scales: optional source and scale of every copy
+        stats: optional profiling.DistributeStats, times the author stage and counts the copies and frames
+        copy_mode / scope_path / layer: see CopyWriter
+        Returns the instancer or (copies added, copies moved, copies removed) like copy_chunks_to_points.
+        '''
+        first = frame_index[0]
+        with zone('author', stats):
+            writer = FrameWriter(stage, positions[first], quats[first] if use_orient else None, ref_prims,
+                                 make_instance, use_orient, point_instancer, scope_path, proto_indices,
+                                 scales, copy_mode, layer)
+            with Sdf.ChangeBlock():
+                for time, index in zip(frames, frame_index):
+                    writer.write_frame(time, positions[index], quats[index] if use_orient else None)
+        if stats is not None:
+            stats.copies, stats.frames = positions.shape[1], writer.written
+        return writer.result
+
+    @classmethod
+    def backup_scope(cls, stage, scope_path="/World/Copies"):
+        '''Copy the specs of the scope in every layer of the layer stack, see restore_scope.'''
+        scope_path = Sdf.Path(str(scope_path))
+        backup = []
+        for layer in stage.GetLayerStack():
+            saved = None
+            if layer.GetPrimAtPath(scope_path):
+                saved = Sdf.Layer.CreateAnonymous()
+                Sdf.CreatePrimInLayer(saved, scope_path)
+                Sdf.CopySpec(layer, scope_path, saved, scope_path)
+            backup.append((layer, saved, bool(layer.GetPrimAtPath(scope_path.GetParentPath()))))
+        return backup
+
+    @classmethod
+    def restore_scope(cls, stage, scope_path, backup):
+        '''Put the scope back the way backup_scope found it, dropping everything authored below it since.'''
+        scope_path = Sdf.Path(str(scope_path))
+        with Sdf.ChangeBlock():
+            for layer, saved, had_parent in backup:
+                parent_spec = layer.GetPrimAtPath(scope_path.GetParentPath())
+                if parent_spec and scope_path.name in parent_spec.nameChildren:
+                    del parent_spec.nameChildren[scope_path.name]
+                if saved is not None:
+                    Sdf.CopySpec(saved, scope_path, layer, scope_path)
+                elif parent_spec and not had_parent and parent_spec.IsInert():
+                    # An empty over authored only to hold the scope
+                    del layer.GetPrimAtPath(parent_spec.path.GetParentPath()).nameChildren[parent_spec.name]
+
+    @classmethod
+    def instance_sources(cls, stage, scope_prim, prim_set):
+        '''Instanceable source prims for referencing copies, bare prims get an instanceable Xform wrapper in the scope.'''
+        new_prims = []
+
+        # Mark the original prims as instanceable if it has no children (like for a mesh)
+        for prim_path in prim_set:
+            # print(f'{prim_path=}')
+
+            original_prim = stage.GetPrimAtPath(prim_path)
+            # print(f'{original_prim=}')
+            # If this prim is not wrapped in an xform
+            if not original_prim.GetChildren():
+                ref_prim = original_prim
+                
+                ref_prim_suffix = str(ref_prim.GetPath()).split('/')[-1]
+                
+                # Create a new xform inside the scope
+                primpath_to = f"{scope_prim.GetPath()}/{ref_prim_suffix}_Source"
+                new_prim_xform_wrapper = stage.DefinePrim(primpath_to, "Xform")
+                
+                # Make this new xform instanceable
+                new_prim_xform_wrapper.SetInstanceable(True)
+                
+                # print(f'xform wrap path {new_prim_xform_wrapper}')
+                new_ref_prim = f"{new_prim_xform_wrapper.GetPath()}/{ref_prim_suffix}"
+                
+                # Duplicate the prim under the new xform, in the edit target layer only
+                CurveManager.flatten_spec(stage, ref_prim.GetPath(), stage.GetEditTarget().GetLayer(), new_ref_prim)
+                xform = UsdGeom.Xformable(new_prim_xform_wrapper)
+                # Get the list of xformOps
+                xform_ops = xform.GetOrderedXformOps()
+                # Check if translate op exists
+                has_translate_op = any(op.GetOpType() == UsdGeom.XformOp.TypeTranslate for op in xform_ops)
+                if not has_translate_op:
+                    xform.AddTranslateOp()
+                    
+                has_Orient_op = any(op.GetOpType() == UsdGeom.XformOp.TypeOrient for op in xform_ops)
+                if not has_Orient_op:
+                    xform.AddOrientOp()
+                                            
+                ref_prim= str(new_prim_xform_wrapper.GetPath())
+
+                original_prim = stage.GetPrimAtPath(ref_prim)
+                # print("finished the xform wrapper")
+            
+            original_prim.SetInstanceable(True)
+            
+            new_prims.append(original_prim)
+
+        return new_prims
+
+
+    @classmethod
+    def copy_chunks_to_points(cls, stage, chunks, num_copies, ref_prims, make_instance=False, use_orient=False,
+                              point_instancer=False, stats=None, copy_mode=utils.COPY.Duplicate,
+                              scope_path="/World/Copies", layer=None):
+        '''Author copies from (start, positions, quats, proto indices, scales) chunks as they are generated.
+
+        Streaming counterpart of copy_to_points(batched=True) for distribution_chunks, so placement
+        data for very large distributions is never held in full.
+        stats: optional profiling.DistributeStats, times the author stage (placement pulled from the
+               chunks keeps its own stages), counts the copies and holds the writer arrays
+        copy_mode / scope_path / layer: see CopyWriter
+        Returns the instancer with point_instancer, else (copies added, copies moved, copies removed).
+        '''
+        with zone('author', stats):
+            # The writer prepares the destination with the stage API, only the chunks go in the change block
+            writer = CopyWriter(stage, num_copies, ref_prims, make_instance, use_orient, point_instancer,
+                                scope_path, copy_mode=copy_mode, layer=layer)
+            if stats is not None:
+                stats.hold('writer', writer)
+            with Sdf.ChangeBlock():
+                for chunk in chunks:
+                    writer.write(chunk)
+            result = writer.close()
+        if stats is not None:
+            stats.copies = writer.written
+        return result
+
+    @classmethod
+    def copy_to_points(cls, stage, target_points, target_dirs, ref_prims, _forward_axis, make_instance=False,
+                        rand_order=False, use_orient=False, follow_curve=False, point_instancer=False, batched=False,
+                        up_vector=None, roll=0.0, curve_idx=None, seed=0, copy_mode=utils.COPY.Duplicate):
         '''        
-        path_to: str, prefix to the prim path. automatically appends Copy
-        TODO: rand_order =True, use randomness to determine which prim to place
-        TODO: follow_curve=True, set rotation axis to match curve (different than orientation when curve is 3d)
+        curve_idx: curve of every copy when distributing along several curves, each curve starts its own frames
+        follow_curve: bool, orient with rotation-minimizing frames along the curve (see orientations)
+        up_vector: optional world vector the up axis of the copies is kept towards
+        roll: float, extra rotation in degrees about the forward axis
+        point_instancer: bool, author one UsdGeom.PointInstancer instead of a prim per copy
+        batched: bool, author the copies as layer specs in one Sdf.ChangeBlock instead of prim by prim,
+                 existing copies are updated in place and copies beyond the new count are removed
+        rand_order: bool, pick the source of every copy at random instead of cycling through them,
+                    the same for a given seed (see CurveMath.variations)
+        copy_mode: utils.COPY, how batched copies that are not instances hold the data of their source (see
+                   CopyTemplate), prim by prim they are duplicated with omni.usd.duplicate_prim
         '''
+        # Orientations for all copies are solved up front
+        quats = None
+        if use_orient:
+            quats = CurveManager.orientations(target_dirs, _forward_axis, follow_curve, up_vector, roll, curve_idx)
+
+        proto_indices = None
+        if rand_order:
+            num_sources = len([p for p in ref_prims if p is not None])
+            proto_indices = CurveManager.variations({'seed': seed, 'weights': [1] * num_sources},
+                                                    np.arange(len(target_points)),
+                                                    num_prototypes=num_sources)['prototypes']
+
+        if point_instancer:
+            return CurveManager.copy_to_instancer(stage, target_points, ref_prims, quats, proto_indices)
         
         # Define a path for the new scope prim
         scope_name = 'Copies'
@@ -128,63 +843,25 @@ class CurveManager():
         # print(prim_set) 
         # print(f'isntance? : {make_instance}')
         
-        new_prims = []
-        
         if make_instance:
+            prim_set = CurveManager.instance_sources(stage, scope_prim, prim_set)
 
-            # Mark the original prims as instanceable if it has no children (like for a mesh)
-            for prim_path in prim_set:
-                # print(f'{prim_path=}')
-
-                original_prim = stage.GetPrimAtPath(prim_path)
-                # print(f'{original_prim=}')
-                # If this prim is not wrapped in an xform
-                if not original_prim.GetChildren():
-                    ref_prim = original_prim
-                    
-                    ref_prim_suffix = str(ref_prim.GetPath()).split('/')[-1]
-                    
-                    # Create a new xform inside the scope
-                    primpath_to = f"{scope_prim.GetPath()}/{ref_prim_suffix}_Source"
-                    new_prim_xform_wrapper = stage.DefinePrim(primpath_to, "Xform")
-                    
-                    # Make this new xform instanceable
-                    new_prim_xform_wrapper.SetInstanceable(True)
-                    
-                    # print(f'xform wrap path {new_prim_xform_wrapper}')
-                    new_ref_prim = f"{new_prim_xform_wrapper.GetPath()}/{ref_prim_suffix}"
-                    
-                    # Duplicate the prim and put it under a new xform
-                    omni.usd.duplicate_prim(stage, ref_prim.GetPath(), new_ref_prim)
-                    xform = UsdGeom.Xformable(new_prim_xform_wrapper)
-                    # Get the list of xformOps
-                    xform_ops = xform.GetOrderedXformOps()
-                    # Check if translate op exists
-                    has_translate_op = any(op.GetOpType() == UsdGeom.XformOp.TypeTranslate for op in xform_ops)
-                    if not has_translate_op:
-                        xform.AddTranslateOp()
-                        
-                    has_Orient_op = any(op.GetOpType() == UsdGeom.XformOp.TypeOrient for op in xform_ops)
-                    if not has_Orient_op:
-                        xform.AddOrientOp()
-                                                
-                    ref_prim= str(new_prim_xform_wrapper.GetPath())
-
-                    original_prim = stage.GetPrimAtPath(ref_prim)
-                    # print("finished the xform wrapper")
-                
-                original_prim.SetInstanceable(True)
-                
-                new_prims.append(original_prim)
-
-            prim_set = new_prims
+        if batched:
+            src_paths = [p.GetPath() if make_instance else p for p in prim_set]
+            return CurveManager.sync_copies(stage, scope_prim.GetPath(), target_points, src_paths, quats,
+                                            make_instance=make_instance, proto_indices=proto_indices,
+                                            copy_mode=copy_mode)
 
         num_prims = len(prim_set)
         cur_idx = 0
+        # Converted to Python floats in one go, not point by point
+        positions = np.asarray(target_points, dtype=np.float64).reshape(-1, 3).tolist()
 
 
         # Place the prims
-        for i, target_point in enumerate(target_points):
+        for i, target_point in enumerate(positions):
+            if proto_indices is not None:
+                cur_idx = proto_indices[i]
             ref_prim = prim_set[cur_idx]
 
             if make_instance:
@@ -208,70 +885,520 @@ class CurveManager():
                 cur_prim = new_prim
                 
             # Move prim to desired location
-            target_pos = Gf.Vec3d(tuple(target_point))
+            target_pos = Gf.Vec3d(*target_point)
             cur_prim.GetAttribute('xformOp:translate').Set(target_pos)
                 
 
             if use_orient:
-                # Make the forward vector face desired direction 
-                target_direction = tuple(target_dirs[i])
-                # Ensure the target direction is a normalized Gf.Vec3f
-                target_direction = Gf.Vec3f(target_direction).GetNormalized()
-                target_direction = np.asarray(target_direction)
-
-                # Forward vector, assuming -Z is forward; change as per your convention
-                forward_vector = np.array(_forward_axis)
-                
-                # Compute the cross product (rotation axis)
-                rotation_axis = np.cross(forward_vector, target_direction)
-                # Compute the dot product and then the angle
-                dot_product = np.dot(forward_vector, target_direction)
-                rotation_angle = np.arccos(np.clip(dot_product, -1.0, 1.0))  # Clipping for numerical stability
-                rot_ax = Vt.Vec3fArray.FromNumpy(rotation_axis)[0]
-
-                # Create a rotation quaternion
-                rotation_quat = Gf.Quatf(rotation_angle, rot_ax).GetNormalized()
-
-                # @TODO fix stupid hack
-                # Apply the rotation
-                try:    cur_prim.GetAttribute('xformOp:orient').Set(Gf.Quatd(rotation_quat))
-                except: cur_prim.GetAttribute('xformOp:orient').Set(Gf.Quatf(rotation_quat))
+                # Apply the rotation, in whatever precision the orient op was authored
+                orient_attr = cur_prim.GetAttribute('xformOp:orient')
+                if orient_attr:
+                    orient_attr.Set(orient_attr.GetTypeName().type.pythonClass(*quats[i]))
 
             if cur_idx < num_prims-1: cur_idx +=1
             else: cur_idx = 0
 
 
+class CopyTemplate():
+    '''A source prim prepared once, every copy of it is then a single Sdf.CopySpec plus its transform.
+
+    The opinions on the source from every layer of the layer stack are flattened into one spec tree
+    of an anonymous layer and its xformOps are normalized (translate, orient and scale attributes
+    and xformOpOrder in place), so copies neither go through omni.usd.duplicate_prim nor need their
+    ops fixed. How much of the source a copy holds depends on the copy mode (utils.COPY):
+    Duplicate: everything, like duplicate_prim.
+    SharedGeometry: everything but the array attributes (points, normals, indices, primvars). The
+    whole prepared source is authored once as a class prim {source name}_Template in the shared
+    layer and every copy references it.
+    Reference: only the reference to that class prim, the copies author their transforms alone.
+    '''
+    def __init__(self, stage, src_path, copy_mode=utils.COPY.Duplicate, use_orient=False, use_scale=False,
+                 scope_path="/World/Copies", shared_layer=None):
+        '''
+        use_orient / use_scale: bool, the copies author an orient / a scale op
+        shared_layer: Sdf.Layer of the layer stack for the class prim, the edit target layer by default
+        '''
+        src_path = Sdf.Path(str(src_path))
+        self.copy_mode = utils.COPY(copy_mode)
+        self.mode_name = self.copy_mode.name
+        translate_type, orient_type, scale_type, op_order = CurveManager.xform_op_plan(stage, src_path, use_orient,
+                                                                                       use_scale)
+        # Referencing copies get their op order from the class prim
+        self.plan = (translate_type, orient_type, scale_type,
+                     None if self.copy_mode == utils.COPY.Reference else op_order)
+
+        self.layer = Sdf.Layer.CreateAnonymous('curvedistribute_template')
+        self.path = Sdf.Path.absoluteRootPath.AppendChild(src_path.name)
+        spec = CurveManager.flatten_spec(stage, src_path, self.layer, self.path)
+        if spec is None:
+            raise ValueError(f"{src_path} has no spec in the layer stack to copy")
+        spec.specifier = Sdf.SpecifierDef
+        for name, type_name in (('xformOp:translate', translate_type), ('xformOp:orient', orient_type),
+                                ('xformOp:scale', scale_type)):
+            if type_name is not None and name not in spec.attributes:
+                Sdf.AttributeSpec(spec, name, type_name)
+        if op_order is not None:
+            CurveManager.set_attr_spec(spec, 'xformOpOrder', Sdf.ValueTypeNames.TokenArray, op_order,
+                                       Sdf.VariabilityUniform)
+
+        self.shared_path = None
+        if self.copy_mode != utils.COPY.Duplicate:
+            if shared_layer is None:
+                shared_layer = stage.GetEditTarget().GetLayer()
+            self.shared_path = Sdf.Path(str(scope_path)).AppendChild(f"{src_path.name}_Template")
+            Sdf.CreatePrimInLayer(shared_layer, self.shared_path.GetParentPath())
+            Sdf.CopySpec(self.layer, self.path, shared_layer, self.shared_path)
+            shared_spec = shared_layer.GetPrimAtPath(self.shared_path)
+            shared_spec.specifier = Sdf.SpecifierClass
+            shared_spec.SetInfo('customData', {**shared_spec.customData, utils.COPY_SOURCE_KEY: str(src_path)})
+            if self.copy_mode == utils.COPY.Reference:
+                type_name = spec.typeName
+                del self.layer.pseudoRoot.nameChildren[self.path.name]
+                spec = Sdf.PrimSpec(self.layer, self.path.name, Sdf.SpecifierDef, type_name)
+            else:
+                CopyTemplate.drop_arrays(self.layer, self.path)
+            spec.referenceList.Prepend(Sdf.Reference(primPath=self.shared_path))
+        custom_data = dict(spec.customData)
+        custom_data[utils.COPY_MODE_KEY] = self.mode_name
+        custom_data[utils.COPY_SOURCE_KEY] = str(src_path)
+        spec.SetInfo('customData', custom_data)
+
+    @classmethod
+    def drop_arrays(cls, layer, path):
+        '''Remove the array attributes under path, but xformOpOrder.'''
+        paths = []
+        layer.Traverse(path, paths.append)
+        for attr_path in paths:
+            attr_spec = layer.GetAttributeAtPath(attr_path) if attr_path.IsPropertyPath() else None
+            if attr_spec and attr_spec.typeName.isArray and attr_spec.name != 'xformOpOrder':
+                attr_spec.owner.RemoveProperty(attr_spec)
+
+    def stamp(self, layer, copy_path):
+        '''Author a copy at copy_path in the layer, its parent spec has to exist, returns its prim spec.'''
+        Sdf.CopySpec(self.layer, self.path, layer, copy_path)
+        return layer.GetPrimAtPath(copy_path)
+
+
+class CopyWriter():
+    '''Author a distribution under a copies scope one (start, positions, quats, proto indices, scales) chunk at a time.
+
+    Creating the writer prepares the destination (instancer prototypes and preallocated Vt arrays,
+    or the copies scope), write authors a chunk and close finishes the distribution, removing the
+    copies of an earlier distribution that are not part of this one. Callers decide how chunks are batched into Sdf.ChangeBlocks or spread over frames,
+    the writer itself has to be created outside of a change block since it uses the stage API.
+    '''
+    def __init__(self, stage, num_copies, ref_prims, make_instance=False, use_orient=False, point_instancer=False,
+                 scope_path="/World/Copies", src_paths_ready=False, copy_mode=utils.COPY.Duplicate,
+                 layer=None):
+        '''
+        num_copies: int, size of the whole distribution
+        ref_prims: list, source prim paths, copies cycle through them
+        src_paths_ready: bool, ref_prims are already the copy sources (instanceable wrappers resolved)
+        copy_mode: utils.COPY, how copies that are not instances hold the data of their source
+        layer: optional Sdf.Layer the copies and templates are authored in instead of the edit target
+               layer, the distribution lives there alone so copies of an earlier one are only removed
+               from it. Prims set up with the stage API (the scope, instancer and instance sources)
+               stay on the edit target, see DistributionLayer.
+        '''
+        self.stage = stage
+        self.num_copies = num_copies
+        self.use_orient = use_orient
+        self.point_instancer = point_instancer
+        self.written = 0
+        self._added = 0
+        self._moved = 0
+        self._removed = 0
+
+        if point_instancer:
+            self._instancer = CurveManager.define_instancer(stage, ref_prims, scope_path)
+            self._positions = Vt.Vec3fArray(num_copies)
+            self._proto_indices = Vt.IntArray(num_copies)
+            self._orientations = Vt.QuathArray(num_copies) if use_orient else None
+            # Allocated by the first chunk with scales
+            self._scales = None
+            # Chunk buffers in the layout of every array, reused from chunk to chunk
+            self._staging = {name: utils.VtStaging(array_type) for name, array_type in
+                             (('positions', Vt.Vec3fArray), ('proto_indices', Vt.IntArray),
+                              ('orientations', Vt.QuathArray), ('scales', Vt.Vec3fArray))}
+            return
+
+        self.scope_path = Sdf.Path(str(scope_path))
+        src_paths = [p for p in ref_prims if p]
+        if not src_paths_ready:
+            scope_prim = UsdGeom.Scope.Define(stage, self.scope_path)
+            if make_instance:
+                src_paths = [p.GetPath() for p in CurveManager.instance_sources(stage, scope_prim, src_paths)]
+        self.src_paths = src_paths
+        self._make_instance = make_instance
+        self._copy_mode = copy_mode
+        self.layer = layer
+        # CopyTemplate of every source without and with a scale op, prepared by the first chunk using them
+        self._templates = {}
+        # Source of every copy, to tell the copies of an earlier distribution apart on close
+        self._sources = np.arange(num_copies, dtype=np.int32) % max(len(src_paths), 1)
+
+    @property
+    def nbytes(self):
+        '''Bytes of the arrays the writer holds for the whole distribution.'''
+        if not self.point_instancer:
+            return self._sources.nbytes
+        # Vec3f positions, int indices, half quaternions and Vec3f scales
+        item_bytes = 12 + 4 + (8 if self.use_orient else 0) + (12 if self._scales is not None else 0)
+        return self.num_copies * item_bytes
+
+    def write(self, chunk):
+        '''Author one (start, positions, quats, proto indices, scales) chunk.'''
+        start, chunk_points, chunk_quats, chunk_indices, chunk_scales = chunk
+        stop = start + len(chunk_points)
+        if self.point_instancer:
+            staging = self._staging
+            self._positions[start:stop] = staging['positions'].convert(chunk_points)
+            self._proto_indices[start:stop] = staging['proto_indices'].convert(chunk_indices)
+            if self.use_orient:
+                self._orientations[start:stop] = staging['orientations'].convert(chunk_quats)
+            if chunk_scales is not None:
+                if self._scales is None:
+                    self._scales = Vt.Vec3fArray(self.num_copies, Gf.Vec3f(1, 1, 1))
+                self._scales[start:stop] = staging['scales'].convert(chunk_scales)
+        else:
+            if chunk_indices is not None:
+                self._sources[start:stop] = chunk_indices
+            templates = None
+            if not self._make_instance:
+                use_scale = chunk_scales is not None
+                templates = self._templates.get(use_scale)
+                if templates is None:
+                    templates = self._templates[use_scale] = [
+                        CopyTemplate(self.stage, p, self._copy_mode, self.use_orient, use_scale, self.scope_path,
+                                     self.layer)
+                        for p in self.src_paths]
+            added, moved = CurveManager.author_copy_specs(self.stage, self.scope_path, chunk_points, self.src_paths,
+                                                          chunk_quats if self.use_orient else None,
+                                                          make_instance=self._make_instance, incremental=True,
+                                                          start=start, proto_indices=chunk_indices,
+                                                          scales=chunk_scales, templates=templates,
+                                                          layer=self.layer)
+            self._added += added
+            self._moved += moved
+        self.written += len(chunk_points)
+
+    def close(self):
+        '''Finish the distribution, returns the instancer or (copies added, copies moved, copies removed).'''
+        if not self.point_instancer:
+            shared = {t.shared_path.name for templates in self._templates.values() for t in templates if t.shared_path}
+            self._removed = CurveManager.remove_stale_copies(self.stage, self.scope_path, self.src_paths,
+                                                             self.num_copies, self._sources, shared,
+                                                             None if self.layer is None else [self.layer])
+            return self._added, self._moved, self._removed
+
+        instancer = self._instancer
+        instancer.CreateProtoIndicesAttr().Set(self._proto_indices)
+        positions_attr = instancer.CreatePositionsAttr()
+        # Time samples of an earlier animated distribution would hide the new default
+        if positions_attr.GetNumTimeSamples():
+            positions_attr.Clear()
+        positions_attr.Set(self._positions)
+        if self.use_orient:
+            orientations_attr = instancer.CreateOrientationsAttr()
+            if orientations_attr.GetNumTimeSamples():
+                orientations_attr.Clear()
+            orientations_attr.Set(self._orientations)
+        else:
+            instancer.GetOrientationsAttr().Clear()
+        if self._scales is not None:
+            instancer.CreateScalesAttr().Set(self._scales)
+        else:
+            instancer.GetScalesAttr().Clear()
+        return instancer
+
+
+class FrameWriter():
+    '''Author an animated distribution as time samples, one frame at a time.
+
+    The copies (or the instancer) are created by CopyWriter from the first frame, which also
+    becomes their default placement, then write_frame authors the positions and orientations of a
+    frame as time samples directly on the edit target layer. Like CopyWriter chunks, frames can be
+    batched into Sdf.ChangeBlocks or spread over app updates, the writer itself has to be created
+    outside of a change block.
+    '''
+    def __init__(self, stage, positions, quats, ref_prims, make_instance=False, use_orient=False,
+                 point_instancer=False, scope_path="/World/Copies", proto_indices=None, scales=None,
+                 copy_mode=utils.COPY.Duplicate, layer=None):
+        '''
+        positions / quats: placement of the first frame, quats is None without use_orient
+        ref_prims: list, source prim paths, copies cycle through them
+        proto_indices / scales: optional source and scale of every copy, they do not change over the frames
+        copy_mode / layer: see CopyWriter, the time samples of the copies go to the layer too
+        '''
+        self.use_orient = use_orient
+        self.point_instancer = point_instancer
+        self.written = 0
+        if proto_indices is None:
+            num_prototypes = max(len([p for p in ref_prims if p]), 1)
+            proto_indices = np.arange(len(positions), dtype=np.int32) % num_prototypes
+        copy_writer = CopyWriter(stage, len(positions), ref_prims, make_instance, use_orient, point_instancer,
+                                 scope_path, copy_mode=copy_mode, layer=layer)
+        copy_writer.write((0, positions, quats, proto_indices, scales))
+        self.result = copy_writer.close()
+        self._layer = layer if layer is not None and not point_instancer else stage.GetEditTarget().GetLayer()
+
+        if point_instancer:
+            instancer_path = self.result.GetPath()
+            self._translate_paths = [instancer_path.AppendProperty('positions')]
+            self._orient_paths = [instancer_path.AppendProperty('orientations')]
+            # Every frame has as many copies, the frame buffers are allocated once
+            self._staging = (utils.VtStaging(Vt.Vec3fArray), utils.VtStaging(Vt.QuathArray))
+        else:
+            src_paths = copy_writer.src_paths
+            copy_paths = [copy_writer.scope_path.AppendChild(name)
+                          for name in CurveManager.copy_names(src_paths, len(positions), 0, proto_indices)]
+            self._translate_paths = [p.AppendProperty('xformOp:translate') for p in copy_paths]
+            self._orient_paths = [p.AppendProperty('xformOp:orient') for p in copy_paths]
+            # Value type of every copy, the one of its source xformOps
+            plans = [CurveManager.xform_op_plan(stage, p, use_orient) for p in src_paths]
+            self._types = [plans[k] for k in np.asarray(proto_indices).tolist()]
+
+    def write_frame(self, time, positions, quats=None):
+        '''Author the placement of one frame as time samples at time.'''
+        layer = self._layer
+        if self.point_instancer:
+            layer.SetTimeSample(self._translate_paths[0], time, self._staging[0].convert(positions))
+            if self.use_orient:
+                layer.SetTimeSample(self._orient_paths[0], time, self._staging[1].convert(quats))
+        else:
+            positions = np.asarray(positions, dtype=np.float64).tolist()
+            for path, (translate_type, _, _, _), position in zip(self._translate_paths, self._types, positions):
+                layer.SetTimeSample(path, time, translate_type.type.pythonClass(*position))
+            if self.use_orient:
+                quats = np.asarray(quats, dtype=np.float64).tolist()
+                for path, (_, orient_type, _, _), quat in zip(self._orient_paths, self._types, quats):
+                    layer.SetTimeSample(path, time, orient_type.type.pythonClass(*quat))
+        self.written += 1
+
+
+# Parent of the scope copies are authored under before DistributionLayer.attach moves them in place
+STAGING_ROOT = Sdf.Path('/__curvedistribute')
+
+
+class DistributionLayer():
+    '''A distribution authored off the stage into its own layer, saved as a .usdc file and attached in one step.
+
+    The copies are authored as specs in layer, an anonymous layer no stage is open on, so writing
+    them costs no change processing at all. The few prims writers set up with the stage API (the
+    scope, the instancer and instance sources) go to stage, a second stage over the same root
+    layer masked to them and the sources, and are merged into layer by attach. Writers
+    (CopyWriter, FrameWriter) run on that stage with layer, under author_scope: a scope of the same
+    name under STAGING_ROOT, so copies of an earlier distribution at scope_path are neither
+    composed nor in the way. The stage being edited neither changes nor recomposes until attach,
+    which moves the copies to scope_path (Sdf.CopySpec remaps the paths between them), saves the
+    layer to file_path in a single write, crate binary for a .usdc path whose arrays are only read
+    back when accessed, and adds it to the stage as its strongest sublayer or as a payload on the
+    scope prim, which can then be unloaded. The root layer only gains the sublayer path or the
+    payload arc, so saving it does not write the copies again.
+
+    A payload only brings in what is under the scope, the copies resolve through it when they do
+    not point at prims outside of it (material bindings, instances and prototypes referencing
+    their sources), so distributions that reference their sources are always attached as a sublayer.
+    '''
+    def __init__(self, stage, file_path, scope_path="/World/Copies", ref_prims=(), as_payload=False,
+                 references_sources=False):
+        '''
+        file_path: str, the layer file, overwritten by attach
+        ref_prims: list, source prim paths, composed on the authoring stage
+        as_payload: bool, attach as a payload on the scope prim instead of a sublayer
+        references_sources: bool, the copies are instances or a point instancer, they need a sublayer
+        '''
+        self.target_stage = stage
+        self.file_path = file_path
+        self.scope_path = Sdf.Path(str(scope_path))
+        self.author_scope = STAGING_ROOT.AppendChild(self.scope_path.name)
+        if as_payload and references_sources:
+            print("Instances reference their sources outside of the payload, attaching as a sublayer")
+            as_payload = False
+        self.as_payload = as_payload
+        root_layer = stage.GetRootLayer()
+        self.layer = Sdf.Layer.CreateAnonymous('curvedistribute.usdc')
+        # Time samples of animated distributions are read in the time codes of the root layer
+        self.layer.timeCodesPerSecond = root_layer.timeCodesPerSecond
+        self.layer.framesPerSecond = root_layer.framesPerSecond
+        # The scope is composed as the ancestor of the instancer and the instance source wrappers
+        src_paths = [Sdf.Path(str(p)) for p in ref_prims if p]
+        mask_paths = [self.author_scope.AppendChild('Instancer')] + src_paths
+        mask_paths += [self.author_scope.AppendChild(f"{p.name}_Source") for p in src_paths]
+        self._setup_layer = Sdf.Layer.CreateAnonymous('curvedistribute_setup')
+        self.stage = Usd.Stage.OpenMasked(root_layer, self._setup_layer, Usd.StagePopulationMask(mask_paths))
+        self.stage.SetEditTarget(Usd.EditTarget(self._setup_layer))
+
+    def asset_path(self, file_layer):
+        '''Path of the layer file as authored in the root layer, relative to it when the root layer is a file.'''
+        root_path = self.target_stage.GetRootLayer().realPath
+        if not root_path:
+            return file_layer.identifier
+        try:
+            relative = os.path.relpath(file_layer.realPath, os.path.dirname(root_path)).replace(os.sep, '/')
+        except ValueError:
+            # Another drive
+            return file_layer.identifier
+        return relative if relative.startswith('.') else f"./{relative}"
+
+    def attach(self):
+        '''Save the distribution to file_path and add it to the stage, returns the Sdf.Layer of the file.
+
+        Earlier copies of the scope in the layer stack (authored in place, or a payload arc) are
+        removed and the file layer takes its new content in the same change block, so the stage
+        recomposes once, also when the file is already one of its layers.
+        '''
+        stage = self.target_stage
+        root_layer = stage.GetRootLayer()
+        for prim_spec in self._setup_layer.rootPrims:
+            CurveManager.overlay_spec(self._setup_layer, prim_spec.path, self.layer, prim_spec.path)
+        if self.layer.GetPrimAtPath(self.author_scope):
+            Sdf.CreatePrimInLayer(self.layer, self.scope_path.GetParentPath())
+            Sdf.CopySpec(self.layer, self.author_scope, self.layer, self.scope_path)
+            del self.layer.pseudoRoot.nameChildren[STAGING_ROOT.name]
+        file_layer = Sdf.Layer.FindOrOpen(self.file_path) or Sdf.Layer.CreateNew(self.file_path)
+        asset_path = self.asset_path(file_layer)
+        real_path = os.path.normcase(os.path.normpath(file_layer.realPath))
+        with Sdf.ChangeBlock():
+            CurveManager.remove_copy(stage, self.scope_path)
+            file_layer.TransferContent(self.layer)
+            sublayer_paths = root_layer.subLayerPaths
+            attached = [p for p in sublayer_paths
+                        if os.path.normcase(os.path.normpath(root_layer.ComputeAbsolutePath(p))) == real_path]
+            if self.as_payload:
+                for path in attached:
+                    sublayer_paths.remove(path)
+                scope_spec = Sdf.CreatePrimInLayer(stage.GetEditTarget().GetLayer(), self.scope_path)
+                scope_spec.specifier = Sdf.SpecifierDef
+                scope_spec.typeName = 'Scope'
+                scope_spec.payloadList.Prepend(Sdf.Payload(asset_path, self.scope_path))
+            elif not attached:
+                sublayer_paths.insert(0, asset_path)
+        file_layer.Save()
+        return file_layer
+
+
 class GeomCreator():
     def __init__(self):
         pass
     
     @classmethod
     def duplicate(cls, _count, _sampling_resolution, _source_curve_model, _source_prim_model, 
-                  _use_instance, _use_orient, _forward_axis, _curve_type):
+                  _use_instance, _use_orient, _forward_axis, _curve_type, _tolerance=utils.DEFAULT_TOLERANCE,
+                  _use_point_instancer=False, _follow_curve=False, _up_axis=None, _roll=0.0, _per_curve=False,
+                  _frames=None, _pack=False, _gap=0.0, _variation=None, _stats=None,
+                  _copy_mode=utils.COPY.Duplicate, _scope_path="/World/Copies", _layer_file=None,
+                  _as_payload=False):
         '''
         ## All of these should work (assuming the named prim is there)
         # ref_prims = ['/World/Cube']
         # ref_prims = ['/World/Cube', None]
         # ref_prims = ['/World/Cube', '/World/Cone']
+        ## Several curves are comma separated too, _per_curve places _count copies on each of them
+        # curve_path = '/World/BasisCurves, /World/BasisCurves_01'
+        ## Animated curves, the copies follow them with one time sample per frame
+        # _frames = range(int(stage.GetStartTimeCode()), int(stage.GetEndTimeCode()) + 1)
+        ## _pack fills the curves with copies by their size along _forward_axis, _gap apart,
+        ## at most _count of them (0 fills the curves) and without overlaps
+        ## _variation = {'seed': 7, 'weights': [3, 1], 'jitter_across': 0.5, 'scale_min': (0.8, 0.8, 0.8), 'roll': 180}
+        ## varies the sources, placement, scale and roll of the copies, see VARIATION_DEFAULTS
+        ## _copy_mode = utils.COPY.SharedGeometry keeps the mesh data of copies that are not instances
+        ## once in the stage, see CopyTemplate
+        ## _scope_path is the prim the copies go under, one per distribution to keep several
+        ## _layer_file = 'copies.usdc' authors the copies off the stage into their own layer file,
+        ## attached as a sublayer, or with _as_payload as a payload on the scope, see DistributionLayer
+        ## Returns the profiling.DistributeStats of the run (filled into _stats when given),
+        ## None when nothing was distributed
+        ## The curve and source prims come from the window models, the copies go to the Kit stage,
+        ## distribute does the same on any stage with plain values
         '''
 
         stage = omni.usd.get_context().get_stage()
         curve_path = _source_curve_model.as_string
-        ref_prims = [_source_prim_model.as_string]
         ref_prims = _source_prim_model.as_string.replace(' ','').split(',')
-        # _use_instance = _use_instance.as_bool
+        return GeomCreator.distribute(stage, curve_path, ref_prims, _count, _sampling_resolution, _curve_type,
+                                      _tolerance, _use_instance, _use_orient, _forward_axis, _use_point_instancer,
+                                      _follow_curve, _up_axis, _roll, _per_curve, _frames, _pack, _gap, _variation,
+                                      _copy_mode, _scope_path, _layer_file, _as_payload, _stats)
 
-        path_to = f'/Copy'
+    @classmethod
+    def distribute(cls, stage, curve_path, ref_prims, count, sampling_resolution=0, curve_type=utils.CURVE.Bspline,
+                   tolerance=utils.DEFAULT_TOLERANCE, use_instance=False, use_orient=False, forward_axis=(1, 0, 0),
+                   point_instancer=False, follow_curve=False, up_axis=None, roll=0.0, per_curve=False, frames=None,
+                   pack=False, gap=0.0, variation=None, copy_mode=utils.COPY.Duplicate, scope_path="/World/Copies",
+                   layer_file=None, as_payload=False, stats=None):
+        '''Distribute copies of the source prims along curve prims of any stage, with plain values.
 
-        sampling_resolution = _sampling_resolution 
-        num_points = _count
-        # Default to 3x the number of points to distribute? Actually might be handled already by interp
-        num_samples = _count
-        
-        # TODO: make this setting for the resolution to sample the curve defined by user
-        interpolated_points, target_dirs = CurveManager.interpcurve(stage, curve_path, num_samples, sampling_resolution, _curve_type)
-        indices = np.linspace(0, len(interpolated_points) - 1, num_points, dtype=int)
+        The settings are the ones of duplicate (and DistributeJob) without the window models, so it
+        runs outside Kit on a stage opened from a file, see batch.
+        curve_path: str or list, one or several curve prims, comma separated in a string
+        ref_prims: list of source prim paths, None entries are skipped
+        stats: optional profiling.DistributeStats filled in as it runs
+        Returns the profiling.DistributeStats of the run, None when nothing was distributed.
+        '''
+        if curve_type not in tuple(utils.CURVE):
+            print("CURVE TYPE NOT IMPLEMENTED")
+            return
+        stats = stats if stats is not None else DistributeStats()
+        num_prototypes = len([p for p in ref_prims if p])
+        output = None
+        author_stage, author_scope, author_layer = stage, scope_path, None
+        if layer_file:
+            output = DistributionLayer(stage, layer_file, scope_path, ref_prims, as_payload,
+                                       use_instance or point_instancer)
+            author_stage, author_scope, author_layer = output.stage, output.author_scope, output.layer
+        if frames:
+            if pack:
+                print("Packing by footprint is not supported on animated curves, spacing evenly")
+            animated = CurveManager.animated_data(stage, curve_path, frames, curve_type, sampling_resolution,
+                                                  tolerance, stats)
+            if animated is None:
+                print("NO USABLE CURVE")
+                return
+            samples, frame_index = animated
+            placement = CurveManager.frame_distribution(samples, count, frame_index.max() + 1, forward_axis,
+                                                        per_curve, use_orient, follow_curve, up_axis, roll,
+                                                        num_prototypes, variation, stats)
+            positions, quats, proto_indices, scales = placement
+            stats.listen(stage)
+            try:
+                CurveManager.copy_frames_to_points(author_stage, frames, frame_index, positions, quats, ref_prims,
+                                                   make_instance=use_instance, use_orient=use_orient,
+                                                   point_instancer=point_instancer, proto_indices=proto_indices,
+                                                   scales=scales, stats=stats, copy_mode=copy_mode,
+                                                   scope_path=author_scope, layer=author_layer)
+                if output is not None:
+                    timed('author', stats, output.attach)
+            finally:
+                stats.stop_listening()
+            return stats
+        samples = CurveManager.curve_data(stage, curve_path, curve_type, sampling_resolution, tolerance, stats)
+        if samples is None:
+            print("NO USABLE CURVE")
+            return
+
+        targets = None
+        if pack:
+            footprint = CurveManager.footprint(stage, ref_prims, forward_axis)
+            if footprint <= 0:
+                print("The source prims have no extent along the forward axis to pack by")
+                return
+            targets = timed('pack', stats, CurveManager.packed_lengths, samples, footprint, gap, count, per_curve)
 
-        target_points = interpolated_points[indices]
-        CurveManager.copy_to_points(stage, target_points, target_dirs, ref_prims, path_to, _forward_axis,
-                                    make_instance=_use_instance, use_orient=_use_orient)
+        # Placement is generated and authored chunk by chunk, count copies per curve with per_curve
+        num_copies = CurveManager.distribution_size(samples, count, per_curve, targets=targets)
+        chunks = CurveManager.distribution_chunks(samples, count, forward_axis, per_curve, use_orient,
+                                                  follow_curve, up_axis, roll, num_prototypes=num_prototypes,
+                                                  targets=targets, variation=variation, stats=stats)
+        stats.listen(stage)
+        try:
+            CurveManager.copy_chunks_to_points(author_stage, chunks, num_copies, ref_prims,
+                                               make_instance=use_instance, use_orient=use_orient,
+                                               point_instancer=point_instancer, stats=stats,
+                                               copy_mode=copy_mode, scope_path=author_scope,
+                                               layer=author_layer)
+            if output is not None:
+                timed('author', stats, output.attach)
+        finally:
+            stats.stop_listening()
+        return stats
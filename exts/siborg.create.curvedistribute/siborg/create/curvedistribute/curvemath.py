@@ -0,0 +1,1598 @@
+"""Curve evaluation, arc-length and orientation math on plain NumPy arrays.
+
+Nothing here touches USD or Kit, so it can be imported, tested and benchmarked headless with
+only NumPy installed. SciPy is only loaded by the legacy fit_bspline helper, which needs it, and
+by the closest-point index (CurveIndex), which searches with NumPy alone when it is missing.
+core.CurveManager adds the stage reading and authoring on top.
+"""
+from enum import IntEnum
+
+import numpy as np
+
+from .profiling import zone
+
+
+class CURVE(IntEnum):
+    Bezier = 0
+    Bspline = 1
+    Linear = 2
+    # The type, basis and wrap authored on every curve prim
+    Prim = 3
+
+# Max distance in scene units between a curve and the polyline used to measure it
+DEFAULT_TOLERANCE = 0.01
+
+# Copies computed at once by distribution_chunks, bounds the memory of very large distributions
+DEFAULT_CHUNK_SIZE = 65536
+
+# UsdGeomBasisCurves fallback values of type, basis and wrap
+BASIS_DEFAULTS = {'type': 'cubic', 'basis': 'bezier', 'wrap': 'nonperiodic'}
+
+# Seeded variation of the copies, everything off by default (see CurveMath.variations)
+# weights: one per source prim for a weighted random source instead of cycling through them
+# jitter_along / jitter_across: max offset along the curve and away from it, in scene units
+# scale_min / scale_max: per axis scale range, roll: max extra roll in degrees either way
+VARIATION_DEFAULTS = {'seed': 0, 'weights': None, 'jitter_along': 0.0, 'jitter_across': 0.0,
+                      'scale_min': (1.0, 1.0, 1.0), 'scale_max': (1.0, 1.0, 1.0), 'roll': 0.0}
+
+# Random stream of every varied quantity, each one has its own so changing one leaves the others alone
+VARIATION_STREAMS = {'prototype': 0, 'jitter': 1, 'scale': 2, 'roll': 3}
+
+# Cubic basis matrices as Hydra evaluates them, row k weighs the 4 segment points for t**(3 - k)
+BASIS_MATRICES = {
+    'bezier': np.array([[-1, 3, -3, 1],
+                        [3, -6, 3, 0],
+                        [-3, 3, 0, 0],
+                        [1, 0, 0, 0]], dtype=np.float64),
+    'bspline': np.array([[-1, 3, -3, 1],
+                         [3, -6, 3, 0],
+                         [-3, 0, 3, 0],
+                         [1, 4, 1, 0]], dtype=np.float64) / 6,
+    'catmullRom': np.array([[-1, 3, -3, 1],
+                            [2, -5, 4, -1],
+                            [-1, 0, 1, 0],
+                            [0, 2, 0, 0]], dtype=np.float64) / 2,
+}
+
+def default_up(forward_axis):
+    """Local up axis of a copy for a given forward axis, +Y unless forward is along Y then +Z"""
+    return [0,0,1] if abs(forward_axis[1]) > 0.5 else [0,1,0]
+
+
+class CurveMath():
+    def __init__(self):
+        pass
+
+    @classmethod
+    def cubic_bezier(cls, p0, p1, p2, p3, t):
+        '''Calculate position on a cubic Bezier curve given four control points.'''
+        return ((1 - t)**3) * p0 + 3 * ((1 - t)**2) * t * p1 + 3 * (1 - t) * t**2 * p2 + t**3 * p3
+
+    @classmethod
+    def bernstein_basis(cls, t, derivative=0):
+        '''Cubic Bernstein basis matrix (or its 1st/2nd derivative in t) for an array of parameters, shape (len(t), 4).'''
+        t = np.asarray(t, dtype=np.float64)[:, None]
+        s = 1 - t
+        if derivative == 1:
+            return np.hstack((-3 * s**2, 3 * s**2 - 6 * s * t, 6 * s * t - 3 * t**2, 3 * t**2))
+        elif derivative == 2:
+            return np.hstack((6 * s, 6 * t - 12 * s, 6 * s - 12 * t, 6 * t))
+        return np.hstack((s**3, 3 * s**2 * t, 3 * s * t**2, t**3))
+
+    @classmethod
+    def bezier_segments(cls, control_points):
+        '''Stack the four control points of every cubic segment into a (S, 4, 3) tensor.'''
+        control_points = np.asarray(control_points, dtype=np.float64)
+        num_segments = max((len(control_points) - 1) // 3, 0)
+        # Step strides 3, bezier continous shared handles with neighbors
+        idx = 3 * np.arange(num_segments)[:, None] + np.arange(4)
+        return control_points[idx]
+
+    @classmethod
+    def create_bezier(cls, control_points, sampling_resolution):
+        '''Create a continuous cubic Bezier curve from a list of control points.
+
+        All segments are evaluated at once as basis (T, 4) x segments (S, 4, 3), the shared
+        endpoint between neighboring segments is only kept once. Returns an (N, 3) array.
+        '''
+        t = np.linspace(0, 1, sampling_resolution) # defaulted to 100
+        segments = CurveMath.bezier_segments(control_points)
+        if len(segments) == 0 or len(t) == 0:
+            return np.empty((0, 3))
+
+        curve_points = CurveMath.bernstein_basis(t) @ segments
+        return np.concatenate((curve_points[0, :1], curve_points[:, 1:].reshape(-1, 3)))
+
+    @classmethod
+    def eval_bezier(cls, control_points, u, derivative=0):
+        '''Evaluate a continuous cubic Bezier curve (or its derivative in u) at global parameters u in [0, 1].'''
+        return CurveMath.eval_bezier_segments(CurveMath.bezier_segments(control_points), u, derivative)
+
+    @classmethod
+    def curve_offsets(cls, counts):
+        '''Offsets of consecutive ragged runs with the given lengths, shape (len(counts) + 1,).'''
+        return np.concatenate(([0], np.cumsum(counts))).astype(int)
+
+    @classmethod
+    def bezier_segments_batch(cls, control_points, counts):
+        '''Stack the cubic segments of several curves (one run of counts[c] points each) into one (S, 4, 3) tensor.
+
+        Returns (segments, segment offsets per curve), no Python loop over curves.
+        '''
+        control_points = np.asarray(control_points, dtype=np.float64)
+        counts = np.asarray(counts, dtype=int)
+        point_offsets = CurveMath.curve_offsets(counts)
+        num_segments = np.maximum((counts - 1) // 3, 0)
+        seg_offsets = CurveMath.curve_offsets(num_segments)
+
+        seg_curve = np.repeat(np.arange(len(counts)), num_segments)
+        seg_local = np.arange(seg_offsets[-1]) - seg_offsets[seg_curve]
+        idx = (point_offsets[seg_curve] + 3 * seg_local)[:, None] + np.arange(4)
+        return control_points[idx], seg_offsets
+
+    @classmethod
+    def eval_bezier_segments(cls, segments, u, derivative=0, seg_offsets=None, curve_idx=None):
+        '''Evaluate stacked (S, 4, 3) Bezier segments at parameters u in [0, 1] of each curve.
+
+        seg_offsets / curve_idx: segment offsets of every curve and the curve of every parameter,
+        without them all segments form a single curve.
+        '''
+        u = np.asarray(u, dtype=np.float64)
+        if seg_offsets is None:
+            seg_offsets = np.array([0, len(segments)])
+        if curve_idx is None:
+            curve_idx = np.zeros(len(u), dtype=int)
+        first = seg_offsets[curve_idx]
+        num_segments = seg_offsets[curve_idx + 1] - first
+
+        u = np.clip(u, 0, 1) * num_segments
+        # The last segment owns u == 1
+        seg_idx = np.minimum(np.floor(u).astype(int), num_segments - 1)
+        basis = CurveMath.bernstein_basis(u - seg_idx, derivative)
+        # Chain rule, every segment spans 1 / num_segments of u
+        scale = (num_segments**derivative)[:, None]
+        return np.einsum('nk,nkd->nd', basis, segments[first + seg_idx]) * scale
+
+    @classmethod
+    def clamped_uniform_knots(cls, counts, degree=3):
+        '''Clamped uniform knot vectors on [0, 1] for curves with the given point counts, concatenated.
+
+        Returns (knots, knot offsets per curve), the same knots fit_bspline builds for a single curve.
+        '''
+        counts = np.asarray(counts, dtype=int)
+        num_knots = counts + degree + 1
+        knot_offsets = CurveMath.curve_offsets(num_knots)
+        knot_curve = np.repeat(np.arange(len(counts)), num_knots)
+        local = np.arange(knot_offsets[-1]) - knot_offsets[knot_curve]
+        knots = np.clip((local - degree) / np.maximum(counts[knot_curve] - degree, 1), 0, 1)
+        return knots, knot_offsets
+
+    @classmethod
+    def bspline_spans(cls, knots, knot_offsets, degree, curve_idx, u):
+        '''Local knot span index of every parameter inside the knot vector of its own curve.'''
+        first = knot_offsets[:-1]
+        num_points = np.diff(knot_offsets) - degree - 1
+        lo = knots[first + degree]
+        hi = knots[first + num_points]
+        # Lay the curves out one after another on a single axis so one searchsorted serves them all
+        knot_curve = np.repeat(np.arange(len(first)), np.diff(knot_offsets))
+        width = np.maximum(hi - lo, 1e-300)
+        normalized = (knots - lo[knot_curve]) / width[knot_curve]
+        gap = normalized.max() - normalized.min() + 1
+        # (u - lo) / width + gap * curve, in one array
+        position = u - lo[curve_idx]
+        position /= width[curve_idx]
+        position += gap * curve_idx
+        key = np.searchsorted(normalized + gap * knot_curve, position, side='right')
+        key -= first[curve_idx] + 1
+        return np.clip(key, degree, num_points[curve_idx] - 1, out=key)
+
+    @classmethod
+    def eval_bspline_batch(cls, control_points, point_offsets, knots, knot_offsets, degree, curve_idx, u):
+        '''Evaluate many B-splines with ragged control points and knots with a vectorized de Boor recursion.
+
+        u is in the knot domain of each curve, the only Python loops are over the degree.
+        '''
+        u = np.asarray(u, dtype=np.float64)
+        # Per curve values, gathered once per parameter
+        first = knot_offsets[:-1]
+        num_points = np.diff(knot_offsets) - degree - 1
+        u = np.clip(u, knots[first + degree][curve_idx], knots[first + num_points][curve_idx])
+        span = CurveMath.bspline_spans(knots, knot_offsets, degree, curve_idx, u)
+
+        idx = (point_offsets[:-1] - degree)[curve_idx]
+        idx += span
+        d = control_points[idx[:, None] + np.arange(degree + 1)]
+        k = first[curve_idx]
+        k += span
+        # Work arrays of the recursion, filled again at every step
+        index, left, width, alpha = np.empty_like(k), np.empty_like(u), np.empty_like(u), np.empty_like(u)
+        for r in range(1, degree + 1):
+            for j in range(degree, r - 1, -1):
+                np.take(knots, np.add(k, j - degree, out=index), out=left)
+                np.take(knots, np.add(k, 1 + j - r, out=index), out=width)
+                width -= left
+                np.subtract(u, left, out=alpha)
+                np.divide(alpha, width, out=alpha, where=width > 0)
+                alpha[width <= 0] = 0
+                # d[j] = (1 - alpha) d[j - 1] + alpha d[j], in place
+                d[:, j] -= d[:, j - 1]
+                d[:, j] *= alpha[:, None]
+                d[:, j] += d[:, j - 1]
+        return d[:, degree]
+
+    @classmethod
+    def bspline_derivative_batch(cls, control_points, point_offsets, knots, knot_offsets, degree):
+        '''Control points and knots of the derivative of every B-spline, still ragged and concatenated.
+
+        Returns (control points, point offsets, knots, knot offsets) of the degree - 1 splines.
+        '''
+        counts = np.diff(point_offsets)
+        point_curve = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(len(control_points)) - point_offsets[point_curve]
+        # Differences inside each curve, dropping the last point of every curve
+        keep = local < counts[point_curve] - 1
+        i = np.flatnonzero(keep)
+        kb = knot_offsets[point_curve[i]] + local[i]
+        width = knots[kb + degree + 1] - knots[kb + 1]
+        scale = np.divide(degree, width, out=np.zeros_like(width), where=width > 0)[:, None]
+        d_points = scale * (control_points[i + 1] - control_points[i])
+
+        num_knots = np.diff(knot_offsets)
+        knot_curve = np.repeat(np.arange(len(num_knots)), num_knots)
+        knot_local = np.arange(len(knots)) - knot_offsets[knot_curve]
+        # Drop the first and last knot of every curve
+        inner = (knot_local > 0) & (knot_local < num_knots[knot_curve] - 1)
+        return (d_points, CurveMath.curve_offsets(counts - 1),
+                knots[inner], CurveMath.curve_offsets(num_knots - 2))
+
+    @classmethod
+    def fit_nurbs(cls, control_points, counts, orders, knots, weights=None, ranges=None):
+        '''Rational B-splines with authored knots (NurbsCurves), as a callable curve(u, derivative=0, curve_idx=None).
+
+        The points are lifted to homogeneous coordinates (w * P, w) so the rational curves and their
+        derivative splines evaluate with eval_bspline_batch, one batch per order, and are projected
+        back with the quotient rule. u in [0, 1] spans the range of every curve (ranges, or the
+        knot domain where a range is missing or NaN).
+        '''
+        control_points = np.asarray(control_points, dtype=np.float64)
+        counts = np.asarray(counts, dtype=int)
+        orders = np.asarray(orders, dtype=int)
+        knots = np.asarray(knots, dtype=np.float64)
+        weights = np.ones(len(control_points)) if weights is None else np.asarray(weights, dtype=np.float64)
+        degrees = orders - 1
+
+        knot_offsets = CurveMath.curve_offsets(counts + orders)
+        lo = knots[knot_offsets[:-1] + degrees]
+        hi = knots[knot_offsets[:-1] + counts]
+        if ranges is not None:
+            ranges = np.asarray(ranges, dtype=np.float64).reshape(-1, 2)
+            lo = np.where(np.isnan(ranges[:, 0]), lo, np.clip(ranges[:, 0], lo, hi))
+            hi = np.where(np.isnan(ranges[:, 1]), hi, np.clip(ranges[:, 1], lo, hi))
+
+        homogeneous = np.hstack((control_points * weights[:, None], weights[:, None]))
+        point_curve = np.repeat(np.arange(len(counts)), counts)
+        knot_curve = np.repeat(np.arange(len(counts)), counts + orders)
+        # Index of every curve inside the batch of its degree
+        local = np.zeros(len(counts), dtype=int)
+        splines = {}
+        for degree in np.unique(degrees):
+            group = degrees == degree
+            local[group] = np.arange(np.count_nonzero(group))
+            splines[degree] = [(homogeneous[group[point_curve]], CurveMath.curve_offsets(counts[group]),
+                                knots[group[knot_curve]], CurveMath.curve_offsets(counts[group] + degree + 1), degree)]
+            for order in range(1, min(degree, 2) + 1):
+                splines[degree].append(CurveMath.bspline_derivative_batch(*splines[degree][-1][:5]) + (degree - order,))
+
+        def curve(u, derivative=0, curve_idx=None):
+            u = np.asarray(u, dtype=np.float64)
+            if curve_idx is None:
+                curve_idx = np.zeros(len(u), dtype=int)
+            width = (hi - lo)[curve_idx]
+            t = lo[curve_idx] + np.clip(u, 0, 1) * width
+            # Homogeneous position and derivatives in the knot domain
+            h = np.zeros((derivative + 1, len(u), 4))
+            for degree, batches in splines.items():
+                sel = degrees[curve_idx] == degree
+                if not sel.any():
+                    continue
+                for order in range(min(derivative, degree) + 1):
+                    h[order, sel] = CurveMath.eval_bspline_batch(*batches[order], local[curve_idx[sel]], t[sel])
+            w = h[:, :, 3:]
+            c0 = h[0, :, :3] / w[0]
+            if derivative == 0:
+                return c0
+            c1 = (h[1, :, :3] - w[1] * c0) / w[0]
+            if derivative == 1:
+                return c1 * width[:, None]
+            c2 = (h[2, :, :3] - 2 * w[1] * c1 - w[2] * c0) / w[0]
+            return c2 * width[:, None]**2
+        return curve
+
+    @classmethod
+    def join_curves(cls, groups):
+        '''One curve(u, derivative=0, curve_idx=None) over curves fitted in separate groups.
+
+        groups: list of (boolean mask over all curves, curve fitted on the masked curves in order)
+        '''
+        num_curves = len(groups[0][0])
+        group_of = np.zeros(num_curves, dtype=int)
+        local = np.zeros(num_curves, dtype=int)
+        for g, (mask, _) in enumerate(groups):
+            group_of[mask] = g
+            local[mask] = np.arange(np.count_nonzero(mask))
+
+        def curve(u, derivative=0, curve_idx=None):
+            u = np.asarray(u, dtype=np.float64)
+            if curve_idx is None:
+                curve_idx = np.zeros(len(u), dtype=int)
+            result = np.empty((len(u), 3))
+            for g, (_, fitted) in enumerate(groups):
+                sel = group_of[curve_idx] == g
+                if sel.any():
+                    result[sel] = fitted(u[sel], derivative, local[curve_idx[sel]])
+            return result
+        return curve
+
+    @classmethod
+    def fit_bspline(cls, control_points):
+        '''Build a clamped uniform cubic scipy BSpline over the control points, parameterized on [0, 1].'''
+        # SciPy is slow to import and only needed here, fit_curve evaluates B-splines itself
+        try:
+            from scipy.interpolate import BSpline
+        except ImportError as e:
+            raise ImportError("fit_bspline needs SciPy, enable omni.pip.compute or use fit_curve") from e
+        k = 3 # degree of the spline
+        t = np.linspace(0, 1, len(control_points) - k + 1, endpoint=True)
+        t = np.append(np.zeros(k), t)
+        t = np.append(t, np.ones(k))
+        return BSpline(t, control_points, k)
+
+    @classmethod
+    def create_bspline(cls, control_points, sampling_resolution):
+        '''Create a continuous cubic BSpline curve from a list of control points.'''
+        spl = CurveMath.fit_bspline(control_points)
+
+        #### If not using evenly distributed points, can just return this
+        # tnew = np.linspace(0, 1, num_points)
+        # interpolated_points = spl(tnew)
+        # return interpolated_points
+        
+        # Calculate the total arc length of the spline
+        fine_t = np.linspace(0, 1, sampling_resolution)
+        curve_points = spl(fine_t)
+        
+        return curve_points
+
+    @classmethod
+    def basis_spec(cls, curve_type, num_curves, spec=None):
+        '''Per-curve UsdGeomBasisCurves type, basis and wrap of a curve type, as a dict of string arrays.
+
+        CURVE.Prim takes them from spec (the attributes of the curve prims, one value per curve or
+        one for all, missing keys use the USD fallbacks), Bezier and Linear are the nonperiodic
+        cubic Bezier and linear curves.
+        Curves of NurbsCurves prims have the type 'nurbs', their order (per curve), knots (of the
+        nurbs curves, concatenated), weights (per point) and ranges (per curve) are passed through.
+        '''
+        if curve_type == CURVE.Bezier:
+            spec = {'type': 'cubic', 'basis': 'bezier', 'wrap': 'nonperiodic'}
+        elif curve_type == CURVE.Linear:
+            spec = {'type': 'linear', 'basis': 'bezier', 'wrap': 'nonperiodic'}
+        elif curve_type != CURVE.Prim:
+            raise NotImplementedError(f"Curve type {curve_type} has no basis")
+        spec = dict(BASIS_DEFAULTS, **(spec or {}))
+        basis = {k: np.array(np.broadcast_to(np.asarray(spec[k], dtype=str), (num_curves,))) for k in BASIS_DEFAULTS}
+        basis.update((k, np.asarray(v)) for k, v in spec.items() if k not in BASIS_DEFAULTS)
+        return basis
+
+    @classmethod
+    def select_curves(cls, control_points, counts, spec, mask):
+        '''Control points, counts and spec (see basis_spec) of the curves selected by a boolean mask.'''
+        counts = np.asarray(counts, dtype=int)
+        point_curve = np.repeat(np.arange(len(counts)), counts)
+        selected = {k: v[mask] for k, v in spec.items() if k not in ('knots', 'weights')}
+        if 'weights' in spec:
+            selected['weights'] = spec['weights'][mask[point_curve]]
+        if 'knots' in spec:
+            knot_counts = np.where(spec['type'] == 'nurbs', counts + spec['order'], 0)
+            selected['knots'] = spec['knots'][mask[np.repeat(np.arange(len(counts)), knot_counts)]]
+        return np.asarray(control_points)[mask[point_curve]], counts[mask], selected
+
+    @classmethod
+    def repeat_spec(cls, spec, repeats):
+        '''The spec (see basis_spec) of the same curves laid out repeats times one after another.'''
+        if spec is None:
+            return None
+        return {k: np.concatenate([np.asarray(v)] * repeats) for k, v in spec.items()}
+
+    @classmethod
+    def basis_segment_counts(cls, counts, spec):
+        '''Number of segments of every curve, as UsdGeomBasisCurves defines them for its type, basis and wrap.'''
+        counts = np.asarray(counts, dtype=int)
+        periodic = spec['wrap'] == 'periodic'
+        if_bezier = np.where(periodic, counts // 3, (counts - 1) // 3)
+        # bspline and catmullRom step one point per segment, pinned adds a phantom point at each end
+        if_step_one = np.where(periodic, counts, np.where(spec['wrap'] == 'pinned', counts - 1, counts - 3))
+        cubic = np.where(spec['basis'] == 'bezier', if_bezier, if_step_one)
+        num_segments = np.where(spec['type'] == 'linear', np.where(periodic, counts, counts - 1), cubic)
+        if 'order' in spec:
+            # Spans between the knots of a clamped NURBS curve
+            num_segments = np.where(spec['type'] == 'nurbs', counts - spec['order'] + 1, num_segments)
+        return np.maximum(num_segments, 0)
+
+    @classmethod
+    def usable_curves(cls, counts, spec):
+        '''Mask of the curves with at least one segment and a basis that can be evaluated.'''
+        counts = np.asarray(counts, dtype=int)
+        linear = spec['type'] == 'linear'
+        usable = ((CurveMath.basis_segment_counts(counts, spec) > 0) & (counts >= 2)
+                  & (linear | (spec['wrap'] != 'periodic') | (counts >= 3))
+                  & (linear | np.isin(spec['basis'], list(BASIS_MATRICES))))
+        if 'order' in spec:
+            usable &= (spec['type'] != 'nurbs') | (spec['order'] >= 2)
+        return usable
+
+    @classmethod
+    def basis_segment_coefficients(cls, control_points, counts, curve_type='cubic', basis='bezier', wrap='nonperiodic'):
+        '''Power-basis coefficients of the segments of curves that share one type, basis and wrap.
+
+        Segment s is p(t) = sum(coeffs[s, k] * t**k) for t in [0, 1], the segment points are
+        picked as Hydra does (periodic curves wrap around, pinned bspline and catmullRom curves get
+        a phantom point 2 * P0 - P1 before the first and after the last point) and multiplied by
+        the basis matrix once, so evaluation is a single cubic polynomial per parameter.
+        Returns (coeffs (S, 4, 3), segment offsets per curve).
+        '''
+        control_points = np.asarray(control_points, dtype=np.float64)
+        counts = np.asarray(counts, dtype=int)
+        spec = {'type': curve_type, 'basis': basis, 'wrap': wrap}
+        num_segments = CurveMath.basis_segment_counts(counts, spec)
+        seg_offsets = CurveMath.curve_offsets(num_segments)
+        seg_curve = np.repeat(np.arange(len(counts)), num_segments)
+        seg_local = np.arange(seg_offsets[-1]) - seg_offsets[seg_curve]
+
+        if curve_type == 'linear':
+            idx = seg_local[:, None] + np.arange(2)
+            if wrap == 'periodic':
+                idx %= counts[seg_curve][:, None]
+            points = control_points[idx + CurveMath.curve_offsets(counts)[seg_curve][:, None]]
+            coeffs = np.zeros((len(points), 4, 3))
+            coeffs[:, 0] = points[:, 0]
+            coeffs[:, 1] = points[:, 1] - points[:, 0]
+            return coeffs, seg_offsets
+
+        if wrap == 'pinned' and basis != 'bezier':
+            point_offsets = CurveMath.curve_offsets(counts)
+            ext_offsets = CurveMath.curve_offsets(counts + 2)
+            point_curve = np.repeat(np.arange(len(counts)), counts)
+            extended = np.empty((ext_offsets[-1], 3))
+            extended[np.arange(len(control_points)) + 2 * point_curve + 1] = control_points
+            first, last = point_offsets[:-1], point_offsets[1:] - 1
+            extended[ext_offsets[:-1]] = 2 * control_points[first] - control_points[first + 1]
+            extended[ext_offsets[1:] - 1] = 2 * control_points[last] - control_points[last - 1]
+            control_points, counts = extended, counts + 2
+
+        step = 3 if basis == 'bezier' else 1
+        idx = step * seg_local[:, None] + np.arange(4)
+        if wrap == 'periodic':
+            idx %= counts[seg_curve][:, None]
+        points = control_points[idx + CurveMath.curve_offsets(counts)[seg_curve][:, None]]
+        # Rows of the basis matrix go from t**3 down to 1, coefficients from 1 up to t**3
+        return np.einsum('kj,sjd->skd', BASIS_MATRICES[basis][::-1], points), seg_offsets
+
+    @classmethod
+    def basis_coefficients(cls, control_points, counts, spec):
+        '''Segment coefficients of curves that each have their own type, basis and wrap (see basis_spec).
+
+        Curves sharing a combination are batched together, the segments of all curves are then laid
+        out in curve order. Returns (coeffs (S, 4, 3), segment offsets per curve).
+        '''
+        control_points = np.asarray(control_points, dtype=np.float64)
+        counts = np.asarray(counts, dtype=int)
+        num_segments = CurveMath.basis_segment_counts(counts, spec)
+        seg_offsets = CurveMath.curve_offsets(num_segments)
+        coeffs = np.empty((seg_offsets[-1], 4, 3))
+        point_curve = np.repeat(np.arange(len(counts)), counts)
+
+        combos = np.stack((spec['type'], spec['basis'], spec['wrap']), axis=1)
+        for combo in np.unique(combos, axis=0):
+            group = (combos == combo).all(axis=1)
+            group_coeffs, group_offsets = CurveMath.basis_segment_coefficients(
+                control_points[group[point_curve]], counts[group], *combo)
+            # Segment s of the group's curve c goes to the same segment of the curve in the full layout
+            curves = np.flatnonzero(group)
+            seg_group = np.repeat(np.arange(len(curves)), num_segments[curves])
+            seg_local = np.arange(len(group_coeffs)) - group_offsets[seg_group]
+            coeffs[seg_offsets[curves][seg_group] + seg_local] = group_coeffs
+        return coeffs, seg_offsets
+
+    @classmethod
+    def eval_coefficients(cls, coeffs, u, derivative=0, seg_offsets=None, curve_idx=None):
+        '''Evaluate stacked (S, 4, 3) power-basis segments (see basis_segment_coefficients) at u in [0, 1] of each curve.
+
+        seg_offsets / curve_idx: segment offsets of every curve and the curve of every parameter,
+        without them all segments form a single curve.
+        '''
+        u = np.asarray(u, dtype=np.float64)
+        if seg_offsets is None:
+            seg_offsets = np.array([0, len(coeffs)])
+        if curve_idx is None:
+            curve_idx = np.zeros(len(u), dtype=int)
+        first = seg_offsets[curve_idx]
+        num_segments = seg_offsets[curve_idx + 1] - first
+
+        u = np.clip(u, 0, 1) * num_segments
+        # The last segment owns u == 1
+        seg_idx = np.minimum(np.floor(u).astype(int), num_segments - 1)
+        t = (u - seg_idx)[:, None]
+        c = coeffs[first + seg_idx]
+        # Horner in place, one result array whatever the derivative
+        if derivative == 0:
+            result = c[:, 3] * t
+            result += c[:, 2]
+            result *= t
+            result += c[:, 1]
+            result *= t
+            result += c[:, 0]
+            return result
+        if derivative == 1:
+            result = c[:, 3] * (3 * t)
+            result += 2 * c[:, 2]
+            result *= t
+            result += c[:, 1]
+        elif derivative == 2:
+            result = c[:, 3] * (6 * t)
+            result += 2 * c[:, 2]
+        else:
+            result = 6 * c[:, 3] if derivative == 3 else np.zeros_like(c[:, 0])
+        # Chain rule, every segment spans 1 / num_segments of u
+        result *= (num_segments**derivative)[:, None]
+        return result
+
+    @classmethod
+    def sample_params(cls, control_points, sampling_resolution, curve_type=CURVE.Bspline):
+        '''Global curve parameter u of every point returned by create_bezier / create_bspline.'''
+        t = np.linspace(0, 1, sampling_resolution)
+        if curve_type != CURVE.Bezier:
+            return t
+
+        num_segments = len(CurveMath.bezier_segments(control_points))
+        if num_segments == 0 or len(t) == 0:
+            return np.empty(0)
+        u = (np.arange(num_segments)[:, None] + t[1:]) / num_segments
+        return np.concatenate((t[:1], u.ravel()))
+
+    @classmethod
+    def fit_curve(cls, control_points, curve_type=CURVE.Bspline, counts=None, spec=None):
+        '''Fit the curves once and return them as a callable curve(u, derivative=0, curve_idx=None).
+
+        counts splits the control points into several curves (curveVertexCounts), all of them are
+        evaluated together, u in [0, 1] along each curve and curve_idx the curve of every parameter.
+        spec: type, basis and wrap of every curve for CURVE.Prim (see basis_spec)
+        BSpline is the clamped B-spline through the end points, NURBS curves use their own knots
+        and weights and the other types are evaluated segment by segment with the basis matrices
+        Hydra draws them with.
+        '''
+        control_points = np.asarray(control_points, dtype=np.float64)
+        if counts is None:
+            counts = [len(control_points)]
+
+        if curve_type in (CURVE.Bezier, CURVE.Linear, CURVE.Prim):
+            spec = CurveMath.basis_spec(curve_type, len(counts), spec)
+            nurbs = spec['type'] == 'nurbs'
+            if nurbs.all():
+                return CurveMath.fit_nurbs(control_points, counts, spec['order'], spec['knots'],
+                                           spec.get('weights'), spec.get('ranges'))
+            if nurbs.any():
+                # NURBS and basis curves are fitted apart and evaluated through one callable
+                groups = []
+                for mask in (~nurbs, nurbs):
+                    points, group_counts, group_spec = CurveMath.select_curves(control_points, counts, spec, mask)
+                    groups.append((mask, CurveMath.fit_curve(points, curve_type, group_counts, group_spec)))
+                return CurveMath.join_curves(groups)
+            coeffs, seg_offsets = CurveMath.basis_coefficients(control_points, counts, spec)
+
+            def curve(u, derivative=0, curve_idx=None):
+                return CurveMath.eval_coefficients(coeffs, u, derivative, seg_offsets, curve_idx)
+        elif curve_type == CURVE.Bspline:
+            degree = 3
+            knots, knot_offsets = CurveMath.clamped_uniform_knots(counts, degree)
+            splines = [(control_points, CurveMath.curve_offsets(counts), knots, knot_offsets, degree)]
+            for order in (1, 2):
+                splines.append(CurveMath.bspline_derivative_batch(*splines[-1]) + (degree - order,))
+
+            def curve(u, derivative=0, curve_idx=None):
+                u = np.asarray(u, dtype=np.float64)
+                if curve_idx is None:
+                    curve_idx = np.zeros(len(u), dtype=int)
+                return CurveMath.eval_bspline_batch(*splines[derivative], curve_idx, u)
+        else:
+            raise NotImplementedError(f"Curve type {curve_type} not implemented")
+        return curve
+
+    @classmethod
+    def evaluate(cls, control_points, u, curve_type=CURVE.Bspline):
+        '''Evaluate the curve defined by the control points at global parameters u in [0, 1].'''
+        return CurveMath.fit_curve(control_points, curve_type)(u)
+
+    @classmethod
+    def derivative(cls, control_points, u, curve_type=CURVE.Bspline, order=1):
+        '''Closed form derivative of the curve with respect to u, evaluated at every parameter.'''
+        return CurveMath.fit_curve(control_points, curve_type)(u, order)
+
+    @classmethod
+    def tangents(cls, control_points, u, curve_type=CURVE.Bspline, curvature=False):
+        '''Unit tangents (N, 3) at the parameters u, and the curvature (N,) when curvature=True.'''
+        return CurveMath.curve_tangents(CurveMath.fit_curve(control_points, curve_type), u, curvature)
+
+    @classmethod
+    def curve_tangents(cls, curve, u, curvature=False, curve_idx=None):
+        '''Unit tangents of a fitted curve at the parameters u, and the curvature when curvature=True.
+
+        Where the first derivative vanishes (coincident control points) the tangent is the
+        direction of the second derivative, which is the limit of the tangent there, reversed at
+        the end of the curve where that limit is taken from behind.
+        '''
+        u = np.asarray(u, dtype=np.float64)
+        first = curve(u, 1, curve_idx)
+        speed = np.linalg.norm(first, axis=1)
+        stalled = speed < 1e-9 * max(speed.max(initial=0), 1)
+        if not curvature:
+            # The second derivative is only evaluated where it is needed
+            if stalled.any():
+                second = curve(u[stalled], 2, None if curve_idx is None else np.asarray(curve_idx)[stalled])
+                first[stalled] = np.where(u[stalled, None] >= 1, -second, second)
+            return CurveMath.normalize(first)
+
+        second = curve(u, 2, curve_idx)
+        limit = np.where(u[:, None] >= 1, -second, second)
+        tangents = CurveMath.normalize(np.where(stalled[:, None], limit, first))
+
+        kappa = np.divide(np.linalg.norm(np.cross(first, second), axis=1), speed**3,
+                          out=np.zeros_like(speed), where=~stalled)
+        return tangents, kappa
+
+    @classmethod
+    def span_params(cls, control_points, curve_type=CURVE.Bspline, counts=None, spec=None):
+        '''Parameters u where the polynomial spans of every curve begin and end.
+
+        Returns (u, curve index) sorted by curve then u, including 0 and 1 of every curve.
+        '''
+        if counts is None:
+            counts = [len(control_points)]
+        counts = np.asarray(counts, dtype=int)
+        if curve_type == CURVE.Bspline:
+            num_spans = counts - 3
+        else:
+            num_spans = CurveMath.basis_segment_counts(counts, CurveMath.basis_spec(curve_type, len(counts), spec))
+        num_spans = np.maximum(num_spans, 1)
+
+        span_curve = np.repeat(np.arange(len(counts)), num_spans + 1)
+        local = np.arange(len(span_curve)) - CurveMath.curve_offsets(num_spans + 1)[span_curve]
+        return local / num_spans[span_curve], span_curve
+
+    @classmethod
+    def adaptive_samples(cls, control_points, tolerance, curve_type=CURVE.Bspline,
+                         initial_subdivisions=4, max_depth=16, counts=None, spec=None):
+        '''Sample the curves so the polyline through the samples stays within tolerance (scene units) of them.
+
+        Every span starts with a few intervals, then each level evaluates the midpoints of all
+        open intervals of all curves in one batch and keeps splitting only the intervals whose
+        midpoint is further than tolerance from the chord midpoint.
+        Returns (u, curve index, points) sorted by curve then u.
+        '''
+        curve = CurveMath.fit_curve(control_points, curve_type, counts, spec)
+        spans, span_curve = CurveMath.span_params(control_points, curve_type, counts, spec)
+
+        # Split every span evenly, the last breakpoint of each curve stays as is
+        steps = np.linspace(0, 1, initial_subdivisions + 1)[:-1]
+        inner = span_curve[1:] == span_curve[:-1]
+        start, width = spans[:-1][inner], np.diff(spans)[inner]
+        u = (start[:, None] + width[:, None] * steps).ravel()
+        curve_idx = np.repeat(span_curve[:-1][inner], initial_subdivisions)
+        ends = np.flatnonzero(np.append(~inner, True))
+        insert_at = np.searchsorted(curve_idx, span_curve[ends], side='right')
+        u = np.insert(u, insert_at, spans[ends])
+        curve_idx = np.insert(curve_idx, insert_at, span_curve[ends])
+
+        points = curve(u, 0, curve_idx)
+        # Intervals between samples of the same curve, never across two curves
+        open_intervals = curve_idx[1:] == curve_idx[:-1]
+
+        for _ in range(max_depth):
+            idx = np.flatnonzero(open_intervals)
+            if len(idx) == 0:
+                break
+            mid_u = 0.5 * (u[idx] + u[idx + 1])
+            mid_curve = curve_idx[idx]
+            mid_points = curve(mid_u, 0, mid_curve)
+            error = np.linalg.norm(mid_points - 0.5 * (points[idx] + points[idx + 1]), axis=1)
+            split = error > tolerance
+
+            # Keep every evaluated midpoint, only the halves of inaccurate intervals stay open
+            u = np.insert(u, idx + 1, mid_u)
+            curve_idx = np.insert(curve_idx, idx + 1, mid_curve)
+            points = np.insert(points, idx + 1, mid_points, axis=0)
+            open_intervals = np.insert(open_intervals, idx + 1, split)
+            open_intervals[idx + np.arange(len(idx))] = split
+
+        return u, curve_idx, points
+
+    @classmethod
+    def uniform_samples(cls, control_points, sampling_resolution, curve_type=CURVE.Bspline, counts=None, spec=None):
+        '''Sample every curve uniformly in u, per curve for BSpline and per segment for the other types.
+
+        Returns (u, curve index, points) sorted by curve then u.
+        '''
+        curve = CurveMath.fit_curve(control_points, curve_type, counts, spec)
+        if counts is None:
+            counts = [len(control_points)]
+        counts = np.asarray(counts, dtype=int)
+        t = np.linspace(0, 1, sampling_resolution)
+
+        if curve_type != CURVE.Bspline:
+            # Same layout as create_bezier, the shared endpoint of neighboring segments is kept once
+            spec = CurveMath.basis_spec(curve_type, len(counts), spec)
+            num_segments = np.maximum(CurveMath.basis_segment_counts(counts, spec), 1)
+            per_curve = 1 + num_segments * (len(t) - 1)
+            curve_idx = np.repeat(np.arange(len(counts)), per_curve)
+            local = np.arange(len(curve_idx)) - CurveMath.curve_offsets(per_curve)[curve_idx]
+            seg, step = np.divmod(local - 1, len(t) - 1)
+            u = np.where(local == 0, 0.0, (seg + t[1:][step]) / num_segments[curve_idx])
+        else:
+            u = np.tile(t, len(counts))
+            curve_idx = np.repeat(np.arange(len(counts)), len(t))
+        return u, curve_idx, curve(u, 0, curve_idx)
+
+    @classmethod
+    def sample_curve(cls, control_points, curve_type=CURVE.Bspline, sampling_resolution=0,
+                     tolerance=DEFAULT_TOLERANCE, counts=None, spec=None):
+        '''Fine samples (u, curve index, points) of the curves, uniform in u if sampling_resolution is set, else adaptive.'''
+        if sampling_resolution > 1:
+            return CurveMath.uniform_samples(control_points, sampling_resolution, curve_type, counts, spec)
+        if tolerance <= 0: tolerance = DEFAULT_TOLERANCE
+        return CurveMath.adaptive_samples(control_points, tolerance, curve_type, counts=counts, spec=spec)
+
+    @classmethod
+    def normalize(cls, vectors, out=None):
+        '''Normalize an (N, 3) array of vectors, leaving zero-length vectors at zero instead of NaN.
+
+        out: optional array for the result, vectors itself normalizes in place
+        '''
+        norms = np.sqrt(np.einsum('...i,...i->...', vectors, vectors))[..., None]
+        if out is None:
+            out = np.zeros_like(vectors)
+        return np.divide(vectors, norms, out=out, where=norms > 0)
+
+    @classmethod
+    def arc_length_table(cls, fine_points, fine_curve=None):
+        '''Cumulative arc length at every sample of a polyline, starting at 0.
+
+        With fine_curve the samples hold several curves laid end to end, the jump from the end of
+        one curve to the start of the next adds no length.
+        '''
+        distances = np.linalg.norm(np.diff(fine_points, axis=0), axis=1)
+        if fine_curve is not None:
+            distances[fine_curve[1:] != fine_curve[:-1]] = 0
+        return np.concatenate(([0.0], np.cumsum(distances)))
+
+    @classmethod
+    def arc_length_params(cls, cumulative_lengths, fine_u, target_lengths, first=None, last=None):
+        '''Curve parameter u at every target arc length, interpolated inside the fine sample holding it.
+
+        first / last: per target, the first and last fine sample of its curve, so targets never
+        interpolate across the jump between two curves.
+        '''
+        if first is None:
+            first = 0
+        if last is None:
+            last = len(cumulative_lengths) - 1
+        # Locate the fine segment holding each target length and how far along it the target is
+        seg_idx = np.searchsorted(cumulative_lengths, target_lengths, side='right') - 1
+        seg_idx = np.clip(seg_idx, first, np.asarray(last) - 1)
+        seg_start = cumulative_lengths[seg_idx]
+        seg_len = cumulative_lengths[seg_idx + 1] - seg_start
+        frac = np.divide(target_lengths - seg_start, seg_len, out=np.zeros_like(seg_len), where=seg_len > 0)
+        frac = np.clip(frac, 0, 1)
+        return fine_u[seg_idx] + frac * (fine_u[seg_idx + 1] - fine_u[seg_idx])
+
+    @classmethod
+    def distribute_lengths(cls, cumulative_lengths, sample_offsets, num_points, per_curve=False, start=0, stop=None,
+                           periodic=None, group_size=None):
+        '''Target arc lengths and their curve index, evenly spaced along each curve or along all curves.
+
+        per_curve: bool, num_points on every curve instead of num_points over the total length
+        start / stop: only the targets [start, stop) of the whole distribution
+        periodic: bool per curve, closed curves end where they start, so their last target stops
+                  one step short of the end instead of doubling the first one
+        group_size: int, spread num_points over every run of group_size curves (the curves of one
+                    frame of an animation) instead of over all curves, per_curve is a group size of 1
+        '''
+        curve_start = cumulative_lengths[sample_offsets[:-1]]
+        curve_end = cumulative_lengths[sample_offsets[1:] - 1]
+        if periodic is None:
+            periodic = np.zeros(len(curve_start), dtype=bool)
+        if per_curve:
+            group_size = 1
+        elif group_size is None:
+            group_size = len(curve_start)
+        if stop is None:
+            stop = num_points * (len(curve_start) // group_size)
+
+        group, local = np.divmod(np.arange(start, stop), num_points)
+        first_curve = group * group_size
+        last_curve = first_curve + group_size - 1
+        step = 1 / np.maximum(num_points - 1 + periodic[last_curve], 1)
+        group_start = curve_start[first_curve]
+        target_lengths = group_start + (curve_end[last_curve] - group_start) * (local * step)
+        if group_size == 1:
+            return target_lengths, first_curve
+        # A target on the seam between two curves goes to the start of the later one
+        target_curve = np.searchsorted(curve_start, target_lengths, side='right') - 1
+        return target_lengths, np.clip(target_curve, first_curve, last_curve)
+
+    @classmethod
+    def packed_lengths(cls, samples, footprint, gap=0.0, num_points=0, per_curve=False):
+        '''Target arc lengths and their curve index packing copies of a given footprint along sampled curves.
+
+        Copies are laid one footprint plus gap apart from the start of every curve as long as they
+        fit, then shifted along their curve until the straight distance to the previous copy is
+        a footprint plus gap, so copies do not cut into each other on tight bends. Copies that
+        still overlap an earlier one (the curve loops back, a closed curve meets its start or
+        another curve passes by) are culled, see cull_overlaps.
+        footprint: float, size of a copy along the curve, every copy is treated as a sphere that wide
+        gap: float, extra distance between consecutive copies
+        num_points: int, at most num_points copies (on every curve with per_curve), 0 fills the curves
+        '''
+        cumulative_lengths = samples['lengths']
+        sample_offsets = samples['sample_offsets']
+        footprint = float(footprint)
+        if footprint <= 0:
+            raise ValueError("The footprint of the copies must be positive")
+        step = footprint + max(float(gap), 0.0)
+        curve_start = cumulative_lengths[sample_offsets[:-1]]
+        curve_end = cumulative_lengths[sample_offsets[1:] - 1]
+        fit = np.maximum(np.floor((curve_end - curve_start - footprint) / step + 1e-9).astype(int) + 1, 0)
+
+        curve_idx = np.repeat(np.arange(len(fit)), fit)
+        first = CurveMath.curve_offsets(fit)
+        local = np.arange(len(curve_idx)) - first[curve_idx]
+        target_lengths = curve_start[curve_idx] + footprint / 2 + local * step
+        follows = local > 0
+
+        def positions(lengths, curve_idx):
+            u = CurveMath.arc_length_params(cumulative_lengths, samples['fine_u'], lengths,
+                                            sample_offsets[curve_idx], sample_offsets[curve_idx + 1] - 1)
+            return samples['curve'](u, 0, curve_idx)
+
+        # Chords are shorter than arcs, push copies along the curve by the missing distance, most
+        # bends settle in a couple of passes, what is left over is culled below
+        points = positions(target_lengths, curve_idx)
+        for _ in range(16):
+            chords = np.zeros(len(points))
+            chords[1:] = np.linalg.norm(np.diff(points, axis=0), axis=1)
+            missing = np.where(follows, step - chords, 0)
+            short = missing > 1e-4 * step
+            if not short.any():
+                break
+            arcs = np.zeros(len(points))
+            arcs[1:] = np.diff(target_lengths)
+            shift = np.where(short, np.minimum(missing * arcs / np.maximum(chords, 1e-6 * step), step), 0)
+            # Every copy moves with the ones before it on its curve
+            shift = np.concatenate(([0], np.cumsum(shift)))
+            shift = shift[1:] - shift[first[:-1]][curve_idx]
+            target_lengths = target_lengths + shift
+            inside = target_lengths + footprint / 2 <= curve_end[curve_idx] + 1e-9 * step
+            target_lengths, curve_idx, follows = target_lengths[inside], curve_idx[inside], follows[inside]
+            points, moved = points[inside], shift[inside] > 0
+            # Only the copies that moved are evaluated again
+            points[moved] = positions(target_lengths[moved], curve_idx[moved])
+            first = CurveMath.curve_offsets(np.bincount(curve_idx, minlength=len(fit)))
+
+        keep = CurveMath.cull_overlaps(points, footprint / 2)
+        target_lengths, curve_idx = target_lengths[keep], curve_idx[keep]
+        if num_points > 0:
+            if per_curve:
+                first = CurveMath.curve_offsets(np.bincount(curve_idx, minlength=len(fit)))
+                keep = np.arange(len(curve_idx)) - first[curve_idx] < num_points
+                target_lengths, curve_idx = target_lengths[keep], curve_idx[keep]
+            else:
+                target_lengths, curve_idx = target_lengths[:num_points], curve_idx[:num_points]
+        return target_lengths, curve_idx
+
+    @classmethod
+    def overlap_pairs(cls, points, radii):
+        '''Every pair (i, j), i < j, of spheres that overlap, found with a uniform grid spatial hash.
+
+        The grid cells are as wide as the largest sphere, so only spheres in neighbouring cells are
+        compared and the search stays linear in the number of points for evenly sized copies.
+        radii: float or (N,) sphere radius of every point
+        Returns (i, j) index arrays.
+        '''
+        points = np.asarray(points, dtype=np.float64)
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), (len(points),))
+        empty = np.zeros(0, dtype=np.int64)
+        if len(points) < 2 or radii.max() <= 0:
+            return empty, empty
+        # Cells no smaller than a millionth of the extent keep the cell keys in int64
+        origin = points.min(axis=0)
+        cell = max(2 * radii.max(), np.ptp(points, axis=0).max() * 1e-6)
+        cells = np.floor((points - origin) / cell).astype(np.int64)
+        dims = cells.max(axis=0) + 3
+        keys = ((cells[:, 0] + 1) * dims[1] + cells[:, 1] + 1) * dims[2] + cells[:, 2] + 1
+
+        order = np.argsort(keys, kind='stable')
+        cell_keys, cell_start, cell_count = np.unique(keys[order], return_index=True, return_counts=True)
+        first, second = [], []
+        for offset in np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1]), axis=-1).reshape(-1, 3):
+            neighbour = keys + (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+            slot = np.minimum(np.searchsorted(cell_keys, neighbour), len(cell_keys) - 1)
+            found = np.flatnonzero(cell_keys[slot] == neighbour)
+            count = cell_count[slot[found]]
+            # Every point against every member of its neighbour cell
+            member = np.repeat(cell_start[slot[found]] - CurveMath.curve_offsets(count)[:-1], count) + \
+                np.arange(count.sum())
+            i, j = np.repeat(found, count), order[member]
+            close = i < j
+            first.append(i[close])
+            second.append(j[close])
+        i, j = np.concatenate(first), np.concatenate(second)
+        overlap = np.einsum('ij,ij->i', points[i] - points[j], points[i] - points[j]) < \
+            ((radii[i] + radii[j]) * (1 - 1e-3)) ** 2
+        return i[overlap], j[overlap]
+
+    @classmethod
+    def cull_overlaps(cls, points, radii):
+        '''Mask of the points kept when every sphere overlapping an earlier kept one is dropped.
+
+        The overlapping pairs come from overlap_pairs, only they are walked in order, so the cost
+        is the spatial hash plus the number of overlaps.
+        '''
+        i, j = CurveMath.overlap_pairs(points, radii)
+        keep = [True] * len(points)
+        order = np.lexsort((i, j))
+        for earlier, later in zip(i[order].tolist(), j[order].tolist()):
+            # Pairs come by their later point, so the earlier one is settled already
+            if keep[earlier]:
+                keep[later] = False
+        return np.array(keep, dtype=bool)
+
+    @classmethod
+    def curve_samples(cls, control_points, counts=None, curve_type=CURVE.Bspline, sampling_resolution=0,
+                      tolerance=DEFAULT_TOLERANCE, spec=None, stats=None):
+        '''Fitted curves, fine samples, arc-length table and sample tangents of ragged control points.
+
+        Every curve (one run of counts[c] points each) is fitted and sampled in one batch, the fine
+        samples of all curves are laid end to end and sample_offsets tells where each curve starts.
+        spec: type, basis and wrap of every curve for CURVE.Prim (see basis_spec)
+        stats: optional profiling.DistributeStats, times the fit and sample stages and counts the samples
+        Returns a dict with curve, control_points, counts, periodic, fine_u, fine_curve, fine_points,
+        sample_offsets, lengths and tangents.
+        '''
+        control_points = np.asarray(control_points, dtype=np.float64)
+        if counts is None:
+            counts = [len(control_points)]
+        counts = np.asarray(counts, dtype=int)
+        with zone('fit', stats):
+            curve = CurveMath.fit_curve(control_points, curve_type, counts, spec)
+        with zone('sample', stats):
+            fine_u, fine_curve, fine_points = CurveMath.sample_curve(control_points, curve_type,
+                                                                     sampling_resolution, tolerance, counts, spec)
+            sample_offsets = CurveMath.curve_offsets(np.bincount(fine_curve, minlength=len(counts)))
+            periodic = np.zeros(len(counts), dtype=bool)
+            if curve_type != CURVE.Bspline:
+                spec = CurveMath.basis_spec(curve_type, len(counts), spec)
+                # NURBS have no wrap, one that ends where it starts is a closed loop
+                gap = np.linalg.norm(fine_points[sample_offsets[1:] - 1] - fine_points[sample_offsets[:-1]], axis=1)
+                extent = np.ptp(fine_points, axis=0).max(initial=0)
+                periodic = (spec['wrap'] == 'periodic') | ((spec['type'] == 'nurbs') & (gap <= 1e-6 * max(extent, 1)))
+            lengths = CurveMath.arc_length_table(fine_points, fine_curve)
+            tangents = CurveMath.curve_tangents(curve, fine_u, curve_idx=fine_curve)
+        if stats is not None:
+            stats.samples += len(fine_u)
+        return {'curve': curve,
+                'control_points': control_points,
+                'counts': counts,
+                'periodic': periodic,
+                'fine_u': fine_u,
+                'fine_curve': fine_curve,
+                'fine_points': fine_points,
+                'sample_offsets': sample_offsets,
+                'lengths': lengths,
+                'tangents': tangents}
+
+    @classmethod
+    def closest_points(cls, samples, query_points, refine=2):
+        '''Closest point on the sampled curves to every query point, see CurveIndex.query.
+
+        The CurveIndex is built on the first query and kept in the samples dict, so later queries on
+        the same (cached) samples only pay for the search.
+        '''
+        index = samples.get('index')
+        if index is None:
+            index = samples['index'] = CurveIndex(samples)
+        return index.query(query_points, refine)
+
+    @classmethod
+    def distribute(cls, samples, num_points, per_curve=False, start=0, stop=None, group_size=None, targets=None):
+        '''Points evenly spaced by arc length along sampled curves (see curve_samples).
+
+        The fine samples form a cumulative length table, each target length is located with
+        searchsorted and linearly interpolated to a curve parameter u, so points land on the
+        target arc length instead of snapping to the nearest fine sample.
+        per_curve: bool, num_points on every curve instead of num_points spread over all curves
+        start / stop: only compute the points [start, stop) of the whole distribution
+        group_size: int, num_points on every run of group_size curves (see distribute_lengths)
+        targets: optional (target lengths, curve index) to place instead of even spacing, see packed_lengths
+        Returns (points, unit tangents, u, curve index).
+        '''
+        cumulative_lengths = samples['lengths']
+        sample_offsets = samples['sample_offsets']
+        if targets is not None:
+            target_lengths, curve_idx = (values[start:stop] for values in targets)
+        else:
+            target_lengths, curve_idx = CurveMath.distribute_lengths(cumulative_lengths, sample_offsets,
+                                                                     num_points, per_curve, start, stop,
+                                                                     samples.get('periodic'), group_size)
+        u = CurveMath.arc_length_params(cumulative_lengths, samples['fine_u'], target_lengths,
+                                        sample_offsets[curve_idx], sample_offsets[curve_idx + 1] - 1)
+
+        curve = samples['curve']
+        return curve(u, 0, curve_idx), CurveMath.curve_tangents(curve, u, curve_idx=curve_idx), u, curve_idx
+
+    @classmethod
+    def distribution_size(cls, samples, num_points, per_curve=False, group_size=None, targets=None):
+        '''Number of points distribute places along the sampled curves.'''
+        if targets is not None:
+            return len(targets[0])
+        if per_curve:
+            return num_points * len(samples['counts'])
+        return num_points * (len(samples['counts']) // group_size if group_size else 1)
+
+    @classmethod
+    def distribution_chunks(cls, samples, num_points, _forward_axis, per_curve=False, use_orient=False,
+                            follow_curve=False, up_vector=None, roll=0.0, num_prototypes=1,
+                            chunk_size=DEFAULT_CHUNK_SIZE, group_size=None, targets=None, variation=None,
+                            stats=None):
+        '''Generate the distribution chunk by chunk, so memory stays bounded however many copies there are.
+
+        Yields (start, positions (n, 3), quats (n, 4) or None without use_orient, prototype indices (n,),
+        scales (n, 3) or None without scale variation) for at most chunk_size copies at a time.
+        Rotation-minimizing frames carry over from one chunk to the next, so the chunks match a single
+        distribute + orientations call.
+        group_size: int, num_points on every run of group_size curves (see distribute_lengths), every
+                    group is one frame of the same copies, which vary the same way in every group
+        targets: optional (target lengths, curve index) to place instead of even spacing, see packed_lengths
+        variation: optional dict of VARIATION_DEFAULTS settings, see variations
+        stats: optional profiling.DistributeStats, times the place, vary and orient stages and holds
+               the arrays of the current chunk
+        '''
+        num_copies = CurveMath.distribution_size(samples, num_points, per_curve, group_size, targets)
+        num_groups = len(samples['counts']) // group_size if group_size and not targets else 1
+        copies_per_group = max(num_copies // max(num_groups, 1), 1)
+        framed = use_orient and (follow_curve or up_vector is not None)
+        forward_vector = CurveMath.normalize(np.asarray(_forward_axis, dtype=np.float64))
+        object_up = CurveMath.perpendicular(forward_vector[None], default_up(_forward_axis))
+        previous = None
+        for start in range(0, num_copies, chunk_size):
+            stop = min(start + chunk_size, num_copies)
+            with zone('place', stats):
+                points, dirs, _, curve_idx = CurveMath.distribute(samples, num_points, per_curve, start, stop,
+                                                                  group_size, targets)
+            index = np.arange(start, stop) % copies_per_group
+            proto_indices = (index % max(num_prototypes, 1)).astype(np.int32)
+            rolls = np.radians(roll)
+            scales = None
+            if variation is not None:
+                with zone('vary', stats):
+                    varied = CurveMath.variations(variation, index, dirs, num_prototypes, up_vector)
+                proto_indices, scales = varied['prototypes'], varied['scales']
+                if varied['offsets'] is not None:
+                    points = points + varied['offsets']
+                if varied['rolls'] is not None:
+                    rolls = rolls + np.radians(varied['rolls'])
+            quats = None
+            if use_orient:
+                with zone('orient', stats):
+                    quats = CurveMath.orientations(dirs, _forward_axis, follow_curve, up_vector, 0.0, curve_idx,
+                                                   previous)
+                    if framed:
+                        # Frame of the last copy, the next chunk continues the transport from it
+                        previous = (dirs[-1], CurveMath.quat_rotate(quats[-1:], object_up)[0], curve_idx[-1])
+                    if np.any(rolls):
+                        quats = CurveMath.quat_multiply(quats, CurveMath.axis_angle_quats(_forward_axis, rolls))
+            if stats is not None:
+                stats.hold('chunk', points, dirs, curve_idx, quats, proto_indices, scales)
+            yield start, points, quats, proto_indices, scales
+
+    @classmethod
+    def random_stream(cls, seed, stream, start, stop, width=1):
+        '''Uniform values in [0, 1) of the copies [start, stop) in one random stream, shape (n, width).
+
+        The PCG64 generator of the stream jumps straight to the first copy, so a copy always gets
+        the same values for a seed however the distribution is chunked and however many copies follow.
+        '''
+        bit_generator = np.random.PCG64(np.random.SeedSequence(int(seed), spawn_key=(stream,)))
+        bit_generator.advance(int(start) * width)
+        return np.random.Generator(bit_generator).random((int(stop) - int(start), width))
+
+    @classmethod
+    def variations(cls, variation, index, dirs=None, num_prototypes=1, up_vector=None):
+        '''Seeded source, jitter, scale and roll of the copies at index, all generated in one batch.
+
+        variation: dict of VARIATION_DEFAULTS settings, missing ones are off
+        index: (n,) copy indices, the values of a copy only depend on the seed and its index
+        dirs: (n, 3) curve tangents at the copies, needed for jitter. Jitter across the curve stays
+              in the plane of up_vector when given, else it is spread over a disk around the curve
+        Returns a dict with prototypes (n,) int32, offsets (n, 3), scales (n, 3) and rolls (n,) in
+        degrees, offsets, scales and rolls are None when they do not vary.
+        '''
+        settings = dict(VARIATION_DEFAULTS, **variation)
+        seed = settings['seed']
+        index = np.asarray(index, dtype=np.int64)
+        first, last = (int(index.min()), int(index.max()) + 1) if len(index) else (0, 0)
+
+        def uniform(stream, width=1):
+            return CurveMath.random_stream(seed, VARIATION_STREAMS[stream], first, last, width)[index - first]
+
+        num_prototypes = max(num_prototypes, 1)
+        if settings['weights'] is None:
+            prototypes = index % num_prototypes
+        else:
+            weights = np.asarray(settings['weights'], dtype=np.float64)
+            if len(weights) != num_prototypes or (weights < 0).any() or weights.sum() <= 0:
+                raise ValueError("Source weights need one non negative weight per source prim")
+            cumulative = np.cumsum(weights) / weights.sum()
+            prototypes = np.minimum(np.searchsorted(cumulative, uniform('prototype')[:, 0], side='right'),
+                                    num_prototypes - 1)
+
+        offsets = None
+        along, across = float(settings['jitter_along']), float(settings['jitter_across'])
+        if along or across:
+            dirs = CurveMath.normalize(np.asarray(dirs, dtype=np.float64))
+            values = uniform('jitter', 3)
+            offsets = (2 * values[:, :1] - 1) * along * dirs
+            if across:
+                normals = CurveMath.perpendicular(dirs, up_vector)
+                sides = np.cross(dirs, normals)
+                if up_vector is not None:
+                    offsets += (2 * values[:, 1:2] - 1) * across * sides
+                else:
+                    # Uniform over the disk of radius across around the curve
+                    radius = across * np.sqrt(values[:, 1:2])
+                    angle = 2 * np.pi * values[:, 2:]
+                    offsets += radius * (np.cos(angle) * normals + np.sin(angle) * sides)
+
+        scales = None
+        scale_min = np.asarray(settings['scale_min'], dtype=np.float64)
+        scale_max = np.asarray(settings['scale_max'], dtype=np.float64)
+        if (scale_min != 1).any() or (scale_max != 1).any():
+            scales = scale_min + uniform('scale', 3) * (scale_max - scale_min)
+
+        rolls = None
+        if settings['roll']:
+            rolls = (2 * uniform('roll')[:, 0] - 1) * float(settings['roll'])
+        return {'prototypes': prototypes.astype(np.int32), 'offsets': offsets, 'scales': scales, 'rolls': rolls}
+
+    @classmethod
+    def frame_distribution(cls, samples, num_points, num_frames, _forward_axis, per_curve=False, use_orient=False,
+                           follow_curve=False, up_vector=None, roll=0.0, num_prototypes=1, variation=None,
+                           stats=None):
+        '''Placement of every frame of curves sampled one frame after another (see CurveManager.frame_request).
+
+        Every frame gets its own distribution along its own curves, all frames computed in one batch.
+        Returns (positions (frames, copies, 3), quats (frames, copies, 4) or None without use_orient,
+        prototype indices (copies,), scales (copies, 3) or None), sources and scales do not change
+        over the frames.
+        stats: optional profiling.DistributeStats, see distribution_chunks
+        '''
+        group_size = len(samples['counts']) // num_frames
+        num_copies = CurveMath.distribution_size(samples, num_points, per_curve, group_size)
+        if num_copies == 0:
+            return (np.zeros((num_frames, 0, 3)), np.zeros((num_frames, 0, 4)) if use_orient else None,
+                    np.zeros(0, dtype=np.int32), None)
+        # A single chunk holding every frame
+        chunks = CurveMath.distribution_chunks(samples, num_points, _forward_axis, per_curve, use_orient, follow_curve,
+                                               up_vector, roll, num_prototypes, chunk_size=num_copies,
+                                               group_size=group_size, variation=variation, stats=stats)
+        _, positions, quats, proto_indices, scales = next(chunks)
+        per_frame = num_copies // num_frames
+        return (positions.reshape(num_frames, -1, 3), None if quats is None else quats.reshape(num_frames, -1, 4),
+                proto_indices[:per_frame], None if scales is None else scales[:per_frame])
+
+    @classmethod
+    def direction_quats(cls, _forward_axis, target_dirs):
+        '''Quaternions (w, x, y, z) rotating the forward axis onto every target direction, shape (N, 4).'''
+        forward_vector = CurveMath.normalize(np.asarray(_forward_axis, dtype=np.float64))
+        target_dirs = CurveMath.normalize(np.asarray(target_dirs, dtype=np.float64))
+        # Half-angle form: (1 + cos, sin * axis) normalizes to the shortest-arc rotation
+        quats = np.empty((len(target_dirs), 4))
+        quats[:, 0] = 1 + target_dirs @ forward_vector
+        quats[:, 1:] = np.cross(forward_vector, target_dirs)
+        # Antiparallel directions have no unique axis, turn half way around any perpendicular one
+        flipped = quats[:, 0] < 1e-8
+        if flipped.any():
+            helper = [0, 1, 0] if abs(forward_vector[1]) < 0.9 else [1, 0, 0]
+            quats[flipped] = np.append(0, np.cross(forward_vector, helper))
+        return CurveMath.normalize(quats)
+
+    @classmethod
+    def quat_multiply(cls, a, b, out=None, scratch=None):
+        '''Hamilton product of two (N, 4) quaternion arrays in (w, x, y, z) order.
+
+        out: optional (N, 4) array the product is written to, it must not overlap a or b; the
+             components are then accumulated in place without (N, 4) temporaries
+        scratch: optional (N,) array for the partial products with out, allocated when missing
+        '''
+        aw, ax, ay, az = np.moveaxis(a, -1, 0)
+        bw, bx, by, bz = np.moveaxis(b, -1, 0)
+        if out is None:
+            return np.stack((aw * bw - ax * bx - ay * by - az * bz,
+                             aw * bx + ax * bw + ay * bz - az * by,
+                             aw * by - ax * bz + ay * bw + az * bx,
+                             aw * bz + ax * by - ay * bx + az * bw), axis=-1)
+        if scratch is None:
+            scratch = np.empty(np.broadcast_shapes(aw.shape, bw.shape))
+        terms = (((aw, bw, 1), (ax, bx, -1), (ay, by, -1), (az, bz, -1)),
+                 ((aw, bx, 1), (ax, bw, 1), (ay, bz, 1), (az, by, -1)),
+                 ((aw, by, 1), (ax, bz, -1), (ay, bw, 1), (az, bx, 1)),
+                 ((aw, bz, 1), (ax, by, 1), (ay, bx, -1), (az, bw, 1)))
+        for component, products in enumerate(terms):
+            target = out[..., component]
+            np.multiply(products[0][0], products[0][1], out=target)
+            for x, y, sign in products[1:]:
+                np.multiply(x, y, out=scratch)
+                (np.add if sign > 0 else np.subtract)(target, scratch, out=target)
+        return out
+
+    @classmethod
+    def quat_rotate(cls, quats, vectors):
+        '''Rotate (N, 3) vectors by (N, 4) unit quaternions.'''
+        w, xyz = quats[..., :1], quats[..., 1:]
+        uv = np.cross(xyz, vectors)
+        uuv = np.cross(xyz, uv)
+        # vectors + 2 * (w * uv + uuv), accumulated in uv
+        uv *= w
+        uv += uuv
+        uv *= 2
+        uv += vectors
+        return uv
+
+    @classmethod
+    def axis_angle_quats(cls, axis, angles):
+        '''Quaternions rotating by each angle (radians) about a single axis, shape (N, 4).'''
+        axis = CurveMath.normalize(np.asarray(axis, dtype=np.float64))
+        half = 0.5 * np.atleast_1d(np.asarray(angles, dtype=np.float64))
+        return np.column_stack((np.cos(half), np.sin(half)[:, None] * axis))
+
+    @classmethod
+    def matrix_to_quats(cls, matrices):
+        '''Convert (N, 3, 3) rotation matrices (columns are the rotated axes) to (N, 4) quaternions.'''
+        m = matrices
+        trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+        # Pick the numerically largest component per matrix and derive the other three from it
+        case = np.argmax(np.column_stack((trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2])), axis=1)
+        quats = np.empty((len(m), 4))
+
+        c = case == 0
+        r = 2 * np.sqrt(np.maximum(1 + trace[c], 0))
+        quats[c] = np.column_stack((r / 4, (m[c, 2, 1] - m[c, 1, 2]) / r, (m[c, 0, 2] - m[c, 2, 0]) / r,
+                                    (m[c, 1, 0] - m[c, 0, 1]) / r))
+        c = case == 1
+        r = 2 * np.sqrt(np.maximum(1 + m[c, 0, 0] - m[c, 1, 1] - m[c, 2, 2], 0))
+        quats[c] = np.column_stack(((m[c, 2, 1] - m[c, 1, 2]) / r, r / 4, (m[c, 0, 1] + m[c, 1, 0]) / r,
+                                    (m[c, 0, 2] + m[c, 2, 0]) / r))
+        c = case == 2
+        r = 2 * np.sqrt(np.maximum(1 + m[c, 1, 1] - m[c, 0, 0] - m[c, 2, 2], 0))
+        quats[c] = np.column_stack(((m[c, 0, 2] - m[c, 2, 0]) / r, (m[c, 0, 1] + m[c, 1, 0]) / r, r / 4,
+                                    (m[c, 1, 2] + m[c, 2, 1]) / r))
+        c = case == 3
+        r = 2 * np.sqrt(np.maximum(1 + m[c, 2, 2] - m[c, 0, 0] - m[c, 1, 1], 0))
+        quats[c] = np.column_stack(((m[c, 1, 0] - m[c, 0, 1]) / r, (m[c, 0, 2] + m[c, 2, 0]) / r,
+                                    (m[c, 1, 2] + m[c, 2, 1]) / r, r / 4))
+        return CurveMath.normalize(quats, out=quats)
+
+    @classmethod
+    def perpendicular(cls, vectors, hint=None):
+        '''Unit vectors perpendicular to each vector, the hint projected when given and usable.'''
+        vectors = np.atleast_2d(vectors)
+        # Least aligned world axis always gives a well conditioned cross product
+        axes = np.eye(3)[np.argmin(np.abs(vectors), axis=1)]
+        fallback = CurveMath.normalize(np.cross(vectors, axes))
+        if hint is None:
+            return fallback
+        hint = np.asarray(hint, dtype=np.float64)
+        projected = hint - np.sum(hint * vectors, axis=1, keepdims=True) * vectors
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        return np.where(norms > 1e-6, projected / np.maximum(norms, 1e-12), fallback)
+
+    @classmethod
+    def rotation_minimizing_normals(cls, tangents, up_vector=None, curve_idx=None, previous=None):
+        '''Parallel-transport a normal along unit tangents so the frames never twist, shape (N, 3).
+
+        The minimal rotation between consecutive tangents is computed for all steps at once and
+        accumulated with a log-depth prefix product, so there is no per-copy Python loop.
+        up_vector sets the starting normal, otherwise any perpendicular of the first tangent is used.
+        curve_idx: curve of every tangent (grouped), each curve starts its own transport
+        previous: optional (tangent, normal, curve index) of the frame just before the first tangent,
+                  its curve continues from that normal instead of starting over
+        '''
+        if curve_idx is None:
+            curve_idx = np.zeros(len(tangents), dtype=int)
+        continued = previous is not None and len(tangents) > 0 and previous[2] == curve_idx[0]
+        if continued:
+            tangents = np.vstack((previous[0], tangents))
+            curve_idx = np.append(curve_idx[0], curve_idx)
+        num_frames = len(tangents)
+        curve_starts = np.flatnonzero(np.append(True, curve_idx[1:] != curve_idx[:-1]))
+        # Curve of every frame, counted from 0
+        frame_curve = np.repeat(np.arange(len(curve_starts)), np.diff(np.append(curve_starts, num_frames)))
+        steps = np.zeros((num_frames, 4))
+        steps[:, 0] = 1
+        if num_frames > 1:
+            prev, cur = tangents[:-1], tangents[1:]
+            np.einsum('ij,ij->i', prev, cur, out=steps[1:, 0])
+            steps[1:, 0] += 1
+            steps[1:, 1:] = np.cross(prev, cur)
+            # A tangent that reverses has no unique axis, turn half way around a perpendicular one
+            flipped = steps[1:, 0] < 1e-8
+            steps[1:][flipped] = np.column_stack((np.zeros(flipped.sum()), CurveMath.perpendicular(prev[flipped])))
+            CurveMath.normalize(steps, out=steps)
+            # No rotation carried from the end of one curve onto the start of the next
+            steps[curve_starts] = [1, 0, 0, 0]
+
+        # Inclusive scan: transport[i] = steps[i] * ... * steps[0], every pass written into the
+        # other of two buffers
+        transport, spare, scratch = steps, np.empty_like(steps), np.empty(num_frames)
+        shift = 1
+        while shift < num_frames:
+            spare[:shift] = transport[:shift]
+            CurveMath.quat_multiply(transport[shift:], transport[:-shift], out=spare[shift:],
+                                    scratch=scratch[shift:])
+            transport, spare = spare, transport
+            shift *= 2
+
+        if len(curve_starts) > 1:
+            # Remove the transport accumulated over earlier curves, the first curve starts at identity
+            start_conj = transport[curve_starts[frame_curve]] * [1, -1, -1, -1]
+            transport = CurveMath.quat_multiply(transport, start_conj, out=spare, scratch=scratch)
+            del start_conj
+        del spare, scratch
+
+        start_normals = CurveMath.perpendicular(tangents[curve_starts], up_vector)
+        if continued:
+            start_normals[0] = previous[1]
+        normals = CurveMath.quat_rotate(transport, start_normals[frame_curve])
+        CurveMath.normalize(normals, out=normals)
+        return normals[1:] if continued else normals
+
+    @classmethod
+    def frame_quats(cls, tangents, _forward_axis, up_vector=None, follow_curve=True, curve_idx=None, previous=None):
+        '''Orientations (N, 4) aligning the forward axis with each tangent and the object up with the frame normal.
+
+        follow_curve uses rotation-minimizing frames seeded by up_vector, without it the normal is the
+        up_vector projected on every tangent, falling back to the transported normal where they are parallel.
+        previous: optional frame the transport continues from, see rotation_minimizing_normals
+        '''
+        tangents = CurveMath.normalize(np.asarray(tangents, dtype=np.float64))
+        forward_vector = CurveMath.normalize(np.asarray(_forward_axis, dtype=np.float64))
+        object_up = CurveMath.perpendicular(forward_vector[None], default_up(_forward_axis))[0]
+
+        if not follow_curve and up_vector is not None:
+            normals = CurveMath.perpendicular(tangents, up_vector)
+            parallel = np.abs(tangents @ CurveMath.normalize(np.asarray(up_vector, dtype=np.float64))) > 1 - 1e-6
+            if parallel.any():
+                normals[parallel] = CurveMath.rotation_minimizing_normals(tangents, up_vector, curve_idx,
+                                                                          previous)[parallel]
+        else:
+            normals = CurveMath.rotation_minimizing_normals(tangents, up_vector, curve_idx, previous)
+
+        world_frames = np.stack((tangents, normals, np.cross(tangents, normals)), axis=-1)
+        object_frame = np.stack((forward_vector, object_up, np.cross(forward_vector, object_up)), axis=-1)
+        return CurveMath.matrix_to_quats(world_frames @ object_frame.T)
+
+    @classmethod
+    def orientations(cls, target_dirs, _forward_axis, follow_curve=False, up_vector=None, roll=0.0, curve_idx=None,
+                     previous=None):
+        '''Orientation of every copy as an (N, 4) array of (w, x, y, z) quaternions.
+
+        follow_curve: bool, rotation-minimizing frames along the curve instead of the shortest turn per copy
+        up_vector: optional world vector the object up axis is kept towards
+        roll: float, extra rotation in degrees about the forward axis of every copy
+        curve_idx: curve of every copy when the copies follow several curves
+        previous: optional (tangent, normal, curve index) the frames continue from, see rotation_minimizing_normals
+        '''
+        if follow_curve or up_vector is not None:
+            quats = CurveMath.frame_quats(target_dirs, _forward_axis, up_vector, follow_curve, curve_idx, previous)
+        else:
+            quats = CurveMath.direction_quats(_forward_axis, target_dirs)
+        if roll:
+            quats = CurveMath.quat_multiply(quats, CurveMath.axis_angle_quats(_forward_axis, np.radians(roll)))
+        return quats
+
+
+class BruteForceTree():
+    '''NumPy stand-in for the query of scipy.spatial.cKDTree, used by CurveIndex when SciPy is missing.
+
+    Every query point is compared with every data point, in blocks of query points so the distance
+    matrix stays under max_entries; fine for the few thousand pieces of a sampled curve.
+    '''
+    def __init__(self, data, max_entries=1 << 22):
+        self.data = np.asarray(data, dtype=np.float64).reshape(-1, 3)
+        self.n = len(self.data)
+        self.max_entries = max_entries
+
+    def query(self, points, k=1, distance_upper_bound=np.inf):
+        '''Distances (N, k) and indices (N, k) of the k nearest data points, sorted by distance.
+
+        Like cKDTree, missing neighbours (past distance_upper_bound or beyond the data) get an
+        infinite distance and the index n.
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        distances = np.full((len(points), k), np.inf)
+        found = np.full((len(points), k), self.n)
+        num_found = min(k, self.n)
+        block = max(self.max_entries // max(self.n, 1), 1)
+        for start in range(0, len(points) if num_found else 0, block):
+            offsets = points[start:start + block, None] - self.data
+            squared = np.einsum('ijk,ijk->ij', offsets, offsets)
+            nearest = np.argpartition(squared, num_found - 1, axis=1)[:, :num_found]
+            nearest_squared = np.take_along_axis(squared, nearest, axis=1)
+            order = np.argsort(nearest_squared, axis=1)
+            rows = slice(start, start + len(offsets))
+            distances[rows, :num_found] = np.sqrt(np.take_along_axis(nearest_squared, order, axis=1))
+            found[rows, :num_found] = np.take_along_axis(nearest, order, axis=1)
+        beyond = distances > distance_upper_bound
+        distances[beyond], found[beyond] = np.inf, self.n
+        return distances, found
+
+
+class CurveIndex():
+    '''Spatial index over the fine samples of sampled curves (see CurveMath.curve_samples) for closest-point queries.
+
+    A KD-tree holds points spread along every fine segment (the polyline between two samples of one
+    curve), long segments get several so all pieces are about the median segment length. A query
+    projects on the segments of its nearest pieces and keeps the closest one. A segment is never
+    closer than the distance to one of its pieces minus the half piece length, so once that bound is
+    past the farthest piece searched the polyline answer is exact; queries where it is not (far from
+    the curve) search again with more neighbours. The polyline point is then refined on the curve
+    itself with Newton steps, so answers are not limited by the sampling tolerance.
+    The KD-tree is SciPy's cKDTree, or a BruteForceTree when SciPy is not installed.
+    '''
+    def __init__(self, samples, neighbours=8):
+        '''
+        samples: dict from CurveMath.curve_samples
+        neighbours: int, pieces searched per query before the exactness check
+        '''
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            # SciPy comes with the optional omni.pip.compute, without it the pieces are searched by brute force
+            cKDTree = BruteForceTree
+
+        self.curve = samples['curve']
+        self.fine_u = samples['fine_u']
+        self.fine_curve = samples['fine_curve']
+        self.lengths = samples['lengths']
+        self.sample_offsets = samples['sample_offsets']
+        fine_points = samples['fine_points']
+        # Segments start at every sample but the last of its curve
+        self.segments = np.flatnonzero(self.fine_curve[1:] == self.fine_curve[:-1])
+        self.starts = fine_points[self.segments]
+        self.vectors = fine_points[self.segments + 1] - self.starts
+        # The curve index plus u grows along all samples, so one searchsorted locates a u on any curve
+        self.keys = self.fine_curve + self.fine_u
+
+        segment_lengths = np.linalg.norm(self.vectors, axis=1)
+        self.inverse_lengths = np.divide(1, segment_lengths ** 2, out=np.zeros(len(segment_lengths)),
+                                         where=segment_lengths > 0)
+        piece_length = np.median(segment_lengths[segment_lengths > 0]) if segment_lengths.any() else 1.0
+        pieces = np.maximum(np.ceil(segment_lengths / piece_length).astype(np.int64), 1)
+        self.piece_segment = np.repeat(np.arange(len(pieces)), pieces)
+        along = (np.arange(len(self.piece_segment)) - CurveMath.curve_offsets(pieces)[self.piece_segment] + 0.5) / \
+            pieces[self.piece_segment]
+        self.half_piece = 0.5 * (segment_lengths / pieces).max(initial=0)
+        self.neighbours = max(min(neighbours, len(self.piece_segment)), 1)
+        self.tree = cKDTree(self.starts[self.piece_segment] + along[:, None] * self.vectors[self.piece_segment])
+
+    def project(self, points, segment):
+        '''Fraction along the segments of the projection of the points and the squared distance to it.
+
+        points: (N, 3), segment: (N, k) indices, k segments per point
+        '''
+        vectors = self.vectors[segment]
+        offsets = points[:, None] - self.starts[segment]
+        t = np.clip(np.einsum('ijk,ijk->ij', offsets, vectors) * self.inverse_lengths[segment], 0, 1)
+        offsets -= t[..., None] * vectors
+        return t, np.einsum('ijk,ijk->ij', offsets, offsets)
+
+    def search(self, points, k, bound=np.inf):
+        '''Closest segment of the pieces found by a k-nearest search, within the distance bound, of every point.
+
+        Returns (segment, fraction along it, squared distance, distance to the k-th piece), the
+        squared distance is inf for points with no piece within bound.
+        '''
+        piece_distances, found = self.tree.query(points, k, distance_upper_bound=bound)
+        piece_distances = piece_distances.reshape(len(points), k)
+        found = found.reshape(len(points), k)
+        # Missing neighbours come back as the number of pieces
+        valid = found < len(self.piece_segment)
+        segment = self.piece_segment[np.minimum(found, len(self.piece_segment) - 1)]
+        t, distances = self.project(points, segment)
+        distances[~valid] = np.inf
+        best = distances.argmin(axis=1)
+        rows = np.arange(len(points))
+        return segment[rows, best], t[rows, best], distances[rows, best], piece_distances[:, -1]
+
+    def nearest_segments(self, points):
+        '''Closest segment of the polyline to every point, with the fraction along it and the squared distance.'''
+        segment, t, distances, farthest = self.search(points, self.neighbours)
+        unsure = np.flatnonzero(np.sqrt(distances) > farthest - self.half_piece)
+        # Unsure points search again with twice the neighbours, up to every piece, among the
+        # pieces close enough to hold a closer segment
+        k = self.neighbours
+        while len(unsure) and k < len(self.piece_segment):
+            k = min(k * 2, len(self.piece_segment))
+            bound = np.sqrt(distances[unsure]) + self.half_piece
+            found_segment, found_t, found_distances, farthest = self.search(points[unsure], k, bound.max())
+            closer = found_distances < distances[unsure]
+            segment[unsure[closer]], t[unsure[closer]] = found_segment[closer], found_t[closer]
+            distances[unsure[closer]] = found_distances[closer]
+            # Settled once the k-th piece is past the bound, every candidate was seen
+            unsure = unsure[farthest <= np.sqrt(distances[unsure]) + self.half_piece]
+        return segment, t, distances
+
+    def query(self, query_points, refine=2):
+        '''Closest point on the curves to every query point, in the space of the curve control points.
+
+        Where two parts of the curves are about as close, the other one can win by up to the sampling tolerance.
+        refine: int, Newton steps on the curve after the polyline search, 0 keeps the point on
+                the polyline (within the sampling tolerance of the curve)
+        Returns (u, arc length from the start of its curve, position, unit tangent, distance, curve index),
+        one entry per query point.
+        '''
+        points = np.asarray(query_points, dtype=np.float64).reshape(-1, 3)
+        if len(points) == 0:
+            empty = np.zeros((0, 3))
+            return np.zeros(0), np.zeros(0), empty, empty, np.zeros(0), np.zeros(0, dtype=int)
+        segment, t, distances = self.nearest_segments(points)
+        sample = self.segments[segment]
+        curve_idx = self.fine_curve[sample]
+        first = self.sample_offsets[curve_idx]
+        last = self.sample_offsets[curve_idx + 1] - 1
+        u = self.fine_u[sample] + t * (self.fine_u[sample + 1] - self.fine_u[sample])
+        positions = self.starts[segment] + t[:, None] * self.vectors[segment]
+
+        if refine > 0:
+            # Steps stay within the segment and its neighbours on the same curve
+            lo = self.fine_u[np.maximum(sample - 1, first)]
+            hi = self.fine_u[np.minimum(sample + 2, last)]
+            positions = self.curve(u, 0, curve_idx)
+            offsets = positions - points
+            distances = np.einsum('ij,ij->i', offsets, offsets)
+            for _ in range(refine):
+                derivatives = self.curve(u, 1, curve_idx)
+                # Newton on the derivative of the squared distance, Gauss-Newton where the curve
+                # bends away too much for Newton to head for a minimum
+                speed = np.einsum('ij,ij->i', derivatives, derivatives)
+                second = speed + np.einsum('ij,ij->i', offsets, self.curve(u, 2, curve_idx))
+                second = np.where(second > 0, second, speed)
+                step = np.divide(np.einsum('ij,ij->i', offsets, derivatives), second, out=np.zeros(len(u)),
+                                 where=second > 0)
+                stepped_u = np.clip(u - step, lo, hi)
+                stepped = self.curve(stepped_u, 0, curve_idx)
+                stepped_offsets = stepped - points
+                stepped_distances = np.einsum('ij,ij->i', stepped_offsets, stepped_offsets)
+                # Only keep steps that get closer, the step can overshoot far from a tight bend
+                closer = stepped_distances < distances
+                u = np.where(closer, stepped_u, u)
+                positions[closer], offsets[closer] = stepped[closer], stepped_offsets[closer]
+                distances = np.where(closer, stepped_distances, distances)
+
+        # Arc length interpolated inside the fine segment holding u, as arc_length_params inverted
+        seg_idx = np.clip(np.searchsorted(self.keys, curve_idx + u, side='right') - 1, first, last - 1)
+        span = self.fine_u[seg_idx + 1] - self.fine_u[seg_idx]
+        frac = np.divide(u - self.fine_u[seg_idx], span, out=np.zeros(len(u)), where=span > 0)
+        arc_lengths = self.lengths[seg_idx] + frac * (self.lengths[seg_idx + 1] - self.lengths[seg_idx]) - \
+            self.lengths[first]
+        tangents = CurveMath.curve_tangents(self.curve, u, curve_idx=curve_idx)
+        return u, arc_lengths, positions, tangents, np.sqrt(distances), curve_idx
@@ -1,16 +1,25 @@
+import asyncio
+import math
+import sys
+
 import omni.ext
+import omni.kit.ui
 import omni.ui as ui
 from omni.ui import color as cl
-from pxr import Usd, UsdGeom, Gf, Sdf
-import numpy as np
-from scipy.interpolate import BSpline
-import omni.usd
-from . import utils
 
-from .core import CurveManager, GeomCreator
+# NumPy, USD and the curve math are imported on first use, not when Kit enables the extension
 
+WINDOW_TITLE = "Distribute Along Curve"
+MENU_PATH = f"Window/{WINDOW_TITLE}"
 AXIS = ["+X", "+Y", "+Z", "-X", "-Y", "-Z"]  # taken from motion path
-CURVES = ["Bezier", "BSpline"]
+CURVES = ["Bezier", "BSpline", "Linear", "From Prim"]  # in utils.CURVE order
+COPIES = ["Duplicates", "Shared Geometry", "References"]  # in utils.COPY order
+
+_extension_instance = None
+
+def get_instance():
+    """The running extension, for scripts and tests that open the window"""
+    return _extension_instance
 
 # Any class derived from `omni.ext.IExt` in top level module (defined in `python.modules` of `extension.toml`) will be
 # instantiated when extension gets enabled and `on_startup(ext_id)` will be called. Later when extension gets disabled
@@ -22,7 +31,38 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
     # ext_id is current extension id. It can be used with extension manager to query additional information, like where
     # this extension is located on filesystem.
         def on_startup(self, ext_id):
+            global _extension_instance
             print("[siborg.create.curvedistribute] siborg create curvedistribute startup")
+            _extension_instance = self
+            self._window = None
+            self._live = None
+            self._job = None
+            self._job_task = None
+
+            # Only a menu entry on startup, the window is built the first time it is shown
+            ui.Workspace.set_show_window_fn(WINDOW_TITLE, lambda value: self._show_window(None, value))
+            self._menu = None
+            editor_menu = omni.kit.ui.get_editor_menu()
+            if editor_menu:
+                self._menu = editor_menu.add_item(MENU_PATH, self._show_window, toggle=True, value=False)
+
+        def show_window(self):
+            self._show_window(None, True)
+
+        def _show_window(self, menu, value):
+            if value and self._window is None:
+                self._build_window()
+            if self._window is not None:
+                self._window.visible = value
+
+        def _visibility_changed(self, visible):
+            editor_menu = omni.kit.ui.get_editor_menu()
+            if editor_menu:
+                editor_menu.set_value(MENU_PATH, visible)
+
+        def _build_window(self):
+            from . import utils
+            from .live import LiveDistributor
 
             #Models
             self._source_prim_model = ui.SimpleStringModel()
@@ -34,10 +74,33 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
             self._source_prim_model.as_string = ""
             self._source_curve_model.as_string = ""
             self._sampling_resolution = 0
+            self._tolerance = utils.DEFAULT_TOLERANCE
             self._use_instance_model = False
             self._use_orient_model = False
+            self._use_point_instancer_model = False
+            self._follow_curve_model = False
+            self._per_curve_model = False
+            self._animated_model = False
+            self._pack_model = False
+            self._gap = 0.0
+            self._seed = 0
+            self._random_sources_model = False
+            self._weights = ""
+            self._jitter_along = 0.0
+            self._jitter_across = 0.0
+            self._scale_min = [1.0, 1.0, 1.0]
+            self._scale_max = [1.0, 1.0, 1.0]
+            self._roll_variation = 0.0
+            self._up_axis = None
+            self._roll = 0.0
             self._forward_axis = [1,0,0]
-            self._curve_type = utils.CURVE.Bezier
+            self._curve_type = utils.CURVE.Prim
+            self._copy_mode = utils.COPY.Duplicate
+            self._scope_path = "/World/Copies"
+            self._layer_file = ""
+            self._as_payload_model = False
+            self._live = LiveDistributor(self._distribute)
+            self._progress_model = ui.SimpleFloatModel(0.0)
             #Grab Prim in Stage on Selection
             def _get_prim():
                 self._source_prim_model.as_string = ", ".join(utils.get_selection())
@@ -45,8 +108,12 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
             def _get_curve():
                 self._source_curve_model.as_string = ", ".join(utils.get_selection())
 
+            self._source_prim_model.add_value_changed_fn(lambda m: self._live.request_update())
+            self._source_curve_model.add_value_changed_fn(lambda m: self._toggle_live(self._live.active))
 
-            self._window = ui.Window("Distribute Along Curve", width=280, height=390)
+
+            self._window = ui.Window(WINDOW_TITLE, width=280, height=600)
+            self._window.set_visibility_changed_fn(self._visibility_changed)
             with self._window.frame:
                 with ui.VStack(height=10, width=260, spacing=10):
                     select_button_style ={"Button":{"background_color": cl.cyan,
@@ -59,7 +126,7 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
                                                 "Button.Label":{"color": cl.black},
                                                 "Button:hovered":{"background_color": cl("#E5F1FB")}}
                     ui.Spacer()
-                    ui.Label("Select Curve From Stage", tooltip="Select a BasisCurves type")
+                    ui.Label("Select Curve From Stage", tooltip="Select one or more BasisCurves, every curve of each prim is used")
                     with ui.HStack():
                         ui.StringField(height=2, model=self._source_curve_model)
                         ui.Button("S", width=20, height=20, style=select_button_style, clicked_fn=_get_curve)
@@ -77,14 +144,20 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
                     with ui.HStack():
                         ui.Label("Copies", tooltip="Number of copies to distribute. Endpoints are included in the count.")
                         x = ui.IntField(height=5)
-                        x.model.add_value_changed_fn(lambda m, self=self: setattr(self, '_count', m.get_value_as_int()))
+                        x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_count', m.get_value_as_int()))
                         x.model.set_value(3) 
                         
                         
-                        ui.Label("     Subsamples", tooltip="A sampling parameter, don't touch if you don't understand")
+                        ui.Label("     Subsamples", tooltip="Uniform samples per curve, 0 samples adaptively to the Tolerance")
                         x = ui.IntField(height=5) 
-                        x.model.add_value_changed_fn(lambda m, self=self: setattr(self, '_sampling_resolution', m.get_value_as_int()))
-                        x.model.set_value(1000) 
+                        x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_sampling_resolution', m.get_value_as_int()))
+                        x.model.set_value(0) 
+
+                    with ui.HStack():
+                        ui.Label("Tolerance", tooltip="Max distance in scene units between the curve and its samples")
+                        x = ui.FloatField(height=5)
+                        x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_tolerance', m.get_value_as_float()))
+                        x.model.set_value(utils.DEFAULT_TOLERANCE)
 
 
                     with ui.HStack():
@@ -92,26 +165,107 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
                         # ui.Button("S", width=20, height=20, style=select_button_style, clicked_fn=_get_prim)
                         ui.Label(" Use instances ", width=65, tooltip="Select to use instances when copying a prim")
                         instancer = ui.CheckBox(width=30)
-                        instancer.model.add_value_changed_fn(lambda m : setattr(self, '_use_instance_model', m.get_value_as_bool()))
+                        instancer.model.add_value_changed_fn(lambda m : self._set_param('_use_instance_model', m.get_value_as_bool()))
                         instancer.model.set_value(False)
                         
                         ui.Label(" Follow Orientation ", width=65)
                         instancer = ui.CheckBox(width=30)
-                        instancer.model.add_value_changed_fn(lambda m : setattr(self, '_use_orient_model', m.get_value_as_bool()))
+                        instancer.model.add_value_changed_fn(lambda m : self._set_param('_use_orient_model', m.get_value_as_bool()))
                         instancer.model.set_value(False)
 
+                    with ui.HStack():
+                        ui.Label(" Point Instancer ", width=65,
+                                 tooltip="Author a single UsdGeom.PointInstancer instead of a prim per copy")
+                        instancer = ui.CheckBox(width=30)
+                        instancer.model.add_value_changed_fn(lambda m : self._set_param('_use_point_instancer_model', m.get_value_as_bool()))
+                        instancer.model.set_value(False)
+
+                        ui.Label(" Follow Curve ", width=65,
+                                 tooltip="Orient with rotation-minimizing frames so copies do not twist along the curve")
+                        instancer = ui.CheckBox(width=30)
+                        instancer.model.add_value_changed_fn(lambda m : self._set_param('_follow_curve_model', m.get_value_as_bool()))
+                        instancer.model.set_value(False)
+
+                    with ui.HStack():
+                        ui.Label(" Per Curve ", width=65,
+                                 tooltip="Place Count copies on every curve instead of spreading them over all curves")
+                        per_curve = ui.CheckBox(width=30)
+                        per_curve.model.add_value_changed_fn(lambda m : self._set_param('_per_curve_model', m.get_value_as_bool()))
+                        per_curve.model.set_value(False)
+
+                        ui.Label(" Animated ", width=65,
+                                 tooltip="Follow curves with animated points, copies get a time sample "
+                                         "per frame of the stage time range")
+                        animated = ui.CheckBox(width=30)
+                        animated.model.add_value_changed_fn(lambda m : self._set_param('_animated_model', m.get_value_as_bool()))
+                        animated.model.set_value(False)
+
+                    with ui.HStack():
+                        ui.Label(" Pack ", width=65,
+                                 tooltip="Fill the curves with copies by their size along the forward axis and cull "
+                                         "overlapping ones, Count caps the copies (0 fills the curves)")
+                        pack = ui.CheckBox(width=30)
+                        pack.model.add_value_changed_fn(lambda m : self._set_param('_pack_model', m.get_value_as_bool()))
+                        pack.model.set_value(False)
+
+                        ui.Label(" Gap ", width=35, tooltip="Extra distance between packed copies")
+                        x = ui.FloatField(height=5)
+                        x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_gap', m.get_value_as_float()))
+                        x.model.set_value(0.0)
+
                     with ui.HStack():
                         ui.Label("Spline Type", 
                                  name="label", 
                                  width=160, 
-                                 tooltip="Type of curve to use for interpolating control points")
+                                 tooltip="Type of curve to use for interpolating control points, "
+                                         "From Prim follows the type, basis and wrap of the curve prim")
                         ui.Spacer(width=13)
-                        widget = ui.ComboBox(0, *CURVES).model
-                        widget.add_item_changed_fn(lambda m, i: setattr(self, '_curve_type',
+                        widget = ui.ComboBox(int(utils.CURVE.Prim), *CURVES).model
+                        widget.add_item_changed_fn(lambda m, i: self._set_param('_curve_type',
                                                                         m.get_item_value_model().get_value_as_int()
                                                                         )
                                                    )
 
+                    with ui.HStack():
+                        ui.Label("Copy As",
+                                 name="label",
+                                 width=160,
+                                 tooltip="What copies that are not instances hold: a full duplicate of the source, "
+                                         "the source without its mesh arrays which are stored once, or only a "
+                                         "reference to the source with their own transform")
+                        ui.Spacer(width=13)
+                        widget = ui.ComboBox(int(utils.COPY.Duplicate), *COPIES).model
+                        widget.add_item_changed_fn(lambda m, i: self._set_param('_copy_mode',
+                                                                        m.get_item_value_model().get_value_as_int()
+                                                                        )
+                                                   )
+
+                    with ui.HStack():
+                        ui.Label("Scope",
+                                 name="label",
+                                 width=160,
+                                 tooltip="Prim the copies go under, a distribution per scope")
+                        ui.Spacer(width=13)
+                        x = ui.StringField(height=2)
+                        x.model.set_value(self._scope_path)
+                        x.model.add_end_edit_fn(lambda m, self=self: self._set_param('_scope_path', m.as_string))
+
+                    with ui.HStack():
+                        ui.Label("Layer File",
+                                 name="label",
+                                 width=160,
+                                 tooltip="Author the copies into this .usdc file, added as a sublayer of the stage, "
+                                         "instead of the edit target layer when set")
+                        ui.Spacer(width=13)
+                        x = ui.StringField(height=2)
+                        x.model.add_end_edit_fn(lambda m, self=self: self._set_param('_layer_file', m.as_string.strip()))
+                        ui.Label(" As Payload ", width=80,
+                                 tooltip="Add the layer file as a payload on the scope so it can be unloaded, "
+                                         "copies that are not instances only")
+                        as_payload = ui.CheckBox(width=30)
+                        as_payload.model.add_value_changed_fn(
+                            lambda m : self._set_param('_as_payload_model', m.get_value_as_bool()))
+
                     with ui.HStack():
                         ui.Label("Forward Axis", 
                                  name="label", 
@@ -119,10 +273,70 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
                                  tooltip="Forward axis of target Object")
                         ui.Spacer(width=13)
                         widget = ui.ComboBox(0, *AXIS).model
-                        widget.add_item_changed_fn(lambda m, i: setattr(self, '_forward_axis',
+                        widget.add_item_changed_fn(lambda m, i: self._set_param('_forward_axis',
                                                                         utils.index_to_axis(m.get_item_value_model().get_value_as_int())
                                                                         )
                                                    )
+
+                    with ui.HStack():
+                        ui.Label("Up Axis", 
+                                 name="label", 
+                                 width=160, 
+                                 tooltip="World axis the up of the copies is kept towards when orienting")
+                        ui.Spacer(width=13)
+                        widget = ui.ComboBox(0, "None", *AXIS).model
+                        widget.add_item_changed_fn(lambda m, i: self._set_param('_up_axis',
+                                                                        utils.index_to_axis(m.get_item_value_model().get_value_as_int() - 1)
+                                                                        if m.get_item_value_model().get_value_as_int() else None
+                                                                        )
+                                                   )
+
+                    with ui.HStack():
+                        ui.Label("Roll", tooltip="Extra rotation in degrees about the forward axis of every copy")
+                        x = ui.FloatField(height=5)
+                        x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_roll', m.get_value_as_float()))
+                        x.model.set_value(0.0)
+
+                    with ui.CollapsableFrame("Variation", collapsed=True):
+                        with ui.VStack():
+                            with ui.HStack():
+                                ui.Label("Seed", tooltip="The same seed always gives every copy the same variation")
+                                x = ui.IntField(height=5)
+                                x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_seed', m.get_value_as_int()))
+                                x.model.set_value(0)
+                            with ui.HStack():
+                                ui.Label(" Random Sources ", width=100,
+                                         tooltip="Pick the source prim of every copy at random instead of in turn")
+                                random_sources = ui.CheckBox(width=30)
+                                random_sources.model.add_value_changed_fn(
+                                    lambda m : self._set_param('_random_sources_model', m.get_value_as_bool()))
+                                random_sources.model.set_value(False)
+                                x = ui.StringField(height=2, tooltip="Comma separated weight of every source prim, "
+                                                                     "equal weights when empty")
+                                x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_weights', m.as_string))
+                            with ui.HStack():
+                                ui.Label("Jitter Along", tooltip="Max offset of the copies along the curve")
+                                x = ui.FloatField(height=5)
+                                x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_jitter_along', m.get_value_as_float()))
+                                x.model.set_value(0.0)
+                            with ui.HStack():
+                                ui.Label("Jitter Across", tooltip="Max offset of the copies away from the curve, "
+                                                                  "sideways only with an Up Axis")
+                                x = ui.FloatField(height=5)
+                                x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_jitter_across', m.get_value_as_float()))
+                                x.model.set_value(0.0)
+                            for label, name in (("Scale Min", '_scale_min'), ("Scale Max", '_scale_max')):
+                                with ui.HStack():
+                                    ui.Label(label, tooltip="Per axis range of the scale of the copies")
+                                    x = ui.MultiFloatField(1.0, 1.0, 1.0, h_spacing=2)
+                                    x.model.add_item_changed_fn(
+                                        lambda m, i, name=name: self._set_param(name, [
+                                            m.get_item_value_model(c).as_float for c in m.get_item_children()]))
+                            with ui.HStack():
+                                ui.Label("Roll Variation", tooltip="Max extra roll in degrees either way, needs Orient")
+                                x = ui.FloatField(height=5)
+                                x.model.add_value_changed_fn(lambda m, self=self: self._set_param('_roll_variation', m.get_value_as_float()))
+                                x.model.set_value(0.0)
                     with ui.VStack():
 
                         
@@ -136,16 +350,158 @@ class SiborgCreateCurvedistributeExtension(omni.ext.IExt):
                             "Button.Label":{"color": cl.black},
                             "Button:hovered":{"background_color": cl("#E5F1FB")}}
                         
-                        ui.Button("Distribute", clicked_fn=lambda: GeomCreator.duplicate(self._count, 
-                                                                                         self._sampling_resolution, 
-                                                                                         self._source_curve_model, 
-                                                                                         self._source_prim_model, 
-                                                                                         self._use_instance_model,
-                                                                                         self._use_orient_model,
-                                                                                         self._forward_axis,
-                                                                                         self._curve_type), 
-                                        style=distribute_button_style) 
+                        ui.Button("Distribute", clicked_fn=self._start_job, style=distribute_button_style) 
+
+                    with ui.HStack(height=20):
+                        ui.ProgressBar(self._progress_model)
+                        ui.Button("Cancel", width=60, clicked_fn=self._cancel_job,
+                                  tooltip="Stop the running distribution and undo what it authored so far")
+
+                    with ui.HStack():
+                        ui.Label(" Live ", width=65,
+                                 tooltip="Redistribute automatically when the curve or any setting changes")
+                        live = ui.CheckBox(width=30)
+                        live.model.add_value_changed_fn(lambda m : self._toggle_live(m.get_value_as_bool()))
+                        live.model.set_value(False)
+
+                    with ui.CollapsableFrame("Stats", collapsed=True):
+                        self._stats_label = ui.Label("Distribute to see where the time goes", word_wrap=True,
+                                                     tooltip="Milliseconds per stage, copies authored, curve samples "
+                                                             "evaluated, stage notices and peak array memory of the "
+                                                             "last distribution")
+
+        def _distribute(self):
+            '''Live redistribution, a DistributeJob like the Distribute button so edits never stall the UI'''
+            self._start_job()
+            return self._job_task
+
+        def _start_job(self):
+            self._job_task = asyncio.ensure_future(self._run_job(self._job_task))
+
+        async def _run_job(self, previous_task):
+            import omni.usd
+            from .job import DistributeJob
+            # A new Distribute replaces a running one once that one has rolled back
+            if self._job is not None:
+                self._job.cancel()
+            if previous_task is not None and not previous_task.done():
+                await previous_task
+
+            job = DistributeJob(omni.usd.get_context().get_stage(),
+                                self._source_curve_model.as_string,
+                                self._source_prim_model.as_string.replace(' ','').split(','),
+                                self._count,
+                                sampling_resolution=self._sampling_resolution,
+                                curve_type=self._curve_type,
+                                tolerance=self._tolerance,
+                                use_instance=self._use_instance_model,
+                                use_orient=self._use_orient_model,
+                                forward_axis=self._forward_axis,
+                                point_instancer=self._use_point_instancer_model,
+                                follow_curve=self._follow_curve_model,
+                                up_axis=self._up_axis,
+                                roll=self._roll,
+                                per_curve=self._per_curve_model,
+                                frames=self._frames(),
+                                pack=self._pack_model,
+                                gap=self._gap,
+                                variation=self._variation(),
+                                copy_mode=self._copy_mode,
+                                progress_fn=self._progress_model.set_value,
+                                scope_path=self._scope_path,
+                                layer_file=self._layer_file or None,
+                                as_payload=self._as_payload_model)
+            self._job = job
+            try:
+                await job.run()
+                if not job.cancelled:
+                    self._show_stats(job.stats)
+            finally:
+                if self._job is job:
+                    self._job = None
+
+        def _show_stats(self, stats):
+            if stats is not None and self._window is not None:
+                self._stats_label.text = stats.summary()
+
+        def _frames(self):
+            '''Every frame of the stage time range when Animated is on, None otherwise'''
+            import omni.usd
+            stage = omni.usd.get_context().get_stage()
+            if not self._animated_model or stage is None:
+                return None
+            return range(int(stage.GetStartTimeCode()), int(stage.GetEndTimeCode()) + 1)
+
+        def _variation(self):
+            '''Variation settings of the window, None when nothing varies'''
+            weights = None
+            if self._random_sources_model:
+                num_sources = len([p for p in self._source_prim_model.as_string.replace(' ','').split(',') if p])
+                weights = self._source_weights(num_sources)
+            variation = {'seed': self._seed, 'weights': weights, 'jitter_along': self._jitter_along,
+                         'jitter_across': self._jitter_across, 'scale_min': tuple(self._scale_min),
+                         'scale_max': tuple(self._scale_max), 'roll': self._roll_variation}
+            varies = (weights is not None or self._jitter_along or self._jitter_across or self._roll_variation
+                      or self._scale_min != [1.0, 1.0, 1.0] or self._scale_max != [1.0, 1.0, 1.0])
+            return variation if varies else None
+
+        def _source_weights(self, num_sources):
+            '''Weights of the Weights field, uniform when it is empty or not one non negative number per source'''
+            import carb
+            uniform = [1.0] * num_sources
+            fields = [w for w in self._weights.split(',') if w.strip()]
+            if not fields:
+                return uniform
+            try:
+                weights = [float(w) for w in fields]
+            except ValueError:
+                carb.log_warn(f"[siborg.create.curvedistribute] Weights '{self._weights}' are not comma separated "
+                              "numbers, using uniform weights")
+                return uniform
+            valid = all(math.isfinite(w) and w >= 0 for w in weights) and sum(weights) > 0
+            if len(weights) != num_sources or not valid:
+                carb.log_warn(f"[siborg.create.curvedistribute] Weights '{self._weights}' need one non negative "
+                              f"weight for each of the {num_sources} sources, using uniform weights")
+                return uniform
+            return weights
+
+        def _cancel_job(self):
+            if self._job is not None:
+                self._job.cancel()
+
+        def _set_param(self, name, value):
+            '''Store a setting from the window, a live distribution picks it up after the debounce delay'''
+            setattr(self, name, value)
+            self._live.request_update()
+
+        def _toggle_live(self, enabled):
+            import omni.usd
+            from .core import CurveManager
+            if enabled:
+                curve_paths = CurveManager.curve_paths(self._source_curve_model.as_string)
+                self._live.watch(omni.usd.get_context().get_stage(), curve_paths)
+            else:
+                self._live.stop()
 
         def on_shutdown(self):
+            global _extension_instance
             print("[siborg.create.curvedistribute] siborg create curvedistribute shutdown")
+            _extension_instance = None
+            if self._live is not None:
+                self._live.stop()
+            if self._job_task is not None:
+                self._job_task.cancel()
+                self._job_task = None
+            # Nothing to clear if the curve math was never loaded
+            core = sys.modules.get(f"{__package__}.core")
+            if core is not None:
+                core.CurveManager.clear_caches()
 
+            editor_menu = omni.kit.ui.get_editor_menu()
+            if editor_menu and self._menu:
+                editor_menu.remove_item(MENU_PATH)
+            self._menu = None
+            ui.Workspace.set_show_window_fn(WINDOW_TITLE, None)
+            if self._window is not None:
+                self._window.destroy()
+                self._window = None
@@ -0,0 +1,245 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import omni.kit.app
+from pxr import Sdf, UsdGeom
+
+from . import utils
+from .core import CurveManager, CopyWriter, DistributionLayer, FrameWriter
+from .curvemath import DEFAULT_CHUNK_SIZE
+from .profiling import DistributeStats, timed, zone
+
+# Curve sampling and placement run off the UI thread, one chunk at a time
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="curvedistribute")
+
+# Copies authored as prims per frame, prim specs are far slower to author than instancer array slices
+PRIM_CHUNK_SIZE = 1024
+
+
+class DistributeJob():
+    '''A distribution that runs without freezing Kit, with progress and cancellation.
+
+    Curve sampling and every chunk of the placement are computed in a worker thread, each chunk
+    is authored on the main thread in its own Sdf.ChangeBlock and the job waits for the next app
+    update before the next one, so the UI keeps drawing. Animated curves are placed for every frame
+    in the worker and their time samples are authored a batch of frames per app update. Cancelling
+    (or an error) restores the copies scope in every layer to what it was before the job started.
+    With layer_file the copies are authored off the stage and only attached once all of them are,
+    so a cancelled job leaves the stage untouched.
+    The stage timings and counters of the run are collected in stats.
+    '''
+    def __init__(self, stage, curve_path, ref_prims, count, sampling_resolution=0, curve_type=utils.CURVE.Bspline,
+                 tolerance=utils.DEFAULT_TOLERANCE, use_instance=False, use_orient=False, forward_axis=(1, 0, 0),
+                 point_instancer=False, follow_curve=False, up_axis=None, roll=0.0, per_curve=False,
+                 frames=None, pack=False, gap=0.0, variation=None, copy_mode=utils.COPY.Duplicate, chunk_size=None,
+                 progress_fn=None, scope_path="/World/Copies", layer_file=None, as_payload=False):
+        '''
+        Settings are the ones of GeomCreator.duplicate as plain values.
+        frames: optional list of time codes, the copies follow the animated curves with a time sample per frame
+        pack / gap: fill the curves with copies by their footprint, see CurveMath.packed_lengths
+        variation: optional dict of seeded variation settings, see CurveMath.variations
+        copy_mode: utils.COPY, how copies that are not instances hold the data of their source
+        chunk_size: int, copies computed and authored per frame, by default DEFAULT_CHUNK_SIZE for the
+                    point instancer and PRIM_CHUNK_SIZE for prims
+        progress_fn: optional callable taking the finished fraction in [0, 1]
+        scope_path: str, the prim the copies go under
+        layer_file / as_payload: optional .usdc file the copies are authored into, see DistributionLayer
+        '''
+        self.stage = stage
+        self.curve_path = curve_path
+        self.ref_prims = ref_prims
+        self.count = count
+        self.sampling_resolution = sampling_resolution
+        self.curve_type = curve_type
+        self.tolerance = tolerance
+        self.use_instance = use_instance
+        self.use_orient = use_orient
+        self.forward_axis = list(forward_axis)
+        self.point_instancer = point_instancer
+        self.follow_curve = follow_curve
+        self.up_axis = up_axis
+        self.roll = roll
+        self.per_curve = per_curve
+        self.frames = list(frames) if frames else None
+        self.pack = pack
+        self.gap = gap
+        self.variation = variation
+        self.copy_mode = copy_mode
+        if chunk_size is None:
+            chunk_size = DEFAULT_CHUNK_SIZE if point_instancer else PRIM_CHUNK_SIZE
+        self.chunk_size = chunk_size
+        self.progress_fn = progress_fn
+        self.scope_path = scope_path
+        self.layer_file = layer_file
+        self.as_payload = as_payload
+        self.stats = DistributeStats()
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        '''Stop at the next chunk and roll back what the job authored.'''
+        self._cancelled = True
+
+    def _progress(self, fraction):
+        if self.progress_fn is not None:
+            self.progress_fn(fraction)
+
+    def _destination(self):
+        '''(stage and scope the copies are authored in, DistributionLayer or None, backup of the scope or None).'''
+        if self.layer_file:
+            output = DistributionLayer(self.stage, self.layer_file, self.scope_path, self.ref_prims, self.as_payload,
+                                       self.use_instance or self.point_instancer)
+            return output.stage, output.author_scope, output, None
+        return self.stage, self.scope_path, None, CurveManager.backup_scope(self.stage, self.scope_path)
+
+    def _attach(self, output, result):
+        '''Attach the distribution layer, the instancer is returned from the stage it was attached to.'''
+        if output is None:
+            return result
+        output.attach()
+        if self.point_instancer:
+            path = result.GetPath().ReplacePrefix(output.author_scope, output.scope_path)
+            return UsdGeom.PointInstancer(self.stage.GetPrimAtPath(path))
+        return result
+
+    async def _in_worker(self, fn, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+    async def _cached_samples(self, key, args):
+        curve_cache = CurveManager.get_cache(self.stage)
+        samples = curve_cache.get(key)
+        if samples is None:
+            samples = await self._in_worker(CurveManager.curve_samples, *args, stats=self.stats)
+            curve_cache.put(key, samples)
+        self.stats.hold('samples', samples)
+        return samples
+
+    async def _samples(self):
+        request = CurveManager.curve_request(self.stage, self.curve_path, self.curve_type,
+                                             self.sampling_resolution, self.tolerance, self.stats)
+        if request is None:
+            return None
+        return await self._cached_samples(*request)
+
+    async def _animated_samples(self):
+        request = CurveManager.frame_request(self.stage, self.curve_path, self.frames, self.curve_type,
+                                             self.sampling_resolution, self.tolerance, self.stats)
+        if request is None:
+            return None
+        key, args, frame_index = request
+        return await self._cached_samples(key, args), frame_index
+
+    async def run(self):
+        '''Run the distribution, returns what CopyWriter.close returns, or None when cancelled or without a curve.'''
+        if self.curve_type not in tuple(utils.CURVE):
+            print("CURVE TYPE NOT IMPLEMENTED")
+            return None
+        self._progress(0.0)
+        samples = await (self._animated_samples() if self.frames else self._samples())
+        if samples is None:
+            print("NO USABLE CURVE")
+            return None
+        if self._cancelled:
+            return None
+        if self.frames:
+            return await self._run_frames(*samples)
+
+        targets = None
+        if self.pack:
+            footprint = CurveManager.footprint(self.stage, self.ref_prims, self.forward_axis)
+            if footprint <= 0:
+                print("The source prims have no extent along the forward axis to pack by")
+                return None
+            targets = await self._in_worker(timed, 'pack', self.stats, CurveManager.packed_lengths, samples,
+                                            footprint, self.gap, self.count, self.per_curve)
+            if self._cancelled:
+                return None
+
+        num_copies = CurveManager.distribution_size(samples, self.count, self.per_curve, targets=targets)
+        chunks = CurveManager.distribution_chunks(samples, self.count, self.forward_axis, self.per_curve,
+                                                  self.use_orient, self.follow_curve, self.up_axis, self.roll,
+                                                  len([p for p in self.ref_prims if p]), self.chunk_size,
+                                                  targets=targets, variation=self.variation, stats=self.stats)
+
+        stage, scope_path, output, backup = self._destination()
+        self.stats.listen(self.stage)
+        try:
+            with zone('author', self.stats):
+                writer = CopyWriter(stage, num_copies, self.ref_prims, self.use_instance, self.use_orient,
+                                    self.point_instancer, scope_path, copy_mode=self.copy_mode,
+                                    layer=output.layer if output else None)
+            self.stats.hold('writer', writer)
+            while True:
+                chunk = await self._in_worker(next, chunks, None)
+                if self._cancelled:
+                    raise asyncio.CancelledError()
+                if chunk is None:
+                    break
+                with zone('author', self.stats), Sdf.ChangeBlock():
+                    writer.write(chunk)
+                self._progress(writer.written / max(num_copies, 1))
+                await omni.kit.app.get_app().next_update_async()
+            with zone('author', self.stats):
+                result = self._attach(output, writer.close())
+        except BaseException:
+            # Cancelled, the task was cancelled or authoring failed: leave the stage as it was
+            if backup is not None:
+                CurveManager.restore_scope(self.stage, self.scope_path, backup)
+            self._progress(0.0)
+            if self._cancelled:
+                return None
+            raise
+        finally:
+            self.stats.stop_listening()
+        self.stats.copies = writer.written
+        self._progress(1.0)
+        return result
+
+    async def _run_frames(self, samples, frame_index):
+        if self.pack:
+            print("Packing by footprint is not supported on animated curves, spacing evenly")
+        positions, quats, proto_indices, scales = await self._in_worker(
+            CurveManager.frame_distribution, samples, self.count, frame_index.max() + 1, self.forward_axis,
+            self.per_curve, self.use_orient, self.follow_curve, self.up_axis, self.roll,
+            len([p for p in self.ref_prims if p]), self.variation, self.stats)
+        if self._cancelled:
+            return None
+        # About chunk_size copies authored per app update, whole frames at a time
+        frames_per_update = max(self.chunk_size // max(positions.shape[1], 1), 1)
+
+        stage, scope_path, output, backup = self._destination()
+        self.stats.listen(self.stage)
+        try:
+            first = frame_index[0]
+            with zone('author', self.stats):
+                writer = FrameWriter(stage, positions[first], quats[first] if self.use_orient else None,
+                                     self.ref_prims, self.use_instance, self.use_orient, self.point_instancer,
+                                     scope_path, proto_indices, scales, self.copy_mode,
+                                     output.layer if output else None)
+            for start in range(0, len(self.frames), frames_per_update):
+                if self._cancelled:
+                    raise asyncio.CancelledError()
+                with zone('author', self.stats), Sdf.ChangeBlock():
+                    for time, index in zip(self.frames[start:start + frames_per_update],
+                                           frame_index[start:start + frames_per_update]):
+                        writer.write_frame(time, positions[index], quats[index] if self.use_orient else None)
+                self._progress(writer.written / len(self.frames))
+                await omni.kit.app.get_app().next_update_async()
+            with zone('author', self.stats):
+                result = self._attach(output, writer.result)
+        except BaseException:
+            if backup is not None:
+                CurveManager.restore_scope(self.stage, self.scope_path, backup)
+            self._progress(0.0)
+            if self._cancelled:
+                return None
+            raise
+        finally:
+            self.stats.stop_listening()
+        self.stats.copies, self.stats.frames = positions.shape[1], writer.written
+        self._progress(1.0)
+        return result
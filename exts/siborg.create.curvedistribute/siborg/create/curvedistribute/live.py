@@ -0,0 +1,79 @@
+import asyncio
+import inspect
+
+from pxr import Usd, Sdf, Tf
+
+
+class LiveDistributor():
+    '''Re-run a distribution whenever its source curves or settings change.
+
+    Curve edits arrive through a Usd.Notice.ObjectsChanged listener and setting edits through
+    request_update. Both restart a short timer, so a burst of edits (dragging a point, typing a
+    count) results in a single redistribution once the edits settle. Notices sent while the
+    distribution runs come from its own copies and are ignored, so it never triggers itself. The
+    distribution itself is expected to be incremental (see CurveManager.sync_copies) and may run
+    over several app updates (see DistributeJob), it is then awaited before notices count again.
+    '''
+    def __init__(self, distribute_fn, delay=0.15):
+        '''
+        distribute_fn: callable without arguments that runs the distribution, or returns an awaitable running it
+        delay: float, seconds without edits before redistributing
+        '''
+        self.delay = delay
+        self._distribute_fn = distribute_fn
+        self._listener = None
+        self._watched_paths = set()
+        self._pending = None
+        # Distributions running, a new one can start before a replaced one has rolled back
+        self._distributing = 0
+
+    @property
+    def active(self):
+        return self._listener is not None
+
+    def watch(self, stage, curve_paths):
+        '''Start listening to the curves on the stage and redistribute once.'''
+        self.stop()
+        # A change on a curve or on any of its ancestors moves the curve
+        self._watched_paths = {Sdf.Path.absoluteRootPath}
+        for curve_path in curve_paths:
+            if curve_path:
+                self._watched_paths.update(Sdf.Path(curve_path).GetPrefixes())
+        self._listener = Tf.Notice.Register(Usd.Notice.ObjectsChanged, self._on_objects_changed, stage)
+        self.request_update()
+
+    def stop(self):
+        '''Stop listening and drop a pending redistribution.'''
+        if self._listener is not None:
+            self._listener.Revoke()
+            self._listener = None
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    def request_update(self):
+        '''Redistribute after the debounce delay, restarting the delay if an update is already pending.'''
+        if not self.active:
+            return
+        if self._pending is not None:
+            self._pending.cancel()
+        self._pending = asyncio.ensure_future(self._update_later())
+
+    async def _update_later(self):
+        await asyncio.sleep(self.delay)
+        self._pending = None
+        self._distributing += 1
+        try:
+            result = self._distribute_fn()
+            if inspect.isawaitable(result):
+                await result
+        finally:
+            self._distributing -= 1
+
+    def _on_objects_changed(self, notice, sender):
+        if self._distributing:
+            return
+        changed = set(p.GetPrimPath() for p in notice.GetResyncedPaths())
+        changed.update(p.GetPrimPath() for p in notice.GetChangedInfoOnlyPaths())
+        if not self._watched_paths.isdisjoint(changed):
+            self.request_update()
@@ -0,0 +1,120 @@
+"""Stage timings and counters of a distribution, also reported to the Kit profiler.
+
+Like curvemath this works headless, carb.profiler zones are only opened when carb can be imported.
+"""
+import time
+from contextlib import contextmanager
+
+try:
+    import carb.profiler
+except ImportError:
+    carb = None
+
+# Stages of a distribution in the order they run, zones in the Kit profiler are curvedistribute.<stage>
+STAGES = ('read', 'fit', 'sample', 'pack', 'place', 'vary', 'orient', 'author')
+
+# carb.profiler channel mask of the zones
+PROFILER_MASK = 1
+
+
+def array_nbytes(*values):
+    '''Bytes held by the values that have an nbytes (NumPy arrays, writers), dicts count the values they hold.'''
+    total = 0
+    for value in values:
+        if isinstance(value, dict):
+            total += array_nbytes(*value.values())
+        else:
+            total += getattr(value, 'nbytes', 0)
+    return total
+
+
+@contextmanager
+def zone(name, stats=None):
+    '''Run a stage of a distribution inside a carb.profiler zone, and time it into stats when given.'''
+    if carb is not None:
+        carb.profiler.begin(PROFILER_MASK, f"curvedistribute.{name}")
+    if stats is not None:
+        stats._enter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats._exit(name)
+        if carb is not None:
+            carb.profiler.end(PROFILER_MASK)
+
+
+def timed(name, stats, fn, *args, **kwargs):
+    '''Call fn inside zone(name, stats), for a stage that is a single call, e.g. run in a worker thread.'''
+    with zone(name, stats):
+        return fn(*args, **kwargs)
+
+
+class DistributeStats():
+    '''Where a distribution spent its time and what it did, filled in as it runs.
+
+    seconds: seconds per stage (see STAGES), a stage running inside another one (placement pulled
+             chunk by chunk while authoring) is only counted in the inner one, so they add up
+    samples: fine curve samples evaluated, 0 when the curves came from the curve cache
+    copies: copies authored, for animated curves the copies of one frame and frames the frames
+    notices: Usd.Notice.ObjectsChanged sent by the stage while listening (see listen)
+    peak_bytes: most bytes of curve samples, placement and writer arrays held at once (see hold)
+    '''
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.samples = 0
+        self.copies = 0
+        self.frames = 0
+        self.notices = 0
+        self.peak_bytes = 0
+        self._held = {}
+        # Start time and inner stage seconds of every open zone
+        self._open = []
+        self._listener = None
+
+    @property
+    def total_seconds(self):
+        return sum(self.seconds.values())
+
+    def _enter(self):
+        self._open.append([time.perf_counter(), 0.0])
+
+    def _exit(self, name):
+        start, inner = self._open.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - inner
+        if self._open:
+            self._open[-1][1] += elapsed
+
+    def hold(self, name, *values):
+        '''Record the arrays held under a name, replacing what was held under it before, and update peak_bytes.'''
+        self._held[name] = array_nbytes(*values)
+        self.peak_bytes = max(self.peak_bytes, sum(self._held.values()))
+
+    def listen(self, stage):
+        '''Count the change notices of the stage until stop_listening.'''
+        from pxr import Usd, Tf
+        self.stop_listening()
+        self._listener = Tf.Notice.Register(Usd.Notice.ObjectsChanged, self._on_objects_changed, stage)
+
+    def stop_listening(self):
+        if self._listener is not None:
+            self._listener.Revoke()
+            self._listener = None
+
+    def _on_objects_changed(self, notice, sender):
+        self.notices += 1
+
+    def as_dict(self):
+        '''Plain values of every counter and stage, e.g. to log runs while tuning Subsamples and modes.'''
+        return {'seconds': dict(self.seconds), 'total_seconds': self.total_seconds, 'samples': self.samples,
+                'copies': self.copies, 'frames': self.frames, 'notices': self.notices,
+                'peak_bytes': self.peak_bytes}
+
+    def summary(self):
+        '''A few lines of text for the window or the console.'''
+        stages = ', '.join(f"{name} {seconds * 1000:.1f}" for name, seconds in self.seconds.items() if seconds)
+        copies = f"{self.copies} copies" + (f" x {self.frames} frames" if self.frames else "")
+        return (f"{self.total_seconds * 1000:.1f} ms: {stages or 'nothing run'}\n"
+                f"{copies}, {self.samples} samples, {self.notices} notices, "
+                f"{self.peak_bytes / (1024 * 1024):.1f} MB peak")
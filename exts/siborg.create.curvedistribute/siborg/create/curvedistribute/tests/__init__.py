@@ -1 +1,6 @@
-from .test_hello_world import *
\ No newline at end of file
+from .test_hello_world import *
+from .test_curves import *
+from .test_authoring_benchmark import *
+from .test_distribute_job import *
+from .test_batch import *
+from .test_live import *
@@ -0,0 +1,48 @@
+import numpy as np
+import omni.kit.test
+from pxr import Usd, UsdGeom, Tf
+
+from siborg.create.curvedistribute.core import CurveManager
+
+
+class TestAuthoringBenchmark(omni.kit.test.AsyncTestCase):
+    '''Prim-by-prim authoring of copy_to_points against the batched Sdf.ChangeBlock path.
+
+    Only a small count runs here, the scaling and its timings are tracked headless in
+    benchmarks/test_authoring.py.
+    '''
+    NUM_COPIES = 200
+
+    def _make_stage(self):
+        stage = Usd.Stage.CreateInMemory()
+        UsdGeom.Xform.Define(stage, '/World')
+        UsdGeom.Xformable(UsdGeom.Cube.Define(stage, '/World/Cube')).AddTranslateOp()
+        UsdGeom.Xformable(UsdGeom.Sphere.Define(stage, '/World/Sphere')).AddTranslateOp()
+        return stage
+
+    def _run(self, num_copies, make_instance, batched):
+        '''Returns (ObjectsChanged notices, copies on the stage) for one distribution.'''
+        stage = self._make_stage()
+        target_points = np.random.default_rng(0).random((num_copies, 3)) * 100
+        target_dirs = np.tile([1.0, 0.0, 0.0], (num_copies, 1))
+
+        notices = []
+        listener = Tf.Notice.Register(Usd.Notice.ObjectsChanged, lambda notice, sender: notices.append(notice), stage)
+        CurveManager.copy_to_points(stage, target_points, target_dirs, ['/World/Cube', '/World/Sphere'],
+                                    [1, 0, 0], make_instance=make_instance, batched=batched)
+        listener.Revoke()
+
+        copies = {p.GetName(): p.GetAttribute('xformOp:translate').Get()
+                  for p in stage.GetPrimAtPath('/World/Copies').GetChildren() if not p.GetName().endswith('_Source')}
+        return len(notices), copies
+
+    async def test_batched_authoring(self):
+        for make_instance in (False, True):
+            per_prim = self._run(self.NUM_COPIES, make_instance, batched=False)
+            batched = self._run(self.NUM_COPIES, make_instance, batched=True)
+
+            # Same copies in the same places, with a constant number of notices instead of one per edit
+            self.assertEqual(len(batched[1]), self.NUM_COPIES)
+            self.assertEqual(batched[1], per_prim[1])
+            self.assertLess(batched[0], 32)
+            self.assertGreaterEqual(per_prim[0], self.NUM_COPIES)
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import omni.kit.test
+from pxr import Sdf, Usd, UsdGeom, Vt
+
+from siborg.create.curvedistribute import batch
+
+
+class TestBatch(omni.kit.test.AsyncTestCase):
+    '''Manifest jobs run headless, their copies end up in sublayer files of the USD files.'''
+    async def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = self._folder.name
+        for name in ('street', 'park'):
+            stage = Usd.Stage.CreateNew(os.path.join(self.folder, f'{name}.usda'))
+            UsdGeom.Xform.Define(stage, '/World')
+            UsdGeom.Cube.Define(stage, '/World/Cube')
+            curve = UsdGeom.BasisCurves.Define(stage, '/World/BasisCurves')
+            points = np.column_stack((np.linspace(0, 10, 7), np.sin(np.linspace(0, 3, 7)), np.zeros(7)))
+            curve.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(points.astype(np.float32)))
+            stage.Save()
+        self.manifest = os.path.join(self.folder, 'manifest.json')
+        with open(self.manifest, 'w') as f:
+            json.dump({'defaults': {'count': 20, 'use_orient': True, 'curve_type': 'Bspline'},
+                       'jobs': [{'file': 'street.usda', 'curves': '/World/BasisCurves', 'sources': ['/World/Cube'],
+                                 'scope_path': '/World/Cubes'},
+                                {'file': 'street.usda', 'curves': '/World/BasisCurves', 'sources': ['/World/Cube'],
+                                 'scope_path': '/World/Lamps', 'point_instancer': True},
+                                {'file': 'park.usda', 'curves': '/World/Missing', 'sources': ['/World/Cube']}]}, f)
+
+    async def tearDown(self):
+        self._folder.cleanup()
+
+    async def test_run_manifest(self):
+        report = batch.run_manifest(self.manifest, workers=1)
+        self.assertEqual([entry['status'] for entry in report], ['ok', 'ok', 'failed'])
+        self.assertEqual(report[0]['stats']['copies'], 20)
+
+        street = Sdf.Layer.FindOrOpen(os.path.join(self.folder, 'street.usda'))
+        street.Reload()
+        self.assertEqual(list(street.subLayerPaths), ['./street_Lamps.usdc', './street_Cubes.usdc'])
+        stage = Usd.Stage.Open(street)
+        self.assertEqual(len(stage.GetPrimAtPath('/World/Cubes').GetChildren()), 20)
+        self.assertTrue(stage.GetPrimAtPath('/World/Lamps/Instancer').IsValid())
+        # A failing job leaves its file alone
+        park = Sdf.Layer.FindOrOpen(os.path.join(self.folder, 'park.usda'))
+        self.assertEqual(list(park.subLayerPaths), [])
+
+        # Running again gives the same files
+        with open(os.path.join(self.folder, 'street_Cubes.usdc'), 'rb') as f:
+            first = f.read()
+        batch.run_manifest(self.manifest, workers=1)
+        with open(os.path.join(self.folder, 'street_Cubes.usdc'), 'rb') as f:
+            self.assertEqual(f.read(), first)
@@ -0,0 +1,210 @@
+import numpy as np
+import omni.kit.test
+from pxr import Usd, UsdGeom, Vt
+
+from siborg.create.curvedistribute import utils
+from siborg.create.curvedistribute.core import CurveManager
+
+
+def random_walk(num_points, seed=0):
+    '''A wiggly but smooth enough path of control points, spaced about one unit apart.'''
+    steps = np.random.default_rng(seed).normal(size=(num_points, 3)) + [1.0, 0.0, 0.0]
+    return np.cumsum(steps, axis=0)
+
+
+class TestCurves(omni.kit.test.AsyncTestCase):
+    '''Evaluation, sampling and placement of copies along curves.'''
+    def _stage(self, control_points, curve_path='/World/Curve'):
+        '''An in-memory stage holding one BasisCurves prim with the given points.'''
+        stage = Usd.Stage.CreateInMemory()
+        UsdGeom.Xform.Define(stage, '/World')
+        curve = UsdGeom.BasisCurves.Define(stage, curve_path)
+        curve.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(np.asarray(control_points, dtype=np.float32)))
+        return stage
+
+    async def tearDown(self):
+        CurveManager.clear_caches()
+
+    async def test_batched_bezier(self):
+        # All segments at once give the points of the cubic formula one segment at a time, the
+        # endpoint two segments share is kept once
+        control_points = random_walk(10)
+        t = np.linspace(0, 1, 11)
+        points = CurveManager.create_bezier(control_points, len(t))
+        self.assertEqual(len(points), 1 + 3 * 10)
+        for s in range(3):
+            expected = CurveManager.cubic_bezier(*control_points[3 * s:3 * s + 4], t[:, None])
+            np.testing.assert_allclose(points[10 * s:10 * s + 11], expected, atol=1e-9)
+
+    async def test_arc_length_spacing(self):
+        # Handles bunched at one end make u uneven along the curve, the copies still land evenly by length
+        control_points = [[0, 0, 0], [0.25, 0, 0], [0.5, 1, 0], [10, 3, 0]]
+        stage = self._stage(control_points)
+        u = CurveManager.interpcurve(stage, '/World/Curve', 20, sampling_resolution=1000,
+                                     curve_type=utils.CURVE.Bezier, return_u=True)[2]
+
+        # Arc length at u measured on a much denser polyline than the one interpcurve uses
+        dense_u = np.linspace(0, 1, 100_001)
+        dense_lengths = CurveManager.arc_length_table(CurveManager.eval_bezier(control_points, dense_u))
+        spacing = np.diff(np.interp(u, dense_u, dense_lengths))
+        self.assertGreater(np.ptp(np.diff(u)), 0.01)
+        np.testing.assert_allclose(spacing, dense_lengths[-1] / 19, rtol=1e-3)
+
+    async def test_adaptive_tolerance(self):
+        # Between two samples the curve never strays further than the tolerance from their chord,
+        # a tighter tolerance takes more samples
+        control_points = random_walk(30)
+        t = np.linspace(0, 1, 9)[1:-1]
+        num_samples = []
+        for tolerance in (0.1, 0.01, 0.001):
+            samples = CurveManager.adaptive_samples(control_points, tolerance, utils.CURVE.Bspline)
+            u, points = samples[0], samples[-1]
+            between = CurveManager.evaluate(control_points, (u[:-1, None] + np.diff(u)[:, None] * t).ravel(),
+                                            utils.CURVE.Bspline)
+            start = np.repeat(points[:-1], len(t), axis=0)
+            chord = np.repeat(np.diff(points, axis=0), len(t), axis=0)
+            along = np.clip(np.sum((between - start) * chord, axis=1) / np.sum(chord * chord, axis=1), 0, 1)
+            error = np.linalg.norm(between - start - along[:, None] * chord, axis=1)
+            self.assertLessEqual(error.max(), tolerance)
+            num_samples.append(len(u))
+        self.assertTrue(num_samples[0] < num_samples[1] < num_samples[2])
+
+    async def test_instancer_matches_copies(self):
+        # The PointInstancer arrays hold the same placement the duplicate path gives every copy
+        stage = self._stage([[0, 0, 0], [3, 4, 0], [6, -4, 2], [10, 0, 0]])
+        for source in (UsdGeom.Cube.Define(stage, '/World/Cube'), UsdGeom.Sphere.Define(stage, '/World/Sphere')):
+            UsdGeom.Xformable(source).AddTranslateOp()
+            UsdGeom.Xformable(source).AddOrientOp()
+        sources = ['/World/Cube', '/World/Sphere']
+        points, dirs = CurveManager.interpcurve(stage, '/World/Curve', 7, sampling_resolution=100,
+                                                curve_type=utils.CURVE.Bezier)
+        settings = dict(use_orient=True, follow_curve=True, up_vector=(0, 0, 1))
+        CurveManager.copy_to_points(stage, points, dirs, sources, [1, 0, 0], **settings)
+        instancer = CurveManager.copy_to_points(stage, points, dirs, sources, [1, 0, 0], point_instancer=True,
+                                                **settings)
+
+        proto_indices = list(instancer.GetProtoIndicesAttr().Get())
+        self.assertEqual(proto_indices, [0, 1, 0, 1, 0, 1, 0])
+        names = ['Cube', 'Sphere']
+        copies = [stage.GetPrimAtPath(f'/World/Copies/{names[k]}_{i}') for i, k in enumerate(proto_indices)]
+        np.testing.assert_allclose(np.array(instancer.GetPositionsAttr().Get()),
+                                   [c.GetAttribute('xformOp:translate').Get() for c in copies], atol=1e-5)
+        orientations = [(q.GetReal(), *q.GetImaginary()) for q in instancer.GetOrientationsAttr().Get()]
+        orients = [c.GetAttribute('xformOp:orient').Get() for c in copies]
+        np.testing.assert_allclose(orientations, [(q.GetReal(), *q.GetImaginary()) for q in orients], atol=1e-3)
+
+    async def test_rotation_minimizing_frames(self):
+        # Along three turns of a helix the transported normal never turns about the tangent, unlike the
+        # Frenet normal which twists by the torsion (about 8.4 radians here)
+        s = np.linspace(0, 6 * np.pi, 2000)
+        tangents = CurveManager.normalize(np.column_stack((-np.sin(s), np.cos(s), np.full(len(s), 0.5))))
+        normals = CurveManager.rotation_minimizing_normals(tangents, up_vector=[0, 0, 1])
+        np.testing.assert_allclose(np.linalg.norm(normals, axis=1), 1)
+        np.testing.assert_allclose(np.sum(normals * tangents, axis=1), 0, atol=1e-9)
+        twist = np.sum(normals[1:] * np.cross(tangents, normals)[:-1], axis=1)
+        self.assertLess(np.abs(twist).max(), 1e-4)
+        self.assertLess(abs(twist.sum()), 0.01)
+        # The first normal is the up vector made perpendicular to the first tangent
+        np.testing.assert_allclose(normals[0], np.array([0, -0.5, 1]) / 1.25**0.5, atol=1e-9)
+
+    async def test_frames_reversing_tangent(self):
+        # A tangent turning right around has no unique rotation axis, the frames stay valid and keep up
+        tangents = np.array([[1, 0, 0], [-1, 0, 0], [1, 0, 0], [0, 1, 0], [0, -1, 0]], dtype=float)
+        normals = CurveManager.rotation_minimizing_normals(tangents, up_vector=[0, 0, 1])
+        np.testing.assert_allclose(normals, np.tile([0, 0, 1], (5, 1)), atol=1e-9)
+        quats = CurveManager.orientations(tangents, [1, 0, 0], follow_curve=True, up_vector=[0, 0, 1])
+        self.assertTrue(np.isfinite(quats).all())
+        np.testing.assert_allclose(np.linalg.norm(quats, axis=1), 1)
+        np.testing.assert_allclose(CurveManager.quat_rotate(quats, np.tile([1, 0, 0], (5, 1))), tangents, atol=1e-9)
+        # The object up (+Y for a +X forward axis) follows the normal, here the up vector
+        np.testing.assert_allclose(CurveManager.quat_rotate(quats, np.tile([0, 1, 0], (5, 1))), normals, atol=1e-9)
+
+    async def test_closed_form_tangents(self):
+        # The derivative tangents and curvature agree with central differences of the curve
+        control_points = random_walk(28)
+        u = np.linspace(1e-3, 1 - 1e-3, 200)
+        step = 1e-6
+        for curve_type in (utils.CURVE.Bezier, utils.CURVE.Bspline):
+            ahead = CurveManager.evaluate(control_points, u + step, curve_type)
+            behind = CurveManager.evaluate(control_points, u - step, curve_type)
+            tangents, kappa = CurveManager.tangents(control_points, u, curve_type, curvature=True)
+            np.testing.assert_allclose(tangents, CurveManager.normalize(ahead - behind), atol=1e-6)
+            # Curvature is how fast the tangent turns per unit of length
+            turn = np.linalg.norm(CurveManager.tangents(control_points, u + step, curve_type)
+                                  - CurveManager.tangents(control_points, u - step, curve_type), axis=1)
+            speed = np.linalg.norm(CurveManager.derivative(control_points, u, curve_type), axis=1)
+            np.testing.assert_allclose(kappa, turn / (2 * step * speed), rtol=1e-3, atol=1e-6)
+
+    async def test_coincident_control_points(self):
+        # Handles on their end points stall the derivative there, the tangent is its limit instead of
+        # NaN, also at the end of the curve
+        stage = self._stage([[0, 0, 0], [0, 0, 0], [10, 5, 0], [10, 5, 0]])
+        _, dirs = CurveManager.interpcurve(stage, '/World/Curve', 5, curve_type=utils.CURVE.Bezier)
+        np.testing.assert_allclose(dirs, np.tile(np.array([2, 1, 0]) / 5**0.5, (5, 1)), atol=1e-9)
+
+    async def test_curve_cache(self):
+        # Repeat distributes reuse the sampled curve until the curve prim itself changes
+        stage = self._stage(np.column_stack((np.linspace(0, 10, 4), np.zeros(4), np.zeros(4))))
+        samples = CurveManager.curve_data(stage, '/World/Curve', utils.CURVE.Bezier)
+        curve_cache = CurveManager.get_cache(stage)
+        self.assertIs(CurveManager.curve_data(stage, '/World/Curve', utils.CURVE.Bezier), samples)
+        self.assertEqual(len(curve_cache), 1)
+        CurveManager.curve_data(stage, '/World/Curve', utils.CURVE.Bezier, tolerance=0.001)
+        self.assertEqual(len(curve_cache), 2)
+
+        UsdGeom.Cube.Define(stage, '/World/Cube').GetSizeAttr().Set(4)
+        self.assertEqual(len(curve_cache), 2)
+        self.assertIs(CurveManager.curve_data(stage, '/World/Curve', utils.CURVE.Bezier), samples)
+
+        curve = UsdGeom.BasisCurves.Get(stage, '/World/Curve')
+        curve.GetPointsAttr().Set([(0, 0, 0), (0, 5, 0), (10, 5, 0), (10, 0, 0)])
+        self.assertEqual(len(curve_cache), 0)
+        moved = CurveManager.curve_data(stage, '/World/Curve', utils.CURVE.Bezier)
+        self.assertIsNot(moved, samples)
+        self.assertAlmostEqual(moved['fine_points'][:, 1].max(), 3.75, places=3)
+
+    async def test_batched_bezier_curves(self):
+        # All segments of several curves at once give the points of the cubic formula one segment at a time
+        counts = np.array([4, 7, 10])
+        control_points = random_walk(counts.sum())
+        segments, seg_offsets = CurveManager.bezier_segments_batch(control_points, counts)
+        t = np.linspace(0, 1, 11)
+        starts = CurveManager.curve_offsets(counts)
+        for c in range(len(counts)):
+            num_segments = seg_offsets[c + 1] - seg_offsets[c]
+            for s in range(num_segments):
+                first = starts[c] + 3 * s
+                expected = CurveManager.cubic_bezier(*control_points[first:first + 4], t[:, None])
+                points = CurveManager.eval_bezier_segments(segments, (s + t) / num_segments, 0, seg_offsets,
+                                                           np.full(len(t), c))
+                np.testing.assert_allclose(points, expected, atol=1e-9)
+
+    async def test_multi_curve_prim(self):
+        # Every run of curveVertexCounts is its own curve, with several prims in one request
+        stage = self._stage(np.column_stack((np.linspace(0, 6, 4), np.zeros(4), np.zeros(4))))
+        cables = UsdGeom.BasisCurves.Define(stage, '/World/Cables')
+        points = np.column_stack((np.tile(np.linspace(0, 6, 4), 2), np.repeat([5, 10], 4), np.zeros(8)))
+        cables.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(points.astype(np.float32)))
+        cables.GetCurveVertexCountsAttr().Set([4, 4])
+        curve_paths = '/World/Curve, /World/Cables'
+        samples = CurveManager.curve_data(stage, curve_paths, utils.CURVE.Bezier)
+        self.assertEqual(list(samples['counts']), [4, 4, 4])
+        points, _, _, curve_idx = CurveManager.interpcurve(stage, curve_paths, 3, curve_type=utils.CURVE.Bezier,
+                                                           return_u=True, per_curve=True)
+        np.testing.assert_allclose(points[:, 1], [0, 0, 0, 5, 5, 5, 10, 10, 10], atol=1e-6)
+        self.assertEqual(list(curve_idx), [0, 0, 0, 1, 1, 1, 2, 2, 2])
+
+        # Spread over all curves or one run per curve, the copies add up to what was asked for
+        curve_idx = CurveManager.interpcurve(stage, curve_paths, 25, curve_type=utils.CURVE.Bezier, return_u=True)[3]
+        self.assertEqual(len(curve_idx), 25)
+        self.assertTrue(np.all(np.bincount(curve_idx, minlength=3) > 0))
+        curve_idx = CurveManager.interpcurve(stage, curve_paths, 25, curve_type=utils.CURVE.Bezier, return_u=True,
+                                             per_curve=True)[3]
+        self.assertEqual(list(np.bincount(curve_idx)), [25, 25, 25])
+
+        # A change elsewhere keeps the cached curves, one on either prim drops them
+        UsdGeom.Cube.Define(stage, '/World/Cube')
+        self.assertIs(CurveManager.curve_data(stage, curve_paths, utils.CURVE.Bezier), samples)
+        cables.GetCurveVertexCountsAttr().Set([8])
+        self.assertEqual(len(CurveManager.get_cache(stage)), 0)
+        self.assertEqual(list(CurveManager.curve_data(stage, curve_paths, utils.CURVE.Bspline)['counts']), [4, 8])
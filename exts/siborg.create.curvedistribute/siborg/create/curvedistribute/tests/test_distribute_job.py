@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+import numpy as np
+import omni.kit.test
+from pxr import Usd, UsdGeom, Vt
+
+from siborg.create.curvedistribute.core import CurveManager
+from siborg.create.curvedistribute.job import DistributeJob
+
+
+class TestDistributeJob(omni.kit.test.AsyncTestCase):
+    '''The async Distribute path authors over several frames and rolls back when cancelled.'''
+    async def setUp(self):
+        self.stage = Usd.Stage.CreateInMemory()
+        UsdGeom.Xform.Define(self.stage, '/World')
+        UsdGeom.Xformable(UsdGeom.Cube.Define(self.stage, '/World/Cube')).AddTranslateOp()
+        curve = UsdGeom.BasisCurves.Define(self.stage, '/World/BasisCurves')
+        points = np.column_stack((np.linspace(0, 10, 7), np.sin(np.linspace(0, 3, 7)), np.zeros(7)))
+        curve.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(points.astype(np.float32)))
+
+    async def tearDown(self):
+        CurveManager.clear_caches()
+        self.stage = None
+
+    def _job(self, count, **kwargs):
+        return DistributeJob(self.stage, '/World/BasisCurves', ['/World/Cube'], count, use_orient=True,
+                             chunk_size=64, **kwargs)
+
+    async def test_progress(self):
+        progress = []
+        added, _, _ = await self._job(500, progress_fn=progress.append).run()
+        self.assertEqual(added, 500)
+        # One update per chunk, ending at 1
+        self.assertGreater(len(progress), 500 // 64)
+        self.assertEqual(progress[-1], 1.0)
+
+    async def test_cancel_rolls_back(self):
+        for point_instancer in (False, True):
+            await self._job(50, point_instancer=point_instancer).run()
+            before = self.stage.GetRootLayer().ExportToString()
+
+            job = self._job(1000, point_instancer=point_instancer)
+            job.progress_fn = lambda fraction: fraction > 0.25 and job.cancel()
+            self.assertIsNone(await job.run())
+            self.assertEqual(self.stage.GetRootLayer().ExportToString(), before)
+
+    async def test_animated_frames(self):
+        # The curve rises one unit per frame, the instancer follows it with a time sample per frame
+        points = np.array(self.stage.GetPrimAtPath('/World/BasisCurves').GetAttribute('points').Get())
+        points_attr = self.stage.GetPrimAtPath('/World/BasisCurves').GetAttribute('points')
+        for frame in range(10):
+            points_attr.Set(Vt.Vec3fArray.FromNumpy((points + [0, frame, 0]).astype(np.float32)), frame)
+
+        instancer = await self._job(20, point_instancer=True, frames=range(10)).run()
+        positions = instancer.GetPositionsAttr()
+        self.assertEqual(positions.GetNumTimeSamples(), 10)
+        resting = np.array(positions.Get(0))
+        for frame in (3, 9):
+            np.testing.assert_allclose(np.array(positions.Get(frame)), resting + [0, frame, 0], atol=1e-4)
+
+    async def test_stats(self):
+        job = self._job(500, point_instancer=True)
+        await job.run()
+        stats = job.stats
+        self.assertEqual(stats.copies, 500)
+        self.assertGreater(stats.samples, 0)
+        self.assertGreater(stats.notices, 0)
+        self.assertGreaterEqual(stats.peak_bytes, 500 * (12 + 4 + 8))
+        for name in ('read', 'sample', 'place', 'orient', 'author'):
+            self.assertGreater(stats.seconds[name], 0, name)
+        # The curves come from the cache the second time, nothing is sampled
+        job = self._job(500, point_instancer=True)
+        await job.run()
+        self.assertEqual(job.stats.samples, 0)
+
+    async def test_layer_file(self):
+        # The copies go to their own crate file, the root layer only gains the sublayer
+        with tempfile.TemporaryDirectory() as folder:
+            layer_file = os.path.join(folder, 'copies.usdc')
+            job = self._job(200, layer_file=layer_file, scope_path='/World/Path')
+            added, _, _ = await job.run()
+            self.assertEqual(added, 200)
+            # One recomposition when the layer was attached
+            self.assertEqual(job.stats.notices, 1)
+            root_layer = self.stage.GetRootLayer()
+            self.assertIsNone(root_layer.GetPrimAtPath('/World/Path'))
+            self.assertEqual(len(self.stage.GetPrimAtPath('/World/Path').GetChildren()), 200)
+            with open(layer_file, 'rb') as f:
+                self.assertEqual(f.read(8), b'PXR-USDC')
+
+            # Again as a payload with fewer copies, the sublayer makes way for the payload arc
+            await self._job(50, layer_file=layer_file, scope_path='/World/Path', as_payload=True).run()
+            self.assertEqual(list(root_layer.subLayerPaths), [])
+            self.assertEqual(len(self.stage.GetPrimAtPath('/World/Path').GetChildren()), 50)
+            self.stage.Unload('/World/Path')
+            self.assertEqual(len(self.stage.GetPrimAtPath('/World/Path').GetChildren()), 0)
+            # Release the layer file before its folder is removed
+            self.stage = None
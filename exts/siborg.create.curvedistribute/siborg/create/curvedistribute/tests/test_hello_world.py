@@ -1,46 +1,157 @@
 # NOTE:
 #   omni.kit.test - std python's unittest module with additional wrapping to add suport for async/await tests
 #   For most things refer to unittest docs: https://docs.python.org/3/library/unittest.html
+import numpy as np
 import omni.kit.test
 
 # Extnsion for writing UI tests (simulate UI interaction)
 import omni.kit.ui_test as ui_test
+from pxr import Usd, UsdGeom, Vt
 
 # Import extension python module we are testing with absolute import path, as if we are external user (other extension)
-import siborg.create.curvedistribute
+from siborg.create.curvedistribute import utils
+from siborg.create.curvedistribute.core import CurveManager
+from siborg.create.curvedistribute.extension import get_instance
 
 
 # Having a test class dervived from omni.kit.test.AsyncTestCase declared on the root of module will make it auto-discoverable by omni.kit.test
 class Test(omni.kit.test.AsyncTestCase):
     # Before running each test
     async def setUp(self):
-        pass
+        self.stage = Usd.Stage.CreateInMemory()
+        UsdGeom.Xform.Define(self.stage, '/World')
+        curve = UsdGeom.BasisCurves.Define(self.stage, '/World/BasisCurves')
+        # A straight Bezier of length 10 along X
+        points = np.column_stack((np.linspace(0, 10, 4), np.zeros(4), np.zeros(4)))
+        curve.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(points.astype(np.float32)))
 
     # After running each test
     async def tearDown(self):
-        pass
+        CurveManager.clear_caches()
+        self.stage = None
 
-    # Actual test, notice it is "async" function, so "await" can be used if needed
-    async def test_hello_public_function(self):
-        result = siborg.create.curvedistribute.some_public_function(4)
-        self.assertEqual(result, 256)
+    async def test_interpcurve_spacing(self):
+        points, dirs = CurveManager.interpcurve(self.stage, '/World/BasisCurves', 5, curve_type=utils.CURVE.Bezier)
+        np.testing.assert_allclose(points[:, 0], [0, 2.5, 5, 7.5, 10], atol=1e-6)
+        np.testing.assert_allclose(dirs, np.tile([1, 0, 0], (5, 1)), atol=1e-6)
 
+    async def test_periodic_prim_basis(self):
+        # A closed catmullRom ring passes through its points, 12 copies land on the 12 points without a seam copy
+        ring = UsdGeom.BasisCurves.Define(self.stage, '/World/Ring')
+        angles = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+        points = np.column_stack((np.cos(angles), np.sin(angles), np.zeros(12))) * 10
+        ring.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(points.astype(np.float32)))
+        ring.GetCurveVertexCountsAttr().Set([12])
+        ring.GetBasisAttr().Set(UsdGeom.Tokens.catmullRom)
+        ring.GetWrapAttr().Set(UsdGeom.Tokens.periodic)
 
-    async def test_window_button(self):
+        copies, _ = CurveManager.interpcurve(self.stage, '/World/Ring', 12, curve_type=utils.CURVE.Prim,
+                                             tolerance=1e-5)
+        # Segment 0 of a periodic catmullRom runs from the 2nd to the 3rd point
+        np.testing.assert_allclose(copies, np.roll(points, -1, axis=0), atol=1e-4)
+
+    async def test_nurbs_circle(self):
+        # An exact rational circle of radius 3, its closed loop gets 8 copies 45 degrees apart
+        circle = UsdGeom.NurbsCurves.Define(self.stage, '/World/Circle')
+        corners = np.array([[1, 0], [1, 1], [0, 1], [-1, 1], [-1, 0], [-1, -1], [0, -1], [1, -1], [1, 0]])
+        points = np.column_stack((corners * 3, np.zeros(9)))
+        circle.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(points.astype(np.float32)))
+        circle.GetCurveVertexCountsAttr().Set([9])
+        circle.GetOrderAttr().Set([3])
+        circle.GetKnotsAttr().Set([0, 0, 0, 0.25, 0.25, 0.5, 0.5, 0.75, 0.75, 1, 1, 1])
+        circle.GetPointWeightsAttr().Set(Vt.DoubleArray([1, 0.5**0.5] * 4 + [1]))
+
+        copies, _ = CurveManager.interpcurve(self.stage, '/World/Circle', 8, curve_type=utils.CURVE.Prim,
+                                             tolerance=1e-6)
+        angles = np.radians(np.arange(8) * 45)
+        np.testing.assert_allclose(copies, np.column_stack((np.cos(angles), np.sin(angles), np.zeros(8))) * 3,
+                                   atol=1e-4)
+
+    async def test_pack_by_footprint(self):
+        # Cubes of size 2 fill the straight curve of length 10 side by side
+        UsdGeom.Cube.Define(self.stage, '/World/Cube')
+        footprint = CurveManager.footprint(self.stage, ['/World/Cube'], [1, 0, 0])
+        self.assertAlmostEqual(footprint, 2)
+        samples = CurveManager.curve_data(self.stage, '/World/BasisCurves', utils.CURVE.Bezier)
+        points, _, _, _ = CurveManager.distribute(samples, 0, targets=CurveManager.packed_lengths(samples, footprint))
+        np.testing.assert_allclose(points[:, 0], [1, 3, 5, 7, 9], atol=1e-6)
+
+    async def test_seeded_variation(self):
+        # The same seed gives the same variation however the distribution is chunked
+        samples = CurveManager.curve_data(self.stage, '/World/BasisCurves', utils.CURVE.Bezier)
+        variation = {'seed': 5, 'weights': [1, 3], 'jitter_across': 0.5, 'scale_min': (0.5, 0.5, 0.5)}
+
+        def placement(chunk_size):
+            chunks = list(CurveManager.distribution_chunks(samples, 100, [1, 0, 0], num_prototypes=2,
+                                                           chunk_size=chunk_size, variation=variation))
+            return [np.concatenate([chunk[k] for chunk in chunks]) for k in (1, 3, 4)]
 
-        # Find a label in our window
-        label = ui_test.find("My Window//Frame/**/Label[*]")
+        for whole, chunked in zip(placement(100), placement(7)):
+            np.testing.assert_array_equal(whole, chunked)
+        positions, sources, scales = placement(100)
+        on_curve, _ = CurveManager.interpcurve(self.stage, '/World/BasisCurves', 100, curve_type=utils.CURVE.Bezier)
+        self.assertTrue((np.linalg.norm(positions - on_curve, axis=1) <= 0.5 + 1e-9).all())
+        self.assertTrue(((scales >= 0.5) & (scales <= 1)).all())
+        self.assertGreater(np.count_nonzero(sources == 1), np.count_nonzero(sources == 0))
 
-        # Find buttons in our window
-        add_button = ui_test.find("My Window//Frame/**/Button[*].text=='Add'")
-        reset_button = ui_test.find("My Window//Frame/**/Button[*].text=='Reset'")
+    async def test_project_points(self):
+        # Points off the straight curve land on their foot on it, or on the nearest end past it
+        queries = np.array([[2.5, 3, 0], [12, 0, 0], [-1, 1, 1]])
+        u, lengths, points, tangents, distances, curve_idx = CurveManager.project_points(
+            self.stage, '/World/BasisCurves', queries, curve_type=utils.CURVE.Bezier)
+        np.testing.assert_allclose(points, [[2.5, 0, 0], [10, 0, 0], [0, 0, 0]], atol=1e-9)
+        np.testing.assert_allclose(u, [0.25, 1, 0], atol=1e-9)
+        np.testing.assert_allclose(lengths, [2.5, 10, 0], atol=1e-9)
+        np.testing.assert_allclose(distances, [3, 2, 3 ** 0.5], atol=1e-9)
+        np.testing.assert_allclose(tangents, np.tile([1, 0, 0], (3, 1)), atol=1e-9)
+        self.assertEqual(list(curve_idx), [0, 0, 0])
 
-        # Click reset button
-        await reset_button.click()
-        self.assertEqual(label.widget.text, "empty")
+        UsdGeom.Xform.Define(self.stage, '/World/Empty')
+        with self.assertRaises(ValueError):
+            CurveManager.project_points(self.stage, '/World/Empty', queries, curve_type=utils.CURVE.Bezier)
 
-        await add_button.click()
-        self.assertEqual(label.widget.text, "count: 1")
+    async def test_vt_staging(self):
+        # Chunks go through one buffer, quaternions land with their real part where USD keeps it
+        staging = utils.VtStaging(Vt.QuathArray)
+        quats = staging.convert(np.tile([0.5, 0.5, -0.5, 0.5], (8, 1)))
+        self.assertEqual(len(quats), 8)
+        self.assertEqual(quats[3].GetReal(), 0.5)
+        self.assertEqual(tuple(quats[3].GetImaginary()), (0.5, -0.5, 0.5))
+        buffer = staging._buffer
+        self.assertEqual(len(staging.convert(np.tile([1.0, 0, 0, 0], (3, 1)))), 3)
+        self.assertIs(staging._buffer, buffer)
+
+        points = utils.VtStaging(Vt.Vec3fArray).convert(np.arange(6, dtype=np.float64).reshape(2, 3))
+        self.assertEqual(tuple(points[1]), (3, 4, 5))
+        indices = utils.VtStaging(Vt.IntArray).convert(np.array([2, 0, 1]))
+        self.assertEqual(list(indices), [2, 0, 1])
+
+    async def test_shared_geometry_copies(self):
+        # The mesh arrays live once on the template class prim, the copies reference it and keep their transforms
+        mesh = UsdGeom.Mesh.Define(self.stage, '/World/Mesh')
+        mesh.GetPointsAttr().Set([(0, 0, 0), (1, 0, 0), (0, 1, 0)])
+        targets = np.column_stack((np.arange(4), np.zeros(4), np.zeros(4))).astype(float)
+        CurveManager.copy_to_points(self.stage, targets, np.tile([1, 0, 0], (4, 1)), ['/World/Mesh'], [1, 0, 0],
+                                    batched=True, copy_mode=utils.COPY.SharedGeometry)
+
+        layer = self.stage.GetRootLayer()
+        self.assertIsNone(layer.GetAttributeAtPath('/World/Copies/Mesh_2.points'))
+        self.assertIsNotNone(layer.GetAttributeAtPath('/World/Copies/Mesh_Template.points'))
+        copy = self.stage.GetPrimAtPath('/World/Copies/Mesh_2')
+        self.assertEqual(list(copy.GetAttribute('points').Get()), list(mesh.GetPointsAttr().Get()))
+        self.assertEqual(tuple(copy.GetAttribute('xformOp:translate').Get()), (2, 0, 0))
+
+    async def test_window_button(self):
+        # The window is only built once it is opened, from the Window menu or here
+        get_instance().show_window()
+        await ui_test.human_delay()
+        distribute_button = ui_test.find("Distribute Along Curve//Frame/**/Button[*].text=='Distribute'")
+        self.assertIsNotNone(distribute_button)
 
-        await add_button.click()
-        self.assertEqual(label.widget.text, "count: 2")
+    async def test_source_weights_field(self):
+        # A Weights field that is not one number per source falls back to uniform weights
+        extension = get_instance()
+        for text, weights in (('3, 1', [3.0, 1.0]), ('', [1.0, 1.0]), ('a,2', [1.0, 1.0]), ('1;2', [1.0, 1.0]),
+                              ('1,2,3', [1.0, 1.0]), ('-1,2', [1.0, 1.0]), ('0,0', [1.0, 1.0])):
+            extension._weights = text
+            self.assertEqual(extension._source_weights(2), weights)
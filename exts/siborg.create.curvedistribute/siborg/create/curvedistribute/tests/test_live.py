@@ -0,0 +1,136 @@
+import asyncio
+import os
+import tempfile
+
+import numpy as np
+import omni.kit.test
+from pxr import Usd, UsdGeom, Vt
+
+from siborg.create.curvedistribute import utils
+from siborg.create.curvedistribute.core import CurveManager, GeomCreator
+from siborg.create.curvedistribute.job import DistributeJob
+from siborg.create.curvedistribute.live import LiveDistributor
+
+DELAY = 0.05
+
+
+class TestLive(omni.kit.test.AsyncTestCase):
+    '''Live mode redistributes once per burst of curve edits, never because of its own copies.'''
+    async def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.stage = Usd.Stage.CreateInMemory()
+        UsdGeom.Xform.Define(self.stage, '/World')
+        UsdGeom.Cube.Define(self.stage, '/World/Cube')
+        self.curve = UsdGeom.BasisCurves.Define(self.stage, '/World/BasisCurves')
+        self.points = np.column_stack((np.linspace(0, 10, 7), np.sin(np.linspace(0, 3, 7)), np.zeros(7)))
+        self.curve.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(self.points.astype(np.float32)))
+        self.runs = []
+        self.live = None
+
+    async def tearDown(self):
+        if self.live is not None:
+            self.live.stop()
+        CurveManager.clear_caches()
+        self.stage = None
+        self._folder.cleanup()
+
+    def _sync(self):
+        # Incremental redistribution of 10 cubes, as the window does in live mode
+        points, _ = CurveManager.interpcurve(self.stage, '/World/BasisCurves', 10)
+        self.runs.append(CurveManager.sync_copies(self.stage, '/World/Copies', points, ['/World/Cube']))
+
+    def _watch(self, distribute_fn):
+        self.live = LiveDistributor(distribute_fn, delay=DELAY)
+        self.live.watch(self.stage, ['/World/BasisCurves'])
+
+    async def _settle(self):
+        await asyncio.sleep(4 * DELAY)
+
+    def _move_point(self, offset):
+        self.points[3, 1] += offset
+        self.curve.GetPointsAttr().Set(Vt.Vec3fArray.FromNumpy(self.points.astype(np.float32)))
+
+    async def test_debounced_redistribution(self):
+        self._watch(self._sync)
+        await self._settle()
+        self.assertEqual(len(self.runs), 1)
+        # A drag is many edits in a row, they end in one redistribution after the delay
+        for _ in range(5):
+            self._move_point(0.1)
+        self.assertEqual(len(self.runs), 1)
+        await self._settle()
+        self.assertEqual(len(self.runs), 2)
+        added, moved, removed = self.runs[-1]
+        self.assertEqual((added, removed), (0, 0))
+        self.assertGreater(moved, 0)
+
+    async def test_own_copies_do_not_retrigger(self):
+        # Attaching the distribution layer resyncs the root, a path the live mode watches
+        layer_file = os.path.join(self._folder.name, 'copies.usdc')
+
+        def distribute():
+            self.runs.append(GeomCreator.distribute(self.stage, '/World/BasisCurves', ['/World/Cube'], 10,
+                                                    layer_file=layer_file))
+
+        self._watch(distribute)
+        for _ in range(3):
+            await self._settle()
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(len(self.stage.GetPrimAtPath('/World/Copies').GetChildren()), 10)
+
+    async def test_job_is_awaited(self):
+        # A job authors over several app updates, its notices are ignored until it finishes
+        layer_file = os.path.join(self._folder.name, 'copies.usdc')
+
+        def distribute():
+            job = DistributeJob(self.stage, '/World/BasisCurves', ['/World/Cube'], 10, chunk_size=2,
+                                layer_file=layer_file)
+            self.runs.append(job)
+            return asyncio.ensure_future(job.run())
+
+        self._watch(distribute)
+        for _ in range(3):
+            await self._settle()
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(len(self.stage.GetPrimAtPath('/World/Copies').GetChildren()), 10)
+        self.assertFalse(self.live._distributing)
+
+        self._move_point(0.5)
+        await self._settle()
+        self.assertEqual(len(self.runs), 2)
+
+    async def test_stop_revokes_listener(self):
+        self._watch(self._sync)
+        await self._settle()
+        self.live.stop()
+        self.assertFalse(self.live.active)
+        self._move_point(0.5)
+        self.live.request_update()
+        await self._settle()
+        self.assertEqual(len(self.runs), 1)
+
+    async def test_unchanged_curve_keeps_copies(self):
+        self._watch(self._sync)
+        await self._settle()
+        self.assertEqual(self.runs[0][0], 10)
+        # A settings edit with the same curve finds every copy in place
+        self.live.request_update()
+        await self._settle()
+        self.assertEqual(self.runs[-1], (0, 0, 0))
+
+    async def test_sources_share_scope(self):
+        # Two distributions into the default scope keep each other's copies, each only syncs its own
+        UsdGeom.Sphere.Define(self.stage, '/World/Sphere')
+        targets = np.column_stack((np.arange(4), np.zeros(4), np.zeros(4))).astype(float)
+        for src_path in ('/World/Cube', '/World/Sphere'):
+            added, _, removed = CurveManager.sync_copies(self.stage, '/World/Copies', targets, [src_path],
+                                                         copy_mode=utils.COPY.SharedGeometry)
+            self.assertEqual((added, removed), (4, 0))
+        self.assertEqual(CurveManager.sync_copies(self.stage, '/World/Copies', targets[:2], ['/World/Cube'],
+                                                  copy_mode=utils.COPY.SharedGeometry), (0, 0, 2))
+
+        names = {p.GetName() for p in self.stage.GetPrimAtPath('/World/Copies').GetAllChildren()}
+        self.assertEqual(names, {'Cube_0', 'Cube_1', 'Sphere_0', 'Sphere_1', 'Sphere_2', 'Sphere_3',
+                                 'Cube_Template', 'Sphere_Template'})
+        spec = self.stage.GetRootLayer().GetPrimAtPath('/World/Copies/Sphere_3')
+        self.assertEqual(spec.customData[utils.COPY_SOURCE_KEY], '/World/Sphere')
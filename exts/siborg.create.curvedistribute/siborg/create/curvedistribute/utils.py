@@ -1,12 +1,34 @@
-import omni.usd
-from typing import List
-from pxr import Sdf
 from enum import IntEnum
+from typing import List
+from pxr import Sdf, Vt
+import re
+import numpy as np
+
+try:
+    import omni.usd
+except ImportError:
+    # Headless, there is no selection
+    omni = None
+
+from .curvemath import CURVE, DEFAULT_TOLERANCE, default_up
 
-class CURVE(IntEnum):
-    Bezier = 0
-    Bspline = 1
-    Linear = 2
+# Prim name of a distributed copy, {source name}_{copy index}
+COPY_NAME = re.compile(r'.+_\d+$')
+# customData key of a copy recording the path of its source, a distribution only removes the
+# stale copies of its own sources from a scope shared with others
+COPY_SOURCE_KEY = 'curvedistribute:source'
+
+class COPY(IntEnum):
+    '''How copies that are not instances hold the data of their source (see core.CopyTemplate)'''
+    # Full copy of the source
+    Duplicate = 0
+    # Array attributes (points, normals, primvars) stored once and referenced, the rest copied
+    SharedGeometry = 1
+    # A reference to the source with local transforms only
+    Reference = 2
+
+# customData key of a copy prim spec recording the COPY mode it was made with, Instance for instances
+COPY_MODE_KEY = 'curvedistribute:copyMode'
 
 def get_selection() -> List[str]:
     """Get the list of currently selected prims"""
@@ -24,4 +46,54 @@ def index_to_axis(idx):
     
     axis_vecs = [xp,yp,zp,xn,yn,zn]
     
-    return axis_vecs[idx]
\ No newline at end of file
+    return axis_vecs[idx]
+
+# NumPy dtype and components of an item of the Vt arrays written from NumPy
+VT_LAYOUTS = {Vt.Vec3fArray: (np.float32, 3), Vt.Vec3dArray: (np.float64, 3), Vt.IntArray: (np.int32, 1),
+              Vt.QuathArray: (np.float16, 4), Vt.QuatfArray: (np.float32, 4), Vt.QuatdArray: (np.float64, 4)}
+
+_QUAT_ORDERS = {}
+
+def quat_order(array_type):
+    """Columns of (w, x, y, z) in the buffer of a Vt quaternion array"""
+    order = _QUAT_ORDERS.get(array_type)
+    if order is None:
+        # The real part is stored first or last depending on the USD build, probe it once
+        dtype = VT_LAYOUTS[array_type][0]
+        probe = array_type.FromNumpy(np.arange(4, dtype=dtype)[None])[0]
+        order = _QUAT_ORDERS[array_type] = [int(probe.GetReal())] + [int(v) for v in probe.GetImaginary()]
+    return order
+
+def to_quat_array(quats, array_type=Vt.QuatfArray):
+    """Convert (N, 4) quaternions in (w, x, y, z) order to a Vt quaternion array in one copy"""
+    data = np.empty((len(quats), 4), dtype=VT_LAYOUTS[array_type][0])
+    data[:, quat_order(array_type)] = quats
+    return array_type.FromNumpy(data)
+
+class VtStaging():
+    """Reusable buffer turning chunks of NumPy values into Vt arrays of one type
+
+    Values (float64 math, any int indices) are cast into the buffer in place, quaternions
+    reordered to the layout of the USD build, then copied once into the Vt array. Vt buffers
+    are read-only from NumPy, so that copy is the only one; the buffer grows to the largest
+    chunk and is reused by the next ones.
+    """
+    def __init__(self, array_type):
+        self.array_type = array_type
+        self.dtype, self.width = VT_LAYOUTS[array_type]
+        self._order = quat_order(array_type) if self.width == 4 else None
+        self._buffer = None
+
+    def convert(self, values):
+        """Vt array of the (N, width) values, or (N,) for scalar arrays"""
+        values = np.asarray(values)
+        if self._buffer is None or len(self._buffer) < len(values):
+            shape = (len(values), self.width) if self.width > 1 else (len(values),)
+            self._buffer = np.empty(shape, dtype=self.dtype)
+        data = self._buffer[:len(values)]
+        if self._order is not None:
+            for column, component in zip(self._order, values.T):
+                data[:, column] = component
+        else:
+            np.copyto(data, values, casting='unsafe')
+        return self.array_type.FromNumpy(data)